@@ -1,5 +1,17 @@
 from django.apps import AppConfig
+from django.core.signals import request_started
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save
 
 
 class AuctionConfig(AppConfig):
     name = 'auction'
+    
+    def ready(self):
+        from . import caching, database, scheduler, search
+        from .models import Auction
+        post_save.connect(search.auction_saved, sender = Auction)
+        post_save.connect(caching.auction_saved, sender = Auction)
+        post_save.connect(scheduler.auction_saved, sender = Auction)
+        connection_created.connect(database.configure_connection)
+        request_started.connect(database.check_connections)
@@ -0,0 +1,135 @@
+import asyncio
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.exceptions import DisallowedHost
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import close_old_connections, connections
+from django.http import JsonResponse
+from django.urls import Resolver404, resolve
+
+from . import metrics, push, routers, throttling
+from .views import auction_detail_data, auction_list_data
+
+
+# Asynchronous versions of the browse and auction detail APIs, served by the ASGI application next to the event
+# stream of push.py. A connection waiting for a slow client or for the database is a coroutine on the event loop
+# rather than a server thread, so one process keeps many browse clients open at once.
+#
+# The ORM only runs synchronously, so the database work of each request, admission control included, runs in a pool
+# of settings.ASYNC_API['DB_THREADS'] threads. The pool bounds the number of database connections of the process
+# however many clients are connected; requests queue for a thread instead. The currency rates are not fetched on the
+# request path in either version, see rates.get_rates.
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers = settings.ASYNC_API['DB_THREADS'])
+    return _executor
+
+
+# Django request for the given ASGI scope, for the parts of the site that read requests: query parameters, headers,
+# cookies and absolute URLs. Read endpoints have no body, so none is read.
+
+def make_request(scope):
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope.get('method', 'GET'),
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'REMOTE_ADDR': client[0],
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(),
+    }
+    for name, value in scope.get('headers', []):
+        key = name.decode('latin-1').upper().replace('-', '_')
+        if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            key = 'HTTP_' + key
+        value = value.decode('latin-1')
+        environ[key] = environ[key] + ',' + value if key in environ else value
+    request = WSGIRequest(environ)
+    request.user = AnonymousUser()
+    return request
+
+
+# Runs the database work of a request in a pool thread, with the request's reads routed and its queries counted as
+# by the middleware of the synchronous views. Returns the response, and whether the request was admitted.
+
+def run_blocking(request, record, function, *args):
+    for connection in connections.all():
+        metrics.instrument(connection)
+    metrics._local.record = record
+    routers._local.replica = routers.choose_replica(request)
+    try:
+        if settings.THROTTLE['ENABLED']:
+            response = throttling.admit(request, 'read')
+            if response is not None:
+                return response, False
+        status, payload = function(*args)
+        return JsonResponse(payload, status = status), True
+    finally:
+        routers._local.replica = None
+        metrics._local.record = None
+        close_old_connections()
+
+
+def in_pool(request, record, function, *args):
+    return asyncio.get_event_loop().run_in_executor(get_executor(), run_blocking, request, record, function, *args)
+
+
+async def auction_list(request, record):
+    return await in_pool(request, record, auction_list_data, request)
+
+
+async def auction_detail(request, record, pk):
+    return await in_pool(request, record, auction_detail_data, pk)
+
+
+ENDPOINTS = {
+    'auction:auction_list_api': auction_list,
+    'auction:auction_detail_api': auction_detail,
+}
+
+
+async def send_response(send, request, response):
+    await send({'type': 'http.response.start', 'status': response.status_code, 'headers': [
+        (name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in response.items()
+    ]})
+    await send({'type': 'http.response.body', 'body': response.content if request.method != 'HEAD' else b''})
+
+
+# ASGI application serving the read endpoints above and handing everything else to the event stream.
+
+async def application(scope, receive, send):
+    try:
+        match = resolve(scope['path']) if scope['type'] == 'http' else None
+    except Resolver404:
+        match = None
+    if match is None or match.view_name not in ENDPOINTS:
+        await push.application(scope, receive, send)
+        return
+    record = metrics.RequestRecord()
+    request = make_request(scope)
+    if request.method not in ('GET', 'HEAD'):
+        await push.respond(send, 405, 'Method not allowed')
+        return
+    try:
+        request.get_host()
+    except DisallowedHost:
+        await push.respond(send, 400, 'Invalid host')
+        return
+    response, admitted = await ENDPOINTS[match.view_name](request, record, *match.args, **match.kwargs)
+    record.elapsed = time.perf_counter() - record.start
+    metrics.collector.record(match.view_name, response.status_code, record)
+    if admitted:
+        throttling.latency.observe(record.elapsed)
+    await send_response(send, request, response)
@@ -0,0 +1,377 @@
+import asyncio
+import json
+import multiprocessing
+import random
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import close_old_connections, connection, connections, reset_queries
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import async_api, datagen, sequencer, tokens
+from .models import Auction, QueuedBid
+from .resolution import resolve_due_chunk
+
+
+# Load test of the hot paths. Workers replay a mix of operations against the WSGI application in-process through the
+# test client, so every request passes the URL resolver, middleware and views like a real one, and the queries of
+# each request are counted. Several workers run as separate processes sharing the database. The results are latency
+# percentiles, queries per request and throughput per operation, and can be saved as a baseline and compared with
+# later runs.
+
+DEFAULT_MIX = {'browse': 30, 'search': 20, 'detail': 35, 'bid': 10, 'burst': 4, 'resolve': 1}
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in DEFAULT_MIX:
+            raise ValueError('Unknown operation ' + name.strip())
+        mix[name.strip()] = int(weight)
+    return mix
+
+
+# Bidders with fresh API tokens, as pairs of username and key.
+
+def issue_keys(count, seed = 0):
+    users = list(User.objects.order_by('pk').values_list('pk', flat = True)[:10000])
+    chosen = random.Random(seed).sample(users, min(count, len(users)))
+    return [(user.username, tokens.issue_token(user, 'benchmark')[1]) for user in User.objects.filter(pk__in = chosen)]
+
+
+class Workload(object):
+
+    def __init__(self, keys, seed = 0, burst_size = 8):
+        self.client = Client()
+        self.random = random.Random(seed)
+        self.keys = keys
+        self.burst_size = burst_size
+        self.prices = dict(Auction.objects.filter(status = Auction.ACTIVE, deadline__gt = timezone.now()).order_by('?').values_list('pk', 'price')[:10000])
+        self.pks = list(self.prices)
+        self.words = datagen.ITEMS + datagen.ADJECTIVES
+
+    # Runs the operation and returns its samples as tuples of operation, seconds, queries and status code.
+
+    def run(self, name):
+        return getattr(self, name)()
+
+    # Each request clears the query log when it starts, so the log is cleared beforehand too, or the count would be
+    # taken from the wrong offset. Afterwards connections are closed unless persistent, as the request handler does,
+    # so that the cost of connecting shows; the test client leaves that out, and inside a test transaction it has to.
+
+    def measure(self, name, request):
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            status = request()
+            elapsed = time.perf_counter() - start
+        if not connection.in_atomic_block:
+            close_old_connections()
+        return [(name, elapsed, len(queries), status)]
+
+    def browse(self):
+        if self.random.random() < 0.5:
+            return self.measure('browse', lambda: self.client.get(reverse('index')).status_code)
+        sort = self.random.choice(['deadline', '-deadline', 'price', '-price'])
+        return self.measure('browse', lambda: self.client.get(reverse('auction:auction_list_api'), {'sort': sort}).status_code)
+
+    def search(self):
+        word = self.random.choice(self.words)[:self.random.randint(3, 6)]
+        return self.measure('search', lambda: self.client.get(reverse('auction:auction_list_api'), {'title': word}).status_code)
+
+    def detail(self):
+        pk = self.random.choice(self.pks)
+        if self.random.random() < 0.5:
+            return self.measure('detail', lambda: self.client.get(reverse('detail', kwargs = {'pk': pk})).status_code)
+        return self.measure('detail', lambda: self.client.get(reverse('auction:auction_detail_api', kwargs = {'pk': pk})).status_code)
+
+    def place(self, client, pk, username, key):
+        amount = self.prices[pk] + Decimal(self.random.randint(1, 500)) / 100
+        self.prices[pk] = amount
+        response = client.post(reverse('bid_api'), json.dumps({'auction_id': pk, 'bid': str(amount)}), content_type = 'application/json', HTTP_AUTHORIZATION = 'Token ' + key)
+        return response.status_code
+
+    def bid(self):
+        pk = self.random.choice(self.pks)
+        username, key = self.random.choice(self.keys)
+        return self.measure('bid', lambda: self.place(self.client, pk, username, key))
+
+    # Concurrent bids by several bidders on one auction, each in its own thread.
+
+    def burst(self):
+        pk = self.random.choice(self.pks)
+        samples = []
+        lock = threading.Lock()
+
+        def bidder(username, key):
+            client = Client()
+            try:
+                sample = self.measure('burst', lambda: self.place(client, pk, username, key))
+                with lock:
+                    samples.extend(sample)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target = bidder, args = self.random.choice(self.keys)) for i in range(self.burst_size)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return samples
+
+    def resolve(self):
+        return self.measure('resolve', lambda: resolve_due_chunk(timezone.now(), 100)[0])
+
+
+def run_worker(index, requests, mix, keys, seed):
+    workload = Workload(keys, seed + index)
+    names = [name for name in sorted(mix) for i in range(mix[name])]
+    samples = []
+    for i in range(requests):
+        samples.extend(workload.run(workload.random.choice(names)))
+    return samples
+
+
+# Runs the given number of operations spread over the workers. Returns the samples and the wall time.
+
+def run(requests, mix = None, workers = 1, keys = None, seed = 0):
+    mix = mix if mix is not None else DEFAULT_MIX
+    keys = keys if keys is not None else issue_keys(50, seed)
+    start = time.perf_counter()
+    if workers == 1:
+        samples = run_worker(0, requests, mix, keys, seed)
+    else:
+        # The workers are forked, so they must not inherit open database connections.
+        connections.close_all()
+        with multiprocessing.get_context('fork').Pool(workers) as pool:
+            results = pool.starmap(run_worker, [(i, requests // workers + (1 if i < requests % workers else 0), mix, keys, seed) for i in range(workers)])
+        samples = [sample for result in results for sample in result]
+    return samples, time.perf_counter() - start
+
+
+# Concurrency of the browse API under slow clients. Every connection asks for an auction and takes slow seconds to
+# read the response. On the WSGI path a connection holds one of the given number of server threads until it has read
+# the response, as in a threaded WSGI server; on the ASGI path it waits on the event loop, and only the database work
+# takes one of the threads of async_api.py. Returns, per path, the wall time, the connections open at once at the
+# peak, and the Python memory allocated per open connection, which leaves out the native stacks of the WSGI threads.
+
+def compare_servers(count, slow = 0.1, workers = 8, seed = 0):
+    pks = list(Auction.objects.filter(status = Auction.ACTIVE).values_list('pk', flat = True)[:10000])
+    if len(pks) == 0:
+        raise ValueError('No active auctions to browse')
+    chosen = random.Random(seed).choices(pks, k = count)
+    paths = [reverse('auction:auction_detail_api', kwargs = {'pk': pk}) for pk in chosen]
+    connections.close_all()
+    results = {'wsgi': measure_connections(serve_wsgi, paths, slow, workers), 'asgi': measure_connections(serve_asgi, paths, slow)}
+    connections.close_all()
+    return results
+
+
+class OpenConnections(object):
+
+    def __init__(self):
+        self.open = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def enter(self):
+        with self.lock:
+            self.open += 1
+            self.peak = max(self.peak, self.open)
+
+    def leave(self):
+        with self.lock:
+            self.open -= 1
+
+
+def measure_connections(serve, paths, *args):
+    tracker = OpenConnections()
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        statuses = serve(paths, tracker, *args)
+        elapsed = time.perf_counter() - start
+        memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        'seconds': elapsed,
+        'peak_connections': tracker.peak,
+        'kib_per_connection': memory / 1024 / max(tracker.peak, 1),
+        'errors': len([status for status in statuses if status != 200]),
+    }
+
+
+def serve_wsgi(paths, tracker, slow, workers):
+    local = threading.local()
+    def connection(path):
+        if not hasattr(local, 'client'):
+            local.client = Client()
+        tracker.enter()
+        try:
+            status = local.client.get(path).status_code
+            time.sleep(slow)
+            return status
+        finally:
+            close_old_connections()
+            tracker.leave()
+    with ThreadPoolExecutor(max_workers = workers) as executor:
+        return list(executor.map(connection, paths))
+
+
+def serve_asgi(paths, tracker, slow):
+    async def connection(path):
+        tracker.enter()
+        try:
+            responses = []
+            async def send(message):
+                responses.append(message)
+                if message['type'] == 'http.response.body':
+                    await asyncio.sleep(slow)
+            scope = {'type': 'http', 'method': 'GET', 'path': path, 'query_string': b'', 'headers': [(b'host', b'testserver')]}
+            await async_api.application(scope, asyncio.Queue().get, send)
+            return responses[0]['status']
+        finally:
+            tracker.leave()
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(asyncio.gather(*[connection(path) for path in paths]))
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+# Bidding at peak load on one auction, as when a popular auction closes. The given number of bids is posted by
+# concurrent bidders, each with a thread of its own, first with the bids placed in the request and then queued, with a
+# sequencer placing them as they arrive. Returns, per path, percentiles of the response latency in milliseconds, the
+# 95th percentile of the time until a bid was placed or rejected, the wall time and the number of responses by status.
+
+def compare_bid_paths(count, bidders = 8, seed = 0):
+    auction = Auction.objects.filter(status = Auction.ACTIVE, deadline__gt = timezone.now() + timedelta(minutes = 10)).order_by('pk').first()
+    if auction is None:
+        raise ValueError('No active auction to bid on')
+    keys = [key for username, key in issue_keys(bidders + 1, seed) if username != auction.seller][:bidders]
+    if len(keys) == 0:
+        raise ValueError('No users to bid with')
+    connections.close_all()
+    results = {}
+    for name in ['direct', 'queued']:
+        with override_settings(BID_QUEUE = dict(settings.BID_QUEUE, ENABLED = name == 'queued')):
+            results[name] = measure_bids(Auction.objects.get(pk = auction.pk), keys, count, name == 'queued')
+    connections.close_all()
+    return results
+
+
+def measure_bids(auction, keys, count, queued):
+    amounts = iter([auction.price + i + 1 for i in range(count)])
+    lock = threading.Lock()
+    local = threading.local()
+    last_queued = QueuedBid.objects.order_by('-id').values_list('id', flat = True).first() or 0
+    def post(key):
+        if not hasattr(local, 'client'):
+            local.client = Client()
+        with lock:
+            amount = next(amounts)
+        start = time.perf_counter()
+        try:
+            response = local.client.post(reverse('bid_api'), json.dumps({'auction_id': auction.pk, 'bid': str(amount)}), content_type = 'application/json', HTTP_AUTHORIZATION = 'Token ' + key)
+            return time.perf_counter() - start, response.status_code
+        finally:
+            close_old_connections()
+    runner = sequencer.Sequencer()
+    def sequence():
+        try:
+            runner.run(poll = 0.005)
+        finally:
+            connection.close()
+    thread = threading.Thread(target = sequence)
+    if queued:
+        thread.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers = len(keys)) as executor:
+        samples = list(executor.map(post, [keys[i % len(keys)] for i in range(count)]))
+    if queued:
+        while QueuedBid.objects.filter(id__gt = last_queued, status = QueuedBid.PENDING).exists():
+            time.sleep(0.005)
+    elapsed = time.perf_counter() - start
+    if queued:
+        runner.stop()
+        thread.join()
+        settled = sorted((processed - created).total_seconds() * 1000 for created, processed in QueuedBid.objects.filter(id__gt = last_queued).values_list('created', 'processed'))
+    else:
+        settled = sorted(seconds * 1000 for seconds, status in samples)
+    latencies = sorted(seconds * 1000 for seconds, status in samples)
+    statuses = {}
+    for seconds, status in samples:
+        statuses[status] = statuses.get(status, 0) + 1
+    return {
+        'p50': percentile(latencies, 0.50),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99),
+        'settled_p95': percentile(settled, 0.95),
+        'seconds': elapsed,
+        'statuses': statuses,
+    }
+
+
+# Description of the database setup the results were measured with.
+
+def describe_database():
+    description = connection.vendor + ', connections kept ' + str(connection.settings_dict['CONN_MAX_AGE']) + ' s'
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            description += ', journal mode ' + cursor.fetchone()[0]
+    return description
+
+
+def percentile(values, fraction):
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+# Latency percentiles in milliseconds, mean queries, errors and throughput per operation, and overall throughput.
+
+def summarize(samples, elapsed):
+    summary = {}
+    for name in sorted(set(sample[0] for sample in samples)):
+        own = [sample for sample in samples if sample[0] == name]
+        latencies = sorted(sample[1] * 1000 for sample in own)
+        summary[name] = {
+            'count': len(own),
+            'p50': percentile(latencies, 0.50),
+            'p95': percentile(latencies, 0.95),
+            'p99': percentile(latencies, 0.99),
+            'queries': sum(sample[2] for sample in own) / len(own),
+            'errors': len([sample for sample in own if isinstance(sample[3], int) and sample[3] >= 500]),
+            'throughput': len(own) / elapsed,
+        }
+    summary['total'] = {'count': len(samples), 'throughput': len(samples) / elapsed}
+    return summary
+
+
+# Operations that got slower or made more queries than in the baseline. Latency counts as a regression when the p95
+# grew by more than the tolerance and by at least a millisecond, so that noise in very fast operations is ignored.
+
+def compare(summary, baseline, tolerance = 0.2):
+    regressions = []
+    for name, result in sorted(summary.items()):
+        if name == 'total' or name not in baseline:
+            continue
+        base = baseline[name]
+        if result['p95'] > base['p95'] * (1 + tolerance) and result['p95'] - base['p95'] >= 1:
+            regressions.append(name + ': p95 ' + format(result['p95'], '.2f') + ' ms, was ' + format(base['p95'], '.2f') + ' ms')
+        if result['queries'] > base['queries'] + 0.05:
+            regressions.append(name + ': ' + format(result['queries'], '.2f') + ' queries per request, was ' + format(base['queries'], '.2f'))
+        if result['errors'] > base.get('errors', 0):
+            regressions.append(name + ': ' + str(result['errors']) + ' server errors, was ' + str(base.get('errors', 0)))
+    return regressions
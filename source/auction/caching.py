@@ -0,0 +1,71 @@
+import time
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+
+
+# Versions for cached pages. A cached page is keyed by the version of the data on it, and bumping the version makes
+# every page built from the old data unreachable. Versions start from the current time, so that they do not repeat
+# earlier values if the cache was cleared.
+#
+# A bump only reaches the processes sharing the cache. With the local memory cache, bumps made by other web server
+# processes and by commands such as resolve and runsequencer never reach the process serving a page, so pages are
+# only cached for settings.LOCAL_CACHE_TIMEOUT seconds then.
+
+LIST_VERSION_KEY = 'auction:list_version'
+
+
+def get_version(key):
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+    return version
+    
+    
+def bump_version(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.set(key, int(time.time() * 1000), None)
+        return cache.get(key)
+        
+        
+def cache_is_shared():
+    return not isinstance(caches['default'], LocMemCache)
+    
+    
+# Seconds to cache a page for, given the time wanted with a shared cache.
+
+def page_timeout(seconds):
+    return seconds if cache_is_shared() else min(seconds, settings.LOCAL_CACHE_TIMEOUT)
+    
+    
+# Version of the auction list on the home page. Bumped when auctions are created, banned or resolved.
+
+def list_version():
+    return get_version(LIST_VERSION_KEY)
+    
+    
+def bump_list_version():
+    return bump_version(LIST_VERSION_KEY)
+    
+    
+# Version of an auction's detail page. Bumped by bids, description edits, bans and resolution.
+
+def auction_version(pk):
+    return get_version('auction:version:' + str(pk))
+    
+    
+def bump_auction_version(pk):
+    return bump_version('auction:version:' + str(pk))
+    
+    
+def detail_key(pk, rates_fetched, language):
+    return 'auction:detail:' + str(pk) + ':' + str(auction_version(pk)) + ':' + str(rates_fetched) + ':' + str(language)
+    
+    
+def auction_saved(sender, instance, raw = False, **kwargs):
+    if not raw:
+        bump_list_version()
+        bump_auction_version(instance.pk)
@@ -0,0 +1,38 @@
+import logging
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+logger = logging.getLogger(__name__)
+
+
+# Setup of database connections. New SQLite connections get the pragmas in settings.SQLITE_PRAGMAS, such as WAL
+# journaling, which lets readers run alongside a writer, and a busy timeout, which makes a writer wait for the lock
+# rather than fail at once. With settings.DATABASE_HEALTH_CHECKS, persistent connections are checked when a request
+# starts, so a connection the server dropped while idle is replaced before the request uses it.
+
+def configure_connection(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    for name, value in settings.SQLITE_PRAGMAS.items():
+        connection.connection.execute('PRAGMA ' + name + ' = ' + str(value))
+
+
+def check_connections(**kwargs):
+    if not settings.DATABASE_HEALTH_CHECKS:
+        return
+    for connection in connections.all():
+        if connection.connection is not None and not connection.in_atomic_block and not connection.is_usable():
+            logger.warning('Replacing unusable connection to database %s', connection.alias)
+            connection.close()
+
+
+# Takes the write lock of an SQLite database at the start of a transaction, like BEGIN IMMEDIATE. SQLite cannot turn
+# a read into a write once another connection has committed, so a transaction reading before it writes would fail
+# with "database is locked" instead of waiting. Other databases lock rows as they go and need nothing.
+
+def lock_for_write(using = DEFAULT_DB_ALIAS):
+    connection = connections[using]
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute('UPDATE auction_auction SET id = id WHERE 0')
@@ -0,0 +1,137 @@
+import random
+from datetime import timedelta
+from decimal import Decimal
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from . import caching, search
+from .models import Auction, AuctionUser, Bid
+
+
+# Generation of realistic test data in bulk, for benchmarks and example databases. Rows are inserted with
+# bulk_create in batches, so a million auctions take minutes rather than hours. Every user gets the same password,
+# hashed once.
+
+ADJECTIVES = ['vintage', 'antique', 'rare', 'signed', 'mint', 'used', 'new', 'boxed', 'handmade', 'restored', 'classic', 'limited', 'original', 'large', 'small', 'wooden', 'silver', 'golden', 'leather', 'ceramic']
+ITEMS = ['camera', 'bicycle', 'watch', 'guitar', 'lamp', 'chair', 'vase', 'painting', 'record', 'book', 'jacket', 'clock', 'radio', 'telescope', 'typewriter', 'mirror', 'table', 'rug', 'poster', 'coin']
+WORDS = ['condition', 'working', 'shipping', 'included', 'collector', 'perfect', 'minor', 'scratches', 'tested', 'manual', 'accessories', 'collection', 'estate', 'found', 'attic', 'original', 'packaging', 'serial', 'number', 'year']
+
+BATCH_SIZE = 5000
+STATUS_MIX = {Auction.ACTIVE: 0.94, Auction.ADJUDICATED: 0.05, Auction.BANNED: 0.01}
+
+
+# Generator of users and auctions. Deadlines of active auctions are spread evenly over the next deadline_days days,
+# except for the overdue share, which ended within the last hour and waits to be resolved. The status mix gives the
+# share of each status. The same seed gives the same data.
+
+class DataGenerator(object):
+
+    def __init__(self, seed = 0, password = 'very_easy_password', batch_size = BATCH_SIZE, deadline_days = 30, status_mix = None, overdue = 0.01):
+        self.random = random.Random(seed)
+        self.password = make_password(password)
+        self.batch_size = batch_size
+        self.deadline_days = deadline_days
+        self.statuses = sorted((status_mix if status_mix is not None else STATUS_MIX).items())
+        self.overdue = overdue
+
+    # Creates users named <prefix><n> with an AuctionUser each, numbered on from the highest existing number, so that
+    # gaps and other names with the same prefix are no obstacle. Returns the users.
+
+    def users(self, count, prefix = 'user'):
+        names = User.objects.filter(username__startswith = prefix).values_list('username', flat = True)
+        first = max([int(name[len(prefix):]) for name in names if name[len(prefix):].isdigit()] + [0]) + 1
+        users = []
+        for start in range(first, first + count, self.batch_size):
+            names = [prefix + str(i) for i in range(start, min(start + self.batch_size, first + count))]
+            with transaction.atomic():
+                last_pk = User.objects.order_by('-pk').values_list('pk', flat = True).first() or 0
+                User.objects.bulk_create([User(username = name, email = name + '@example.com', password = self.password) for name in names])
+                created = list(User.objects.filter(pk__gt = last_pk).order_by('pk'))
+                AuctionUser.objects.bulk_create([AuctionUser(user = user) for user in created])
+            users.extend(created)
+        return users
+
+    def title(self):
+        return ' '.join([self.random.choice(ADJECTIVES), self.random.choice(ITEMS)] + self.random.sample(WORDS, 2)).capitalize()
+
+    def description(self):
+        return ' '.join(self.random.choice(WORDS + ITEMS + ADJECTIVES) for i in range(self.random.randint(10, 40))).capitalize() + '.'
+
+    # Creates auctions by the given users, with bid histories of on average bids_per_auction bids. Returns the number
+    # of auctions and bids created.
+
+    def auctions(self, count, users, bids_per_auction = 5):
+        now = timezone.now()
+        auctions_created = 0
+        bids_created = 0
+        while auctions_created < count:
+            size = min(self.batch_size, count - auctions_created)
+            with transaction.atomic():
+                histories = []
+                auctions = []
+                for i in range(size):
+                    auction, history = self.auction(now, users, bids_per_auction)
+                    auctions.append(auction)
+                    histories.append(history)
+                last_pk = Auction.objects.order_by('-pk').values_list('pk', flat = True).first() or 0
+                Auction.objects.bulk_create(auctions)
+                pks = list(Auction.objects.filter(pk__gt = last_pk).order_by('pk').values_list('pk', flat = True))
+                bids = []
+                bidders = []
+                for pk, history in zip(pks, histories):
+                    bids.extend(Bid(auction_id = pk, bidder = bidder, amount = amount, created = created) for bidder, amount, created in history)
+                    bidders.extend(Auction.bidders.through(auction_id = pk, user_id = user_pk) for user_pk in set(bidder.pk for bidder, amount, created in history))
+                Bid.objects.bulk_create(bids)
+                Auction.bidders.through.objects.bulk_create(bidders)
+            auctions_created += size
+            bids_created += len(bids)
+        search.rebuild()
+        caching.bump_list_version()
+        return auctions_created, bids_created
+
+    def status(self):
+        roll = self.random.random() * sum(share for status, share in self.statuses)
+        for status, share in self.statuses:
+            roll -= share
+            if roll < 0:
+                return status
+        return self.statuses[-1][0]
+
+    def auction(self, now, users, bids_per_auction):
+        seller = self.random.choice(users)
+        status = self.status()
+        if status == Auction.ADJUDICATED:
+            deadline = now - timedelta(days = self.random.uniform(1, self.deadline_days))
+        elif status == Auction.ACTIVE and self.random.random() < self.overdue:
+            deadline = now - timedelta(minutes = self.random.uniform(1, 60))
+        else:
+            deadline = now + timedelta(days = self.random.uniform(0.01, self.deadline_days))
+        price = Decimal(self.random.randint(100, 50000)) / 100
+        history = []
+        created = deadline - timedelta(days = 3)
+        bid_count = int(self.random.expovariate(1.0 / bids_per_auction)) if bids_per_auction > 0 else 0
+        for i in range(bid_count):
+            bidder = self.random.choice(users)
+            if bidder == seller:
+                continue
+            price += Decimal(self.random.randint(1, 2000)) / 100
+            created += timedelta(minutes = self.random.uniform(1, 600))
+            history.append((bidder, price, min(created, now)))
+        auction = Auction(
+            status = status,
+            seller = seller.username,
+            title = self.title(),
+            item_description = self.description(),
+            price = price,
+            last_bidder = history[-1][0].username if len(history) != 0 else '',
+            deadline = deadline,
+        )
+        return auction, history
+
+
+def generate(auctions, users = None, bids_per_auction = 5, overdue = 0.01, seed = 0):
+    generator = DataGenerator(seed, overdue = overdue)
+    created_users = generator.users(users if users is not None else max(auctions // 20, 10))
+    return generator.auctions(auctions, created_users, bids_per_auction)
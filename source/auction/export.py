@@ -0,0 +1,95 @@
+import csv
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Auction, Bid
+
+
+# Bulk export of auctions and bids as NDJSON or CSV. Rows are read in chunks in the order of their watermark and id,
+# so memory use does not depend on the size of the table and the first rows are ready at once. Incremental pulls pass
+# the watermark and id of the last row they have seen as since and after, and get the rows changed after it.
+#
+# Bids never change, so their watermark is the id. Auctions are exported again whenever their price, status,
+# deadline or description changes, so their watermark is the time of the last change. Changes are stamped before
+# they commit, so a pull can miss a change still being committed; pulls running often should start from a little
+# before the last watermark and drop the rows they already have.
+
+EXPORTS = {
+    'auctions': (Auction, ['id', 'status', 'seller', 'title', 'item_description', 'price', 'deadline', 'last_bidder', 'modified']),
+    'bids': (Bid, ['id', 'auction_id', 'bidder', 'amount']),
+}
+
+WATERMARKS = {
+    'auctions': 'modified',
+    'bids': 'id',
+}
+
+# Lookups of fields exported under another name.
+
+LOOKUPS = {
+    'bids': {'bidder': 'bidder__username'},
+}
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+# Watermark of an incremental pull given as text: an id for bids, a time for auctions. Raises ValueError if invalid.
+
+def parse_watermark(kind, since):
+    if WATERMARKS[kind] == 'id':
+        return int(since)
+    value = parse_datetime(since)
+    if value is None:
+        raise ValueError('Invalid time ' + since)
+    return value if timezone.is_aware(value) else timezone.make_aware(value)
+    
+    
+def export_rows(kind, since = None, after = 0, chunk_size = 2000):
+    model, fields = EXPORTS[kind]
+    watermark = WATERMARKS[kind]
+    index = fields.index(watermark)
+    lookups = [LOOKUPS.get(kind, {}).get(field, field) for field in fields]
+    queryset = model.objects.order_by(watermark, 'id').values_list(*lookups)
+    while True:
+        if since is not None:
+            rows = list(queryset.filter(Q(**{watermark + '__gt': since}) | Q(**{watermark: since, 'id__gt': after}))[:chunk_size])
+        else:
+            rows = list(queryset[:chunk_size])
+        if len(rows) == 0:
+            return
+        for row in rows:
+            yield row
+        since, after = rows[-1][index], rows[-1][0]
+        
+        
+# Buffer that hands back what is written to it, for producing CSV lines one at a time.
+
+class Echo(object):
+
+    def write(self, value):
+        return value
+        
+        
+# Lines of the export. The watermark is written in full, where JSON would cut times to milliseconds, so that it can be
+# passed back as it is.
+
+def export_lines(kind, export_format, since = None, after = 0, chunk_size = 2000):
+    model, fields = EXPORTS[kind]
+    watermark = WATERMARKS[kind]
+    if export_format == 'csv':
+        writer = csv.writer(Echo())
+        yield writer.writerow(fields)
+        for row in export_rows(kind, since, after, chunk_size):
+            yield writer.writerow(row)
+    else:
+        for row in export_rows(kind, since, after, chunk_size):
+            data = dict(zip(fields, row))
+            if watermark != 'id':
+                data[watermark] = data[watermark].isoformat()
+            yield json.dumps(data, cls = DjangoJSONEncoder) + '\n'
@@ -0,0 +1,92 @@
+import json
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from auction import benchmark, datagen
+
+
+# Custom command for load testing the bid and browse paths. Point it at a scratch database with --database, as it
+# adds auctions, bids and API tokens.
+
+class Command(BaseCommand):
+
+    help = 'Generates test data and replays a mixed workload against the application, reporting latency, queries per request and throughput'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--database', help = 'SQLite database file to use instead of the configured one, created and migrated if needed')
+        parser.add_argument('--auctions', type = int, default = 0, help = 'Number of auctions to generate first, e.g. 10000 to 1000000')
+        parser.add_argument('--users', type = int, help = 'Number of users to generate, by default one per 20 auctions')
+        parser.add_argument('--bids-per-auction', type = float, default = 5, help = 'Average length of the generated bid histories')
+        parser.add_argument('--requests', type = int, default = 1000, help = 'Number of operations to replay')
+        parser.add_argument('--workers', type = int, default = 1, help = 'Number of worker processes')
+        parser.add_argument('--mix', default = ','.join(name + '=' + str(weight) for name, weight in sorted(benchmark.DEFAULT_MIX.items())), help = 'Weights of the operations')
+        parser.add_argument('--seed', type = int, default = 0)
+        parser.add_argument('--baseline', help = 'JSON file of an earlier run to compare with')
+        parser.add_argument('--save-baseline', help = 'JSON file to save the results in')
+        parser.add_argument('--tolerance', type = float, default = 0.2, help = 'Allowed relative growth of the p95 latency')
+        parser.add_argument('--connections', type = int, default = 0, help = 'Number of slow browse clients to serve through the WSGI and ASGI paths for comparison')
+        parser.add_argument('--slow', type = float, default = 0.1, help = 'Seconds each slow client takes to read its response')
+        parser.add_argument('--wsgi-threads', type = int, default = 8, help = 'Server threads of the WSGI path in the comparison')
+        parser.add_argument('--peak-bids', type = int, default = 0, help = 'Number of bids to post on one auction at once, placed directly and through the sequencer for comparison')
+        parser.add_argument('--bidders', type = int, default = 8, help = 'Number of concurrent bidders posting the peak bids')
+    
+    def handle(self, *args, **options):
+        try:
+            mix = benchmark.parse_mix(options['mix'])
+        except ValueError as error:
+            raise CommandError(str(error))
+        if options['database'] is not None:
+            if connections['default'].vendor != 'sqlite':
+                raise CommandError('--database needs an SQLite database')
+            connections['default'].close()
+            connections['default'].settings_dict['NAME'] = options['database']
+            call_command('migrate', verbosity = 0)
+        if options['auctions'] > 0:
+            auctions, bids = datagen.generate(options['auctions'], options['users'], options['bids_per_auction'], seed = options['seed'])
+            self.stdout.write('Generated ' + str(auctions) + ' auctions with ' + str(bids) + ' bids')
+        self.stdout.write('Database: ' + benchmark.describe_database())
+        if options['connections'] > 0:
+            try:
+                results = benchmark.compare_servers(options['connections'], options['slow'], options['wsgi_threads'], options['seed'])
+            except ValueError as error:
+                raise CommandError(str(error))
+            self.report_servers(results)
+        if options['peak_bids'] > 0:
+            try:
+                results = benchmark.compare_bid_paths(options['peak_bids'], options['bidders'], options['seed'])
+            except ValueError as error:
+                raise CommandError(str(error))
+            self.report_bid_paths(results)
+        samples, elapsed = benchmark.run(options['requests'], mix, options['workers'], seed = options['seed'])
+        summary = benchmark.summarize(samples, elapsed)
+        self.report(summary)
+        if options['save_baseline'] is not None:
+            with open(options['save_baseline'], 'w') as baseline_file:
+                json.dump(summary, baseline_file, indent = 2, sort_keys = True)
+        if options['baseline'] is not None:
+            with open(options['baseline']) as baseline_file:
+                regressions = benchmark.compare(summary, json.load(baseline_file), options['tolerance'])
+            if len(regressions) != 0:
+                raise CommandError('Regressions against ' + options['baseline'] + ':\n  ' + '\n  '.join(regressions))
+            self.stdout.write('No regressions against ' + options['baseline'])
+            
+    def report(self, summary):
+        self.stdout.write('operation      count     p50 ms     p95 ms     p99 ms  queries  errors    ops/s')
+        for name, result in sorted(summary.items()):
+            if name != 'total':
+                self.stdout.write(name.ljust(10) + str(result['count']).rjust(9) + ''.join(format(result[key], '.2f').rjust(11) for key in ['p50', 'p95', 'p99']) + format(result['queries'], '.2f').rjust(9) + str(result['errors']).rjust(8) + format(result['throughput'], '.1f').rjust(9))
+        self.stdout.write('total ' + str(summary['total']['count']) + ' operations, ' + format(summary['total']['throughput'], '.1f') + ' ops/s')
+        
+    def report_servers(self, results):
+        self.stdout.write('path     seconds  connections at once  KiB per connection  errors')
+        for name in ['wsgi', 'asgi']:
+            result = results[name]
+            self.stdout.write(name.ljust(4) + format(result['seconds'], '.2f').rjust(12) + str(result['peak_connections']).rjust(21) + format(result['kib_per_connection'], '.1f').rjust(20) + str(result['errors']).rjust(8))
+            
+    def report_bid_paths(self, results):
+        self.stdout.write('path        p50 ms     p95 ms     p99 ms  settled p95 ms  seconds  responses')
+        for name in ['direct', 'queued']:
+            result = results[name]
+            responses = ', '.join(str(status) + ': ' + str(count) for status, count in sorted(result['statuses'].items()))
+            self.stdout.write(name.ljust(6) + ''.join(format(result[key], '.2f').rjust(11) for key in ['p50', 'p95', 'p99']) + format(result['settled_p95'], '.2f').rjust(16) + format(result['seconds'], '.2f').rjust(9) + '  ' + responses)
@@ -0,0 +1,79 @@
+import random
+import string
+import time
+from datetime import timedelta
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from auction import search
+from auction.models import Auction
+
+
+class Rollback(Exception):
+    pass
+
+
+# Custom command for comparing the latency of the search index with title__icontains. The auctions it creates are
+# rolled back at the end.
+
+class Command(BaseCommand):
+
+    help = 'Benchmarks auction search against title__icontains at growing numbers of auctions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type = int, nargs = '+', default = [10000, 100000, 1000000], help = 'Numbers of auctions to measure at')
+        parser.add_argument('--queries', type = int, default = 50, help = 'Number of queries per size')
+        parser.add_argument('--seed', type = int, default = 0)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.vocabulary = [''.join(self.random.choice(string.ascii_lowercase) for i in range(self.random.randint(4, 10))) for j in range(20000)]
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, options):
+        deadline = timezone.now() + timedelta(days = 30)
+        count = Auction.objects.count()
+        for size in sorted(options['sizes']):
+            while count < size:
+                batch = min(5000, size - count)
+                Auction.objects.bulk_create([self.auction(deadline) for i in range(batch)])
+                count += batch
+            search.rebuild()
+            words = [self.random.choice(self.vocabulary) for i in range(options['queries'])]
+            icontains = self.measure(lambda word: list(Auction.objects.filter(title__icontains = word, status = Auction.ACTIVE).values_list('pk', flat = True)[:100]), words)
+            indexed = self.measure(lambda word: search.search(word, limit = 100), words)
+            prefixes = self.measure(lambda word: search.search(word[:3], limit = 100), words)
+            self.stdout.write(str(size) + ' auctions:')
+            self.report('icontains', icontains)
+            self.report('index', indexed)
+            self.report('index, 3 letter prefix', prefixes)
+
+    def auction(self, deadline):
+        return Auction(
+            seller = 'benchmark',
+            status = Auction.ACTIVE if self.random.random() < 0.9 else Auction.ADJUDICATED,
+            title = ' '.join(self.random.choice(self.vocabulary) for i in range(4)),
+            item_description = ' '.join(self.random.choice(self.vocabulary) for i in range(30)),
+            price = Decimal(self.random.randint(0, 100000)) / 100,
+            deadline = deadline,
+        )
+
+    def measure(self, query, words):
+        latencies = []
+        for word in words:
+            start = time.perf_counter()
+            query(word)
+            latencies.append(time.perf_counter() - start)
+        return sorted(latencies)
+
+    def report(self, name, latencies):
+        median = latencies[len(latencies) // 2] * 1000
+        p95 = latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)] * 1000
+        self.stdout.write('  ' + name.ljust(24) + ' median ' + format(median, '.2f') + ' ms, p95 ' + format(p95, '.2f') + ' ms')
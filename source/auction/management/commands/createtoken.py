@@ -0,0 +1,23 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from auction.tokens import issue_token
+
+
+# Custom command for issuing API tokens, e.g. for automated bidding clients.
+
+class Command(BaseCommand):
+
+    help = 'Issues an API token for a user and prints it'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--name', default = '', help = 'Name for telling the tokens of the user apart')
+    
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username = options['username'])
+        except User.DoesNotExist:
+            raise CommandError('No user ' + options['username'])
+        token, key = issue_token(user, options['name'])
+        self.stdout.write('Token ' + str(token.pk) + ': ' + key)
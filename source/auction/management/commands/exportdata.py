@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from auction.export import EXPORTS, FORMATS, export_lines, parse_watermark
+
+
+# Custom command for exporting auctions or bids for analytics.
+
+class Command(BaseCommand):
+
+    help = 'Writes all auctions or bids to standard output as NDJSON or CSV'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('type', choices = sorted(EXPORTS.keys()))
+        parser.add_argument('--format', choices = sorted(FORMATS.keys()), default = 'ndjson')
+        parser.add_argument('--since', help = 'Only export rows after this watermark: the id of a bid, or the modified time of an auction')
+        parser.add_argument('--after', type = int, default = 0, help = 'Id of the last row seen with the since watermark')
+    
+    def handle(self, *args, **options):
+        try:
+            since = parse_watermark(options['type'], options['since']) if options['since'] is not None else None
+        except ValueError as error:
+            raise CommandError(str(error))
+        for line in export_lines(options['type'], options['format'], since, options['after']):
+            self.stdout.write(line, ending = '')
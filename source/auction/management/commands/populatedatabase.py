@@ -1,32 +1,53 @@
-from datetime import timedelta
-from decimal import Decimal
-from django.core.management.base import BaseCommand
-from django.contrib.auth.models import User
-from django.utils import timezone
+from django.core.management.base import BaseCommand, CommandError
 
-from auction.models import Auction, AuctionUser
+from auction.datagen import BATCH_SIZE, DataGenerator
+from auction.models import Auction
 
 
-# Populate database.
+STATUSES = {'active': Auction.ACTIVE, 'banned': Auction.BANNED, 'adjudicated': Auction.ADJUDICATED}
+
+
+# Populate database. Users are named user<n> and share one password.
 
 class Command(BaseCommand):
 
-    help = 'Populates the database with some example data'
+    help = 'Populates the database with example data'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type = int, default = 50)
+        parser.add_argument('--auctions', type = int, default = 50)
+        parser.add_argument('--bids-per-auction', type = float, default = 1, help = 'Average number of bids per auction')
+        parser.add_argument('--deadline-days', type = float, default = 30, help = 'Deadlines are spread over this many days')
+        parser.add_argument('--status-mix', default = 'active=0.94,adjudicated=0.05,banned=0.01', help = 'Share of auctions of each status')
+        parser.add_argument('--overdue', type = float, default = 0, help = 'Share of active auctions past their deadline')
+        parser.add_argument('--password', default = 'very_easy_password')
+        parser.add_argument('--seed', type = int, default = 0)
+        parser.add_argument('--batch-size', type = int, default = BATCH_SIZE, help = 'Number of rows inserted per transaction')
 
     def handle(self, *args, **options):
-        first_id = 0
-        for i in range(1, 51):
-            User.objects.create_user('user' + str(i), 'user' + str(i) + '@example.com', 'very_easy_password').save()
-            auction_user = AuctionUser(user = User.objects.get(username = 'user' + str(i)))
-            auction_user.save()
-            auction = Auction(seller = auction_user.user.username, title = 'auction' + str(i), item_description = 'Item description.', price = Decimal(0.00), deadline = timezone.now() + timedelta(days = 30))
-            auction.save()
-            if i == 1:
-                first_id = auction.id
-        for i in range(0, 10):
-            auction = Auction.objects.get(pk = first_id + i)
-            auction.price += Decimal('0.01')
-            user = User.objects.get(username = 'user' + str(i + 2))
-            auction.add_bidder(user.pk)
-            auction.last_bidder = user.username
-            auction.save()
\ No newline at end of file
+        if options['users'] < 2 and options['auctions'] > 0:
+            raise CommandError('At least two users are needed for auctions with bids')
+        generator = DataGenerator(
+            options['seed'],
+            options['password'],
+            options['batch_size'],
+            options['deadline_days'],
+            self.parse_status_mix(options['status_mix']),
+            options['overdue'],
+        )
+        users = generator.users(options['users'])
+        auctions, bids = generator.auctions(options['auctions'], users, options['bids_per_auction'])
+        if options['verbosity'] > 0:
+            self.stdout.write('Created ' + str(len(users)) + ' users, ' + str(auctions) + ' auctions and ' + str(bids) + ' bids')
+            
+    def parse_status_mix(self, text):
+        status_mix = {}
+        try:
+            for part in text.split(','):
+                name, share = part.split('=')
+                status_mix[STATUSES[name.strip()]] = float(share)
+        except (KeyError, ValueError):
+            raise CommandError('Status mix must look like active=0.9,adjudicated=0.05,banned=0.05')
+        if sum(status_mix.values()) <= 0:
+            raise CommandError('Status mix must have a positive share')
+        return status_mix
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from auction import search
+
+
+# Custom command for rebuilding the search index from the auction table.
+
+class Command(BaseCommand):
+
+    help = 'Rebuilds the search index of auction titles and item descriptions'
+    
+    def handle(self, *args, **options):
+        search.rebuild()
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from auction import rates
+
+
+# Custom command for refreshing the currency rates on a schedule, so that detail pages never find the cache empty. The
+# rates are stored in the default cache, so this only reaches the web server processes if the cache is shared with
+# them, such as memcached in settings_production.py; with a local memory cache it only fills its own.
+
+class Command(BaseCommand):
+
+    help = 'Fetches the current currency rates into the cache'
+    
+    def handle(self, *args, **options):
+        table = rates.refresh()
+        if table is None:
+            raise CommandError('Fetching currency rates failed, the last known rates are kept')
+        self.stdout.write('Fetched rates for ' + str(len(table.rates)) + ' currencies')
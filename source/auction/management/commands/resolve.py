@@ -1,24 +1,49 @@
-from django.contrib.auth.models import User
-from django.core.mail import send_mail
+import time
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 
-from auction.models import Auction
+from auction.resolution import next_deadline, resolve_due_chunk
 
 
-# Custom command for periodically making sure that due auctions are resolved.
+# Custom command for resolving due auctions. Run it once from cron, or with --loop as a daemon that sleeps until the
+# next deadline. Several instances can run at the same time.
 
 class Command(BaseCommand):
 
     help = 'Resolves auctions that are due'
     
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type = int, default = 500, help = 'Number of auctions resolved per transaction')
+        parser.add_argument('--loop', action = 'store_true', help = 'Keep resolving auctions as they become due')
+        parser.add_argument('--max-sleep', type = float, default = 60.0, help = 'Longest time in seconds to sleep between rounds')
+    
     def handle(self, *args, **options):
-        auctions = Auction.objects.all()
-        for auction in auctions:
-            if auction.deadline < timezone.now() and auction.status == Auction.ACTIVE:
-                auction.status = Auction.ADJUDICATED
-                auction.save()
-                if auction.last_bidder == '':
-                    send_mail('Auction resolved', 'Auction ' + auction.title + ' has been resolved. There were no bids.', 'pengstro@abo.fi', [User.objects.get(username = auction.seller).email])
-                else:
-                    send_mail('Auction resolved', 'Auction ' + auction.title + ' has been resolved. The winner is ' + auction.last_bidder + '.', 'pengstro@abo.fi', auction.get_bidder_mails())
\ No newline at end of file
+        while True:
+            self.resolve(options)
+            if not options['loop']:
+                break
+            time.sleep(self.sleep_time(options['max_sleep']))
+            
+    def resolve(self, options):
+        now = timezone.now()
+        start = time.time()
+        chunks = 0
+        total = 0
+        while True:
+            claimed, resolved = resolve_due_chunk(now, options['chunk_size'])
+            if claimed == 0:
+                break
+            chunks += 1
+            total += resolved
+        elapsed = time.time() - start
+        if options['verbosity'] > 0 and (total > 0 or not options['loop']):
+            self.stdout.write('Resolved ' + str(total) + ' auctions in ' + str(chunks) + ' chunks, ' + format(elapsed, '.3f') + ' s, ' + format(total / elapsed if elapsed > 0 else 0, '.1f') + ' auctions/s')
+            
+    # Seconds until the next auction is due. Deadlines only move later and new auctions end at least three days from
+    # now, so nothing can become due earlier. The sleep is capped anyway, so that unusual changes are picked up.
+            
+    def sleep_time(self, max_sleep):
+        deadline = next_deadline()
+        if deadline is None:
+            return max_sleep
+        return min(max((deadline - timezone.now()).total_seconds(), 0.1), max_sleep)
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from auction.models import APIToken
+from auction.tokens import revoke_token
+
+
+# Custom command for revoking API tokens.
+
+class Command(BaseCommand):
+
+    help = 'Revokes an API token'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('id', type = int)
+    
+    def handle(self, *args, **options):
+        try:
+            revoke_token(APIToken.objects.get(pk = options['id']))
+        except APIToken.DoesNotExist:
+            raise CommandError('No token ' + str(options['id']))
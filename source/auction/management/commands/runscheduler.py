@@ -0,0 +1,30 @@
+import signal
+from django.core.management.base import BaseCommand
+
+from auction import scheduler
+
+
+# Custom command for resolving auctions at their deadlines as a daemon. Unlike resolve --loop it keeps every deadline
+# in memory, so it wakes up once per deadline instead of querying for the next one.
+
+class Command(BaseCommand):
+
+    help = 'Resolves auctions at their deadlines until stopped'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type = int, default = 500, help = 'Number of auctions resolved per transaction')
+        parser.add_argument('--poll', type = float, default = 10.0, help = 'Seconds between looking for new auctions')
+    
+    def handle(self, *args, **options):
+        service = scheduler.DeadlineScheduler(chunk_size = options['chunk_size'])
+        scheduler.register(service)
+        signal.signal(signal.SIGTERM, lambda signum, frame: service.stop())
+        try:
+            service.run(options['poll'], self.report if options['verbosity'] > 0 else None)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            scheduler.unregister(service)
+            
+    def report(self, resolved):
+        self.stdout.write('Resolved ' + str(resolved) + ' auctions')
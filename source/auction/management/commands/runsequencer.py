@@ -0,0 +1,32 @@
+import signal
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from auction import sequencer
+
+
+# Custom command placing queued bids as a daemon. Run one per shard, with shards 0 to SHARDS - 1 of
+# settings.BID_QUEUE.
+
+class Command(BaseCommand):
+
+    help = 'Places queued bids of one shard of the auctions in order until stopped'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--shard', type = int, default = 0, help = 'Shard served by this process, from 0')
+        parser.add_argument('--shards', type = int, default = settings.BID_QUEUE['SHARDS'], help = 'Number of shards')
+        parser.add_argument('--batch-size', type = int, default = settings.BID_QUEUE['BATCH_SIZE'], help = 'Number of bids placed per transaction')
+        parser.add_argument('--poll', type = float, default = settings.BID_QUEUE['POLL'], help = 'Seconds between looking for new bids when idle')
+    
+    def handle(self, *args, **options):
+        if options['shards'] < 1 or not 0 <= options['shard'] < options['shards']:
+            raise CommandError('The shard must be from 0 to the number of shards - 1')
+        service = sequencer.Sequencer(options['shard'], options['shards'], options['batch_size'])
+        signal.signal(signal.SIGTERM, lambda signum, frame: service.stop())
+        try:
+            service.run(options['poll'], self.report if options['verbosity'] > 1 else None)
+        except KeyboardInterrupt:
+            pass
+            
+    def report(self, count):
+        self.stdout.write('Placed ' + str(count) + ' queued bids')
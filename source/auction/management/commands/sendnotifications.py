@@ -0,0 +1,30 @@
+import time
+from django.core.management.base import BaseCommand
+
+from auction.notifications import send_batch
+
+
+# Custom command for sending the mails in the outbox. Run it with --loop as a background worker.
+
+class Command(BaseCommand):
+
+    help = 'Sends the mails waiting in the outbox'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type = int, default = 100, help = 'Number of mails sent over one connection')
+        parser.add_argument('--loop', action = 'store_true', help = 'Keep sending until interrupted')
+        parser.add_argument('--interval', type = float, default = 1.0, help = 'Seconds to wait when the outbox is empty')
+    
+    def handle(self, *args, **options):
+        total_sent = 0
+        total_failed = 0
+        while True:
+            sent, failed = send_batch(options['batch_size'])
+            total_sent += sent
+            total_failed += failed
+            if sent + failed == 0:
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        if options['verbosity'] > 0:
+            self.stdout.write('Sent ' + str(total_sent) + ' mails, ' + str(total_failed) + ' failed')
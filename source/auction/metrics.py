@@ -0,0 +1,234 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import connections
+
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+METRICS = [
+    ('auction_request_seconds', 'Total latency of requests.', LATENCY_BUCKETS),
+    ('auction_request_queries', 'SQL queries per request.', QUERY_BUCKETS),
+    ('auction_request_db_seconds', 'Time spent in SQL queries per request.', LATENCY_BUCKETS),
+    ('auction_request_http_seconds', 'Time spent in outbound HTTP requests per request.', LATENCY_BUCKETS),
+    ('auction_request_mail_seconds', 'Time spent sending mail per request.', LATENCY_BUCKETS),
+]
+
+BUCKETS = dict((name, buckets) for name, help_text, buckets in METRICS)
+
+OPERATIONS = ('http', 'mail')
+
+
+# Instrumentation of requests. Every request records its SQL queries and their time, the time spent in outbound HTTP
+# requests and mail sending, and its total latency, and these are added to histograms per URL name. The histograms are
+# served in the Prometheus text format by MetricsView. Recording costs a few clock reads per query, so it can stay on
+# in production. The histograms are kept per process; with several worker processes each has to be scraped, or the
+# requests are spread over them and each shows a sample.
+
+
+# Histogram with cumulative buckets as in Prometheus. Values are counted in the first bucket they fit in, and
+# accumulated when rendered.
+
+class Histogram(object):
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        index = 0
+        while index < len(self.buckets) and value > self.buckets[index]:
+            index += 1
+        self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Collector(object):
+
+    def __init__(self):
+        self.histograms = {}
+        self.requests = {}
+        self.throttled = {}
+        self.lock = threading.Lock()
+
+    def observe(self, name, view, value):
+        with self.lock:
+            histogram = self.histograms.get((name, view))
+            if histogram is None:
+                histogram = self.histograms[(name, view)] = Histogram(BUCKETS[name])
+            histogram.observe(value)
+
+    def record(self, view, status, record):
+        with self.lock:
+            self.requests[(view, status)] = self.requests.get((view, status), 0) + 1
+        self.observe('auction_request_seconds', view, record.elapsed)
+        self.observe('auction_request_queries', view, record.queries)
+        self.observe('auction_request_db_seconds', view, record.db_time)
+        self.observe('auction_request_http_seconds', view, record.times['http'])
+        self.observe('auction_request_mail_seconds', view, record.times['mail'])
+
+    # Counts a request turned away by admission control, see throttling.py.
+
+    def count_throttled(self, endpoint_class, reason):
+        with self.lock:
+            self.throttled[(endpoint_class, reason)] = self.throttled.get((endpoint_class, reason), 0) + 1
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+            self.requests.clear()
+            self.throttled.clear()
+
+    def render(self):
+        lines = []
+        with self.lock:
+            lines.append('# HELP auction_requests_total Requests by URL name and status code.')
+            lines.append('# TYPE auction_requests_total counter')
+            for (view, status), count in sorted(self.requests.items()):
+                lines.append('auction_requests_total{view="' + escape(view) + '",status="' + str(status) + '"} ' + str(count))
+            lines.append('# HELP auction_throttled_total Requests turned away by rate limits and load shedding.')
+            lines.append('# TYPE auction_throttled_total counter')
+            for (endpoint_class, reason), count in sorted(self.throttled.items()):
+                lines.append('auction_throttled_total{class="' + endpoint_class + '",reason="' + reason + '"} ' + str(count))
+            for name, help_text, buckets in METRICS:
+                lines.append('# HELP ' + name + ' ' + help_text)
+                lines.append('# TYPE ' + name + ' histogram')
+                for (histogram_name, view), histogram in sorted(self.histograms.items()):
+                    if histogram_name != name:
+                        continue
+                    label = 'view="' + escape(view) + '"'
+                    total = 0
+                    for bound, count in zip(list(histogram.buckets) + ['+Inf'], histogram.counts):
+                        total += count
+                        lines.append(name + '_bucket{' + label + ',le="' + str(bound) + '"} ' + str(total))
+                    lines.append(name + '_sum{' + label + '} ' + repr(float(histogram.sum)))
+                    lines.append(name + '_count{' + label + '} ' + str(histogram.count))
+        return '\n'.join(lines) + '\n'
+
+
+collector = Collector()
+
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# Measurements of the request being handled by this thread.
+
+class RequestRecord(object):
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.elapsed = 0
+        self.queries = 0
+        self.db_time = 0
+        self.times = dict((operation, 0) for operation in OPERATIONS)
+
+
+def current():
+    return getattr(_local, 'record', None)
+
+
+# Adds the time taken by the block to the given operation of the current request, if any.
+
+@contextmanager
+def timed(operation):
+    record = current()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if record is not None:
+            record.times[operation] += time.perf_counter() - start
+
+
+# Database cursor timing every query for the current request. Wraps the cursor of the database driver, below
+# Django's own wrappers, so queries are counted whether or not they are also being logged for debugging.
+
+class TimedCursor(object):
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def execute(self, *args, **kwargs):
+        return self.timed(self.cursor.execute, *args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        return self.timed(self.cursor.executemany, *args, **kwargs)
+
+    def callproc(self, *args, **kwargs):
+        return self.timed(self.cursor.callproc, *args, **kwargs)
+
+    def timed(self, method, *args, **kwargs):
+        record = current()
+        if record is None:
+            return method(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            record.queries += 1
+            record.db_time += time.perf_counter() - start
+
+
+# Makes the connection hand out timed cursors. Connections are per thread, so every connection of the thread is
+# checked when a request starts.
+
+def instrument(connection):
+    if getattr(connection, 'metrics_instrumented', False):
+        return
+    create_cursor = connection.create_cursor
+    connection.create_cursor = lambda *args, **kwargs: TimedCursor(create_cursor(*args, **kwargs))
+    connection.metrics_instrumented = True
+
+
+def over_budget(record):
+    config = settings.METRICS
+    query_budget = config.get('QUERY_BUDGET')
+    latency_budget = config.get('LATENCY_BUDGET')
+    return (query_budget is not None and record.queries > query_budget) or (latency_budget is not None and record.elapsed > latency_budget)
+
+
+# Middleware recording every request. Should come first, so that the latency covers the other middleware too. For
+# streaming responses only the time until the response starts is recorded.
+
+class MetricsMiddleware(object):
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        for connection in connections.all():
+            instrument(connection)
+        record = _local.record = RequestRecord()
+        try:
+            response = self.get_response(request)
+        finally:
+            _local.record = None
+            record.elapsed = time.perf_counter() - record.start
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match is not None else 'unresolved'
+        collector.record(view, response.status_code, record)
+        if over_budget(record):
+            logger.warning(
+                'Request over budget: %s %s (%s) took %.1f ms with %d queries in %.1f ms, HTTP %.1f ms, mail %.1f ms',
+                request.method, request.path, view, record.elapsed * 1000, record.queries, record.db_time * 1000,
+                record.times['http'] * 1000, record.times['mail'] * 1000,
+            )
+        return response
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.1 on 2026-10-18 05:18
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auction', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='auction',
+            name='locked_by',
+        ),
+    ]
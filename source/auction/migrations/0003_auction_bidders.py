@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.1 on 2026-10-18 05:20
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def copy_bidders(apps, schema_editor):
+    Auction = apps.get_model('auction', 'Auction')
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Bidders = Auction.bidders.through
+    user_pks = set(User.objects.values_list('pk', flat=True))
+    rows = []
+    for auction_pk, bidder_pk_string in Auction.objects.exclude(bidder_pk_string='').values_list('pk', 'bidder_pk_string').iterator():
+        for pk in set(int(pk) for pk in bidder_pk_string.split(',') if pk.strip().isdigit()):
+            if pk in user_pks:
+                rows.append(Bidders(auction_id=auction_pk, user_id=pk))
+    Bidders.objects.bulk_create(rows, batch_size=500)
+
+
+def copy_bidder_pk_strings(apps, schema_editor):
+    Auction = apps.get_model('auction', 'Auction')
+    Bidders = Auction.bidders.through
+    bidder_pks = {}
+    for auction_pk, user_pk in Bidders.objects.order_by('pk').values_list('auction_id', 'user_id').iterator():
+        bidder_pks.setdefault(auction_pk, []).append(str(user_pk))
+    for auction_pk, pks in bidder_pks.items():
+        Auction.objects.filter(pk=auction_pk).update(bidder_pk_string=','.join(pks))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('auction', '0002_remove_auction_locked_by'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='auction',
+            name='bidders',
+            field=models.ManyToManyField(blank=True, related_name='bid_auctions', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(copy_bidders, copy_bidder_pk_strings),
+        migrations.AlterField(
+            model_name='auction',
+            name='bidder_pk_string',
+            field=models.CharField(default='', max_length=2000),
+        ),
+        migrations.RemoveField(
+            model_name='auction',
+            name='bidder_pk_string',
+        ),
+    ]
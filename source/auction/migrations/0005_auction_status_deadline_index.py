@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.1 on 2026-10-18 05:23
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auction', '0004_notification'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='auction',
+            index=models.Index(fields=['status', 'deadline'], name='auction_auc_status_f2b6e0_idx'),
+        ),
+    ]
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.1 on 2026-10-18 05:25
+from __future__ import unicode_literals
+
+import re
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# The search index is an FTS5 table where available, see auction/search.py. The helpers below are copies of the ones
+# there as they were when this migration was written, so that later changes to the search do not change it.
+
+TITLE_WEIGHT = 10
+DESCRIPTION_WEIGHT = 1
+
+
+def tokenize(text):
+    return [word[:100] for word in re.findall(r'\w+', text.lower())]
+
+
+def auction_terms(title, item_description):
+    weights = {}
+    for word in tokenize(title):
+        weights[word] = weights.get(word, 0) + TITLE_WEIGHT
+    for word in tokenize(item_description):
+        weights[word] = weights.get(word, 0) + DESCRIPTION_WEIGHT
+    return weights
+
+
+def fts5_available(connection):
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        return cursor.fetchone()[0] == 1
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if fts5_available(connection):
+        schema_editor.execute("CREATE VIRTUAL TABLE auction_search USING fts5(title, item_description, status UNINDEXED, prefix = '2 3')")
+        schema_editor.execute('INSERT INTO auction_search(rowid, title, item_description, status) SELECT id, title, item_description, status FROM auction_auction')
+        return
+    Auction = apps.get_model('auction', 'Auction')
+    SearchTerm = apps.get_model('auction', 'SearchTerm')
+    terms = []
+    for pk, title, item_description, status in Auction.objects.using(connection.alias).values_list('pk', 'title', 'item_description', 'status').iterator():
+        for term, weight in auction_terms(title, item_description).items():
+            terms.append(SearchTerm(auction_id=pk, term=term, weight=weight, status=status))
+    SearchTerm.objects.using(connection.alias).bulk_create(terms, batch_size=1000)
+
+
+def drop_search_index(apps, schema_editor):
+    schema_editor.execute('DROP TABLE IF EXISTS auction_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auction', '0005_auction_status_deadline_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(db_index=True, max_length=100)),
+                ('weight', models.IntegerField(default=1)),
+                ('status', models.IntegerField(choices=[(0, 'Active'), (1, 'Banned'), (2, 'Adjudicated')], default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='searchterm',
+            name='auction',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='auction.Auction'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
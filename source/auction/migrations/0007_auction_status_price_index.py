@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.1 on 2026-10-18 05:28
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auction', '0006_searchterm'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='auction',
+            index=models.Index(fields=['status', 'price'], name='auction_auc_status_779941_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.1 on 2026-10-18 05:38
+from __future__ import unicode_literals
+
+import auction.models
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('auction', '0008_apitoken'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProxyBid',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('maximum', auction.models.PositiveDecimalField(decimal_places=2, max_digits=15)),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='proxybid',
+            name='auction',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='auction.Auction'),
+        ),
+        migrations.AddField(
+            model_name='proxybid',
+            name='bidder',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='proxy_bids', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='proxybid',
+            index=models.Index(fields=['auction', '-maximum', 'created'], name='auction_pro_auction_8817ec_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='proxybid',
+            unique_together=set([('auction', 'bidder')]),
+        ),
+    ]
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.1 on 2026-10-18 05:45
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+# Bids are kept whatever happens: if some were placed by usernames that no longer have a user, the migration stops
+# and lists them, so that the users can be recreated, or the bids deleted, before migrating again.
+
+def copy_bidder_users(apps, schema_editor):
+    Bid = apps.get_model('auction', 'Bid')
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    user_pks = dict(User.objects.values_list('username', 'pk'))
+    unknown = sorted(set(Bid.objects.values_list('bidder', flat=True)) - set(user_pks))
+    if len(unknown) != 0:
+        raise RuntimeError('Bids were placed by usernames without a user: ' + ', '.join(unknown) + '. Create the users or delete their bids, then migrate again.')
+    for username in Bid.objects.values_list('bidder', flat=True).distinct():
+        Bid.objects.filter(bidder=username).update(bidder_user_id=user_pks[username])
+
+
+def copy_bidder_usernames(apps, schema_editor):
+    Bid = apps.get_model('auction', 'Bid')
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    for pk, username in User.objects.filter(pk__in=Bid.objects.values('bidder_user_id')).values_list('pk', 'username'):
+        Bid.objects.filter(bidder_user_id=pk).update(bidder=username)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('auction', '0009_proxybid'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bid',
+            name='bidder_user',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='bid',
+            name='bidder',
+            field=models.CharField(default='', max_length=150),
+        ),
+        migrations.RunPython(copy_bidder_users, copy_bidder_usernames),
+        migrations.RemoveField(
+            model_name='bid',
+            name='bidder',
+        ),
+        migrations.RenameField(
+            model_name='bid',
+            old_name='bidder_user',
+            new_name='bidder',
+        ),
+        migrations.AlterField(
+            model_name='bid',
+            name='bidder',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bids', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='bid',
+            name='created',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='bid',
+            index=models.Index(fields=['auction', 'amount'], name='auction_bid_auction_5dafc2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bid',
+            index=models.Index(fields=['bidder', 'created'], name='auction_bid_bidder__0005bd_idx'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.1 on 2026-10-18 06:10
+from __future__ import unicode_literals
+
+import auction.models
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('auction', '0010_bid_bidder_user'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueuedBid',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', auction.models.PositiveDecimalField(decimal_places=2, max_digits=15)),
+                ('status', models.IntegerField(choices=[(0, 'Pending'), (1, 'Accepted'), (2, 'Rejected')], default=0)),
+                ('detail', models.CharField(blank=True, max_length=200)),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('processed', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='queuedbid',
+            name='auction',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='auction.Auction'),
+        ),
+        migrations.AddField(
+            model_name='queuedbid',
+            name='bid',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='auction.Bid'),
+        ),
+        migrations.AddField(
+            model_name='queuedbid',
+            name='bidder',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='queued_bids', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='queuedbid',
+            index=models.Index(fields=['status', 'id'], name='auction_que_status_db5ee3_idx'),
+        ),
+    ]
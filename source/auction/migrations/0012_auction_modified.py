@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.1 on 2026-10-18 06:39
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auction', '0011_queuedbid'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='auction',
+            name='modified',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='auction',
+            index=models.Index(fields=['modified', 'id'], name='auction_auc_modifie_e9e66e_idx'),
+        ),
+    ]
@@ -41,10 +41,18 @@ class Auction(models.Model):
     title = models.CharField(max_length = 200, verbose_name = _('Title'))
     item_description = models.CharField(max_length = 1000, verbose_name = _('Item description'))
     price = PositiveDecimalField(verbose_name = _('Minimum price (€)'), default = 0, max_digits = 15, decimal_places = 2)
-    bidder_pk_string = models.CharField(max_length = 2000)
+    bidders = models.ManyToManyField(User, related_name = 'bid_auctions', blank = True)
     last_bidder = models.CharField(max_length = 150)
     deadline = models.DateTimeField(default = datetime.datetime.now())
-    locked_by = models.CharField(max_length = 150)
+    # Time of the last change, the watermark of incremental exports. Updates made with update() have to set it too.
+    modified = models.DateTimeField(auto_now = True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields = ['status', 'deadline']),
+            models.Index(fields = ['status', 'price']),
+            models.Index(fields = ['modified', 'id']),
+        ]
     
     def __str__(self):
         return self.title
@@ -56,18 +64,34 @@ class Auction(models.Model):
         return self.status == self.ACTIVE
         
     def get_bidder_mails(self):
-        bidder_pks = self.bidder_pk_string.split(',') if len(self.bidder_pk_string) != 0 else []
-        bidder_mails = []
-        for pk in bidder_pks:
-            bidder_mails.append(User.objects.get(pk = int(pk)).email)
-        return bidder_mails
+        return list(self.bidders.values_list('email', flat = True))
+        
+    # Mail addresses of the seller and all bidders, in one query.
+        
+    def get_participant_mails(self):
+        participants = User.objects.filter(models.Q(username = self.seller) | models.Q(bid_auctions = self))
+        return list(participants.values_list('email', flat = True).distinct())
         
     def add_bidder(self, bidder):
-        bidder_pks = self.bidder_pk_string.split(',')
-        if str(bidder) not in bidder_pks:
-            self.bidder_pk_string += str(bidder) if len(self.bidder_pk_string) == 0 else ',' + str(bidder)
+        self.bidders.add(bidder)
+        
+    # Highest bid, or None if there are no bids. Served by the (auction, amount) index of bids.
+        
+    def get_highest_bid(self):
+        return self.bid_set.select_related('bidder').order_by('-amount', '-id').first()
             
             
+# Model for a term in the search index of an auction. Only used on databases without a full-text index of their own,
+# see search.py.
+
+class SearchTerm(models.Model):
+
+    auction = models.ForeignKey(Auction, on_delete = models.CASCADE)
+    term = models.CharField(max_length = 100, db_index = True)
+    weight = models.IntegerField(default = 1)
+    status = models.IntegerField(choices = Auction.STATUS_CHOICES, default = Auction.ACTIVE)
+    
+    
 # Model for auction user.
 
 class AuctionUser(models.Model):
@@ -88,13 +112,119 @@ class AuctionUser(models.Model):
         return self.user.get_absolute_url()
 
             
-# Model for bid.
+# Model for bid. The indexes serve the highest bids of an auction and the latest bids of a user.
 
 class Bid(models.Model):
     
     auction = models.ForeignKey(Auction, on_delete = models.CASCADE)
-    bidder = models.CharField(max_length = 150)
+    bidder = models.ForeignKey(User, on_delete = models.CASCADE, related_name = 'bids')
     amount = PositiveDecimalField(default = 0, max_digits = 15, decimal_places = 2)
+    created = models.DateTimeField(default = timezone.now)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields = ['auction', 'amount']),
+            models.Index(fields = ['bidder', 'created']),
+        ]
+        
+    def get_absolute_url(self):
+        return reverse('bid_detail_api', kwargs = {'pk': self.pk})            
+            
+            
+# Model for a proxy bid, the most a user is willing to pay for an auction. Bids are placed on the user's behalf up to
+# the maximum when others bid, see views.place_bid. The index serves finding the highest maximum of an auction.
+
+class ProxyBid(models.Model):
+
+    auction = models.ForeignKey(Auction, on_delete = models.CASCADE)
+    bidder = models.ForeignKey(User, on_delete = models.CASCADE, related_name = 'proxy_bids')
+    maximum = PositiveDecimalField(max_digits = 15, decimal_places = 2)
+    created = models.DateTimeField(default = timezone.now)
+    
+    class Meta:
+        unique_together = ('auction', 'bidder')
+        indexes = [
+            models.Index(fields = ['auction', '-maximum', 'created']),
+        ]
+        
+    def get_absolute_url(self):
+        return reverse('proxy_bid_detail_api', kwargs = {'pk': self.pk})
+        
+        
+# Model for a token authenticating a user to the API. Only a hash of the token is stored, see tokens.py.
+
+class APIToken(models.Model):
+
+    user = models.ForeignKey(User, on_delete = models.CASCADE)
+    key_hash = models.CharField(max_length = 64, unique = True)
+    name = models.CharField(max_length = 100, blank = True)
+    created = models.DateTimeField(default = timezone.now)
+    revoked = models.DateTimeField(null = True, blank = True)
+    
+    def __str__(self):
+        return self.name if len(self.name) != 0 else 'Token ' + str(self.pk)
+        
+    def get_absolute_url(self):
+        return reverse('token_detail_api', kwargs = {'pk': self.pk})
+        
+        
+# Model for a mail waiting in the outbox. Mails are written in the same transaction as the change they are about, and
+# sent by the sendnotifications command.
+
+class Notification(models.Model):
+
+    subject = models.CharField(max_length = 200)
+    message = models.TextField()
+    from_email = models.CharField(max_length = 254)
+    recipients = models.TextField()
+    dedup_key = models.CharField(max_length = 200, unique = True, null = True, blank = True)
+    created = models.DateTimeField(default = timezone.now)
+    next_attempt = models.DateTimeField(default = timezone.now)
+    attempts = models.IntegerField(default = 0)
+    claim = models.CharField(max_length = 32, blank = True)
+    sent = models.DateTimeField(null = True, blank = True)
+    last_error = models.TextField(blank = True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields = ['sent', 'next_attempt']),
+        ]
+    
+    def __str__(self):
+        return self.subject
+        
+    def get_recipients(self):
+        return self.recipients.split('\n') if len(self.recipients) != 0 else []
+        
+        
+# Model for a bid waiting to be placed by the sequencer of its auction, see sequencer.py. The bid is kept after it
+# has been placed or rejected, as the answer to the bidder. The index serves finding the waiting bids in order.
+
+class QueuedBid(models.Model):
+
+    PENDING = 0
+    ACCEPTED = 1
+    REJECTED = 2
+    
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (ACCEPTED, 'Accepted'),
+        (REJECTED, 'Rejected'),
+    )
+    
+    auction = models.ForeignKey(Auction, on_delete = models.CASCADE)
+    bidder = models.ForeignKey(User, on_delete = models.CASCADE, related_name = 'queued_bids')
+    amount = PositiveDecimalField(max_digits = 15, decimal_places = 2)
+    status = models.IntegerField(choices = STATUS_CHOICES, default = PENDING)
+    detail = models.CharField(max_length = 200, blank = True)
+    bid = models.ForeignKey(Bid, on_delete = models.SET_NULL, null = True, blank = True)
+    created = models.DateTimeField(default = timezone.now)
+    processed = models.DateTimeField(null = True, blank = True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields = ['status', 'id']),
+        ]
         
     def get_absolute_url(self):
-        return reverse('bid_detail_api', kwargs = {'pk': self.pk})
\ No newline at end of file
+        return reverse('queued_bid_detail_api', kwargs = {'pk': self.pk})
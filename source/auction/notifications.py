@@ -0,0 +1,111 @@
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.utils import timezone
+
+from . import metrics
+from .models import Notification
+
+
+# Drops empty and repeated addresses.
+
+def unique_recipients(recipient_list):
+    recipients = []
+    for recipient in recipient_list:
+        if recipient != '' and recipient not in recipients:
+            recipients.append(recipient)
+    return recipients
+    
+    
+# Adds a mail to the outbox. Call it inside the transaction making the change the mail is about, so that the mail is
+# sent if and only if the change commits. A mail with a dedup key that is already in the outbox is not added again.
+
+def enqueue_mail(subject, message, from_email, recipient_list, dedup_key = None):
+    recipients = unique_recipients(recipient_list)
+    if len(recipients) == 0:
+        return None
+    fields = {'subject': subject, 'message': message, 'from_email': from_email, 'recipients': '\n'.join(recipients)}
+    if dedup_key is None:
+        return Notification.objects.create(**fields)
+    notification, created = Notification.objects.get_or_create(dedup_key = dedup_key, defaults = fields)
+    return notification
+    
+    
+# Adds many mails to the outbox in one insert. Each mail is a tuple of the arguments of enqueue_mail, including the
+# dedup key. Mails whose dedup key is already in the outbox are skipped.
+
+def enqueue_mails(mails):
+    existing = set(Notification.objects.filter(dedup_key__in = [mail[4] for mail in mails if mail[4] is not None]).values_list('dedup_key', flat = True))
+    notifications = []
+    for subject, message, from_email, recipient_list, dedup_key in mails:
+        recipients = unique_recipients(recipient_list)
+        if len(recipients) != 0 and (dedup_key is None or dedup_key not in existing):
+            notifications.append(Notification(subject = subject, message = message, from_email = from_email, recipients = '\n'.join(recipients), dedup_key = dedup_key))
+            existing.add(dedup_key)
+    Notification.objects.bulk_create(notifications)
+    return len(notifications)
+    
+    
+# Seconds to wait before the given attempt of a failed mail.
+
+def backoff(attempts):
+    return min(settings.NOTIFICATION_RETRY_DELAY * 2 ** (attempts - 1), settings.NOTIFICATION_MAX_RETRY_DELAY)
+
+
+# Claims a batch of due mails, so that concurrent workers never send the same mail. A claim expires after the lease,
+# so mails claimed by a worker that died are picked up again.
+
+def claim_batch(batch_size):
+    now = timezone.now()
+    due = Notification.objects.filter(sent__isnull = True, next_attempt__lte = now, attempts__lt = settings.NOTIFICATION_MAX_ATTEMPTS)
+    pks = list(due.order_by('next_attempt').values_list('pk', flat = True)[:batch_size])
+    if len(pks) == 0:
+        return []
+    claim = uuid.uuid4().hex
+    due.filter(pk__in = pks).update(claim = claim, next_attempt = now + timedelta(seconds = settings.NOTIFICATION_LEASE))
+    return list(Notification.objects.filter(pk__in = pks, claim = claim).order_by('next_attempt'))
+
+
+# Schedules a failed mail for another attempt.
+
+def record_failure(notification, error):
+    attempts = notification.attempts + 1
+    Notification.objects.filter(pk = notification.pk).update(
+        attempts = attempts,
+        next_attempt = timezone.now() + timedelta(seconds = backoff(attempts)),
+        claim = '',
+        last_error = repr(error),
+    )
+    
+    
+# Sends one batch of due mails over a single connection. Returns the number of mails sent and failed.
+
+def send_batch(batch_size = 100):
+    notifications = claim_batch(batch_size)
+    if len(notifications) == 0:
+        return 0, 0
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as error:
+        for notification in notifications:
+            record_failure(notification, error)
+        return 0, len(notifications)
+    sent = []
+    failed = 0
+    try:
+        for notification in notifications:
+            message = EmailMessage(notification.subject, notification.message, notification.from_email, notification.get_recipients(), connection = connection)
+            try:
+                with metrics.timed('mail'):
+                    connection.send_messages([message])
+            except Exception as error:
+                record_failure(notification, error)
+                failed += 1
+            else:
+                sent.append(notification.pk)
+    finally:
+        connection.close()
+        Notification.objects.filter(pk__in = sent).update(sent = timezone.now(), claim = '')
+    return len(sent), failed
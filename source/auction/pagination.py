@@ -0,0 +1,72 @@
+import base64
+import binascii
+import json
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+# Keyset pagination. A page continues after the sort key and id of the last row of the previous page, so fetching a
+# page costs the same however deep into the results it is. The cursor is an opaque string holding that position.
+
+def encode_cursor(value, pk):
+    return base64.urlsafe_b64encode(json.dumps([str(value), pk]).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        value, pk = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+    except (ValueError, TypeError, UnicodeError, binascii.Error):
+        raise InvalidCursor
+    if not isinstance(value, str) or not isinstance(pk, int):
+        raise InvalidCursor
+    return value, pk
+
+
+# Page of rows of the queryset, sorted by the field and then by id. The queryset should be a values() queryset
+# including the field and id, or a queryset of model instances. A field name starting with '-' sorts descending. An
+# invalid cursor is reported at once, but the rows are only fetched when first used, so a page can be handed to a
+# cached template fragment.
+
+class KeysetPage(object):
+
+    def __init__(self, queryset, field, cursor, limit):
+        descending = field.startswith('-')
+        self.name = field.lstrip('-')
+        self.limit = limit
+        if cursor is not None:
+            value, pk = decode_cursor(cursor)
+            after = '__lt' if descending else '__gt'
+            try:
+                queryset = queryset.filter(Q(**{self.name + after: value}) | Q(**{self.name: value, 'id' + after: pk}))
+            except ValidationError:
+                raise InvalidCursor
+        self.queryset = queryset.order_by(field, '-id' if descending else 'id')
+        
+    @cached_property
+    def fetched(self):
+        return list(self.queryset[:self.limit + 1])
+        
+    @property
+    def rows(self):
+        return self.fetched[:self.limit]
+        
+    # Cursor of the next page, or None if this is the last page.
+        
+    @property
+    def next_cursor(self):
+        if len(self.fetched) <= self.limit:
+            return None
+        last = self.rows[-1]
+        if isinstance(last, dict):
+            return encode_cursor(last[self.name], last['id'])
+        return encode_cursor(getattr(last, self.name), last.pk)
+        
+        
+def keyset_page(queryset, field, cursor, limit):
+    page = KeysetPage(queryset, field, cursor, limit)
+    return page.rows, page.next_cursor
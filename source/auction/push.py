@@ -0,0 +1,271 @@
+import asyncio
+import json
+import logging
+import socket
+import threading
+from urllib.parse import parse_qs
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.utils.module_loading import import_string
+
+from .models import Auction
+
+
+logger = logging.getLogger(__name__)
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+# Push of auction updates to watching clients. Bidding publishes the new state of the auction to a broker, and the
+# broker hands it to the subscriptions of every client watching that auction. The clients are served by an ASGI
+# application streaming Server-Sent Events, see auction_project/asgi.py. Updates carry the whole state of the
+# auction, so a client that falls behind only gets the latest update of each auction.
+
+
+# State of an auction as sent to the clients.
+
+def auction_event(auction):
+    return {
+        'id': str(auction.pk),
+        'status': auction.status,
+        'price': str(auction.price),
+        'last_bidder': auction.last_bidder,
+        'deadline': auction.deadline.isoformat(),
+    }
+
+
+# Updates waiting to be sent to one client. Updates may be delivered from any thread.
+
+class Subscription(object):
+
+    def __init__(self, pks):
+        self.pks = set(pks)
+        self.loop = asyncio.get_event_loop()
+        self.pending = {}
+        self.ready = asyncio.Event()
+
+    def deliver(self, event):
+        self.loop.call_soon_threadsafe(self.put, event)
+
+    def put(self, event):
+        self.pending[event['id']] = event
+        self.ready.set()
+
+    # Adds the event unless a newer one for the same auction is already waiting.
+
+    def offer(self, event):
+        if event['id'] not in self.pending:
+            self.put(event)
+
+    async def get(self):
+        while len(self.pending) == 0:
+            self.ready.clear()
+            await self.ready.wait()
+        events = list(self.pending.values())
+        self.pending.clear()
+        return events
+
+
+# Broker for a single process. Updates go straight to the subscriptions in this process, so it only works when the
+# clients are served by the process making the updates, which is not the case with the WSGI and ASGI applications.
+
+class InMemoryBroker(object):
+
+    shared = False
+
+    def __init__(self):
+        self.subscriptions = {}
+        self.lock = threading.Lock()
+
+    def subscribe(self, subscription):
+        with self.lock:
+            for pk in subscription.pks:
+                self.subscriptions.setdefault(str(pk), set()).add(subscription)
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            for pk in subscription.pks:
+                subscriptions = self.subscriptions.get(str(pk), set())
+                subscriptions.discard(subscription)
+                if len(subscriptions) == 0:
+                    self.subscriptions.pop(str(pk), None)
+
+    def publish(self, event):
+        with self.lock:
+            subscriptions = list(self.subscriptions.get(event['id'], ()))
+        for subscription in subscriptions:
+            subscription.deliver(event)
+
+    def close(self):
+        pass
+
+
+# Broker for several processes, standing in for a real message bus. Updates are sent as UDP datagrams to the address
+# of every process serving clients, and each of them hands the updates it receives to its own subscriptions. Only
+# processes serving clients bind their address, when the first client subscribes; processes that only publish, such
+# as the WSGI workers and the commands, just send.
+
+class UDPBroker(InMemoryBroker):
+
+    shared = True
+
+    def __init__(self, peers, bind = None):
+        super(UDPBroker, self).__init__()
+        self.peers = [tuple(peer) for peer in peers]
+        self.bind = tuple(bind) if bind is not None else None
+        self.sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.receiver = None
+        self.thread = None
+        self.closed = False
+
+    def subscribe(self, subscription):
+        self.listen()
+        super(UDPBroker, self).subscribe(subscription)
+
+    def listen(self):
+        with self.lock:
+            if self.receiver is not None or self.bind is None:
+                return
+            receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            receiver.settimeout(0.2)
+            receiver.bind(self.bind)
+            self.receiver = receiver
+            self.thread = threading.Thread(target = self.receive, daemon = True)
+        self.thread.start()
+
+    # Receives updates until closed. The timeout lets the thread notice it has been closed and release the address.
+
+    def receive(self):
+        while not self.closed:
+            try:
+                data = self.receiver.recv(65536)
+            except socket.timeout:
+                continue
+            try:
+                event = json.loads(data.decode('utf-8'))
+            except ValueError:
+                logger.warning('Dropped malformed auction update')
+                continue
+            super(UDPBroker, self).publish(event)
+
+    def publish(self, event):
+        data = json.dumps(event).encode('utf-8')
+        for peer in self.peers:
+            try:
+                self.sender.sendto(data, peer)
+            except OSError:
+                logger.exception('Sending an auction update to %s:%s failed', *peer)
+
+    def close(self):
+        self.closed = True
+        if self.thread is not None:
+            self.thread.join()
+            self.receiver.close()
+        self.sender.close()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            config = settings.PUSH
+            _broker = import_string(config['BROKER'])(**config.get('OPTIONS', {}))
+        return _broker
+
+
+def close_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is not None:
+            _broker.close()
+        _broker = None
+
+
+# Refuses a broker that cannot carry updates from the processes placing bids to the one serving the clients.
+
+def check_broker():
+    if not get_broker().shared:
+        raise ImproperlyConfigured(settings.PUSH['BROKER'] + ' only reaches clients of the process publishing, use a broker shared between processes in PUSH')
+
+
+# Publishes the current state of the auction. Call it after the change has been committed.
+
+def publish_auction(auction):
+    get_broker().publish(auction_event(auction))
+
+
+def format_event(event):
+    return 'event: auction\ndata: ' + json.dumps(event) + '\n\n'
+
+
+# Reads the current state of the auctions, in a worker thread.
+
+def snapshot(pks):
+    try:
+        return [auction_event(auction) for auction in Auction.objects.filter(pk__in = pks).only('status', 'price', 'last_bidder', 'deadline')]
+    finally:
+        connection.close()
+
+
+async def wait_for_disconnect(receive):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+
+async def respond(send, status, detail):
+    await send({'type': 'http.response.start', 'status': status, 'headers': [(b'content-type', b'application/json')]})
+    await send({'type': 'http.response.body', 'body': json.dumps({'detail': detail}).encode('utf-8')})
+
+
+# ASGI application streaming the updates of the auctions given as ?auction=<id>&auction=<id>. The current state of
+# every auction is sent first, then every update, with a comment line when there has been nothing to send for a while
+# so that proxies keep the connection open.
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            await send({'type': message['type'] + '.complete'})
+            if message['type'] == 'lifespan.shutdown':
+                return
+    if scope['type'] != 'http' or scope['path'].rstrip('/') != '/events':
+        await respond(send, 404, 'Not found')
+        return
+    pks = parse_qs(scope['query_string'].decode('latin-1')).get('auction', [])
+    if len(pks) == 0 or not all(pk.isdigit() for pk in pks):
+        await respond(send, 400, 'Auction IDs not given')
+        return
+    if len(set(pks)) > settings.PUSH['MAX_AUCTIONS']:
+        await respond(send, 400, 'At most ' + str(settings.PUSH['MAX_AUCTIONS']) + ' auctions can be watched at once')
+        return
+    broker = get_broker()
+    subscription = Subscription(pks)
+    broker.subscribe(subscription)
+    disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+    try:
+        for event in await asyncio.get_event_loop().run_in_executor(None, snapshot, [int(pk) for pk in pks]):
+            subscription.offer(event)
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+        ]})
+        while True:
+            updates = asyncio.ensure_future(subscription.get())
+            done, pending = await asyncio.wait([updates, disconnected], timeout = settings.PUSH['KEEPALIVE'], return_when = asyncio.FIRST_COMPLETED)
+            if disconnected in done:
+                updates.cancel()
+                return
+            if updates in done:
+                body = ''.join(format_event(event) for event in updates.result())
+            else:
+                updates.cancel()
+                body = ': keepalive\n\n'
+            await send({'type': 'http.response.body', 'body': body.encode('utf-8'), 'more_body': True})
+    finally:
+        disconnected.cancel()
+        broker.unsubscribe(subscription)
@@ -0,0 +1,135 @@
+import json
+import logging
+import threading
+import time
+import urllib.request
+from functools import lru_cache
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+
+from . import metrics
+
+
+logger = logging.getLogger(__name__)
+
+RATES_KEY = 'auction:rates'
+REFRESH_LOCK_KEY = 'auction:rates:refreshing'
+REFRESH_THREAD = 'auction-rates-refresh'
+
+
+# Snapshot of exchange rates relative to USD. Snapshots are compared by the time they were fetched, so conversions
+# can be memoized per snapshot.
+
+class RateTable(object):
+
+    def __init__(self, rates, fetched):
+        self.rates = rates
+        self.fetched = fetched
+        
+    def __eq__(self, other):
+        return isinstance(other, RateTable) and self.fetched == other.fetched
+        
+    def __hash__(self):
+        return hash(self.fetched)
+        
+    def age(self):
+        return time.time() - self.fetched
+        
+        
+# Backend fetching the rates from openexchangerates.org.
+
+class OpenExchangeRatesBackend(object):
+
+    def __init__(self, url, timeout = 10):
+        self.url = url
+        self.timeout = timeout
+        
+    def fetch(self):
+        with metrics.timed('http'):
+            response = urllib.request.urlopen(self.url, timeout = self.timeout)
+            return json.loads(response.read().decode('utf-8'))['rates']
+        
+        
+# Backend reading the rates from a local file in the openexchangerates.org format. Used by tests and offline deployments.
+
+class FileBackend(object):
+
+    def __init__(self, path):
+        self.path = path
+        
+    def fetch(self):
+        with open(self.path) as rates_file:
+            return json.load(rates_file)['rates']
+            
+            
+def get_backend():
+    config = settings.CURRENCY_RATES
+    return import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+    
+    
+# Last good table seen by this process. The cached table can still be evicted, or lost with the cache, so the process
+# keeps its own copy to fall back on while the upstream is down.
+
+_last_table = None
+
+
+def remember(table):
+    global _last_table
+    if table is not None and (_last_table is None or table.fetched > _last_table.fetched):
+        _last_table = table
+    return _last_table
+    
+    
+# Fetches a new rate table and stores it in the cache. The cached table never expires, so if the upstream is down the
+# last known table keeps being served.
+
+def refresh():
+    try:
+        table = RateTable(get_backend().fetch(), time.time())
+        cache.set(RATES_KEY, table, None)
+        remember(table)
+        return table
+    except Exception:
+        logger.exception('Fetching currency rates failed')
+        return None
+        
+        
+# Refresh started by schedule_refresh, which releases the lock taken there. Refreshes started elsewhere, such as by
+# the refreshrates command, never took the lock and leave it to its holder.
+
+def refresh_locked():
+    try:
+        return refresh()
+    finally:
+        cache.delete(REFRESH_LOCK_KEY)
+    
+    
+# Starts a background refresh unless one is already running in some process sharing the cache.
+
+def schedule_refresh():
+    if not cache.add(REFRESH_LOCK_KEY, True, settings.CURRENCY_RATES.get('REFRESH_TIMEOUT', 60)):
+        return None
+    thread = threading.Thread(target = refresh_locked, name = REFRESH_THREAD, daemon = True)
+    thread.start()
+    return thread
+    
+    
+# Returns the cached rate table without ever waiting for the network. A missing or stale table is refreshed in the
+# background, and a stale table, or the last one this process saw if the cache lost it, is served until then. Returns
+# None if no table has been fetched yet.
+
+def get_rates():
+    cached = cache.get(RATES_KEY)
+    table = remember(cached)
+    if cached is None or table.age() > settings.CURRENCY_RATES.get('TTL', 3600):
+        schedule_refresh()
+    return table
+    
+    
+# Converts a price in euros to every currency of the table. Computed once per price and table.
+
+@lru_cache(maxsize = 1024)
+def convert(table, price):
+    usd = float(price) / float(table.rates['EUR'])
+    return {key: format(usd * float(rate), '.2f') for key, rate in table.rates.items()}
@@ -0,0 +1,80 @@
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import caching, database, push, search
+from .models import Auction
+from .notifications import enqueue_mails
+
+
+# Auctions at or past their deadline that are still active. Served by the (status, deadline) index.
+
+def due_auctions(now):
+    return Auction.objects.filter(status = Auction.ACTIVE, deadline__lte = now).order_by('deadline')
+    
+    
+# Deadline of the active auction ending first, or None if there are no active auctions.
+
+def next_deadline():
+    return Auction.objects.filter(status = Auction.ACTIVE).order_by('deadline').values_list('deadline', flat = True).first()
+    
+    
+# Resolves the given auctions and queues the mails about them, with one query per step for the whole chunk.
+# Auctions that are no longer active are left alone, and the dedup keys keep a worker that resolved the same auction
+# concurrently from queueing its mail twice. Returns the number of auctions resolved.
+
+def resolve_auctions(auctions):
+    pks = [auction.pk for auction in auctions]
+    resolved = Auction.objects.filter(pk__in = pks, status = Auction.ACTIVE).update(status = Auction.ADJUDICATED, modified = timezone.now())
+    if resolved == 0:
+        return 0
+    search.set_status(pks, Auction.ADJUDICATED)
+    seller_mails = dict(User.objects.filter(username__in = [auction.seller for auction in auctions]).values_list('username', 'email'))
+    bidder_mails = {}
+    for auction_pk, email in Auction.bidders.through.objects.filter(auction_id__in = pks).values_list('auction_id', 'user__email'):
+        bidder_mails.setdefault(auction_pk, []).append(email)
+    mails = []
+    for auction in auctions:
+        if auction.last_bidder == '':
+            mails.append(('Auction resolved', 'Auction ' + auction.title + ' has been resolved. There were no bids.', 'pengstro@abo.fi', [seller_mails.get(auction.seller, '')], 'resolve:' + str(auction.pk)))
+        else:
+            mails.append(('Auction resolved', 'Auction ' + auction.title + ' has been resolved. The winner is ' + auction.last_bidder + '.', 'pengstro@abo.fi', bidder_mails.get(auction.pk, []), 'resolve:' + str(auction.pk)))
+    enqueue_mails(mails)
+    return resolved
+    
+    
+# Claims and resolves up to chunk_size due auctions in one transaction, only among the given pks if any. Where the
+# database supports it, rows claimed by another worker are skipped instead of waited for. SQLite has no row locks, so
+# there the database is locked for writing first. Returns the number of auctions claimed and resolved.
+
+def resolve_due_chunk(now, chunk_size, pks = None):
+    with transaction.atomic():
+        database.lock_for_write()
+        due = due_auctions(now).only('pk', 'title', 'seller', 'price', 'last_bidder', 'deadline')
+        if pks is not None:
+            due = due.filter(pk__in = pks)
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked = True)
+        auctions = list(due[:chunk_size])
+        if len(auctions) == 0:
+            return 0, 0
+        resolved = resolve_auctions(auctions)
+    if resolved > 0:
+        caching.bump_list_version()
+        for auction in auctions:
+            auction.status = Auction.ADJUDICATED
+            caching.bump_auction_version(auction.pk)
+            push.publish_auction(auction)
+    return len(auctions), resolved
+        
+        
+# Resolves all auctions due at the given time in chunks. Returns the number resolved.
+
+def resolve_due(now = None, chunk_size = 500):
+    now = now if now is not None else timezone.now()
+    total = 0
+    while True:
+        claimed, resolved = resolve_due_chunk(now, chunk_size)
+        if claimed == 0:
+            return total
+        total += resolved
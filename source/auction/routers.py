@@ -0,0 +1,80 @@
+import random
+import threading
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+
+_local = threading.local()
+
+PIN_COOKIE = 'primary_db'
+
+# Models of the auction app read from the primary even in replica-backed views: tokens, checked before the view runs,
+# and the queues the bid and mail workers take their work from.
+
+PRIMARY_MODELS = set(['apitoken', 'notification', 'queuedbid'])
+
+
+# Read replicas. Views marked with replica_reads read auction data from one of the databases in
+# settings.DATABASE_REPLICAS, picked once per request; everything else, writes included, goes to the primary. Users
+# and sessions, which belong to other apps, and the models in PRIMARY_MODELS are always read from the primary, so that
+# a fresh login, registration or API token is never missed.
+#
+# Replicas lag behind the primary, so a user who has just bid would not see the bid if the next page were read from a
+# replica. Once a request writes, the rest of it reads from the primary, and the response sets a cookie keeping the
+# user's reads on the primary for settings.REPLICA_PIN_SECONDS. API clients get the same cookie and have to send it
+# back to see their own writes in replica-backed endpoints.
+
+class ReplicaRouter(object):
+
+    def db_for_read(self, model, **hints):
+        replica = getattr(_local, 'replica', None)
+        if replica is not None and model._meta.app_label == 'auction' and model._meta.model_name not in PRIMARY_MODELS:
+            return replica
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        _local.replica = None
+        _local.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+# Middleware choosing the database of the request's reads, and pinning the user to the primary after a write. Should
+# come after the authentication middleware, so that writes to the session are not taken for the user's own.
+
+class ReplicaMiddleware(object):
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _local.replica = None
+        _local.wrote = False
+        try:
+            response = self.get_response(request)
+            wrote = _local.wrote
+        finally:
+            _local.replica = None
+            _local.wrote = False
+        if wrote and len(settings.DATABASE_REPLICAS) != 0:
+            response.set_cookie(PIN_COOKIE, '1', max_age = settings.REPLICA_PIN_SECONDS, httponly = True)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'view_class', None)
+        if request.method in ('GET', 'HEAD') and getattr(view_class, 'replica_reads', False) and not _local.wrote:
+            _local.replica = choose_replica(request)
+        return None
+
+
+# Replica to read the request's auction data from, or None if the user is pinned to the primary or there are none.
+
+def choose_replica(request):
+    if PIN_COOKIE in request.COOKIES or len(settings.DATABASE_REPLICAS) == 0:
+        return None
+    return random.choice(settings.DATABASE_REPLICAS)
@@ -0,0 +1,152 @@
+import heapq
+import logging
+import threading
+from django.utils import timezone
+
+from .models import Auction
+from .resolution import resolve_due_chunk
+
+
+logger = logging.getLogger(__name__)
+
+_running = None
+
+
+# Scheduler resolving each auction at its deadline, instead of scanning for due auctions at intervals. Deadlines are
+# kept in a heap, with the latest deadline of every auction in a dict; heap entries that no longer match the dict are
+# skipped when they come up, so moving a deadline costs one push.
+#
+# The database stays the source of truth. The heap is seeded from it on start, so nothing is lost on restart and
+# auctions that became due while the scheduler was down are resolved at once. Deadlines moved or auctions created in
+# other processes are not seen directly: when an entry comes up the auction is only resolved if it is due in the
+# database, and otherwise rescheduled at its real deadline. Since deadlines only move later, a stale entry costs an
+# extra query but never resolves an auction early. New auctions are picked up by polling for ids above the highest
+# one seen, which is cheap and punctual enough as auctions run for at least three days.
+
+class DeadlineScheduler(object):
+
+    def __init__(self, clock = timezone.now, chunk_size = 500):
+        self.clock = clock
+        self.chunk_size = chunk_size
+        self.heap = []
+        self.deadlines = {}
+        self.last_pk = 0
+        self.condition = threading.Condition()
+        self.stopped = False
+
+    def __len__(self):
+        return len(self.deadlines)
+
+    # Adds the active auctions not seen yet. Call it on start and then now and then.
+
+    def seed(self):
+        auctions = Auction.objects.filter(status = Auction.ACTIVE, pk__gt = self.last_pk).order_by('pk').values_list('pk', 'deadline')
+        while True:
+            chunk = list(auctions.filter(pk__gt = self.last_pk)[:5000])
+            if len(chunk) == 0:
+                return
+            for pk, deadline in chunk:
+                self.schedule(pk, deadline)
+            self.last_pk = chunk[-1][0]
+
+    def schedule(self, pk, deadline):
+        with self.condition:
+            self.deadlines[pk] = deadline
+            heapq.heappush(self.heap, (deadline, pk))
+            self.last_pk = max(self.last_pk, pk)
+            if self.heap[0] == (deadline, pk):
+                self.condition.notify_all()
+
+    def cancel(self, pk):
+        with self.condition:
+            self.deadlines.pop(pk, None)
+
+    # Earliest deadline, or None if nothing is scheduled.
+
+    def next_deadline(self):
+        with self.condition:
+            while len(self.heap) != 0 and self.deadlines.get(self.heap[0][1]) != self.heap[0][0]:
+                heapq.heappop(self.heap)
+            return self.heap[0][0] if len(self.heap) != 0 else None
+
+    # Removes and returns the auctions with a deadline at or before now, the ones resolution.due_auctions finds due.
+
+    def pop_due(self, now):
+        pks = []
+        with self.condition:
+            while len(self.heap) != 0 and self.heap[0][0] <= now:
+                deadline, pk = heapq.heappop(self.heap)
+                if self.deadlines.get(pk) == deadline:
+                    del self.deadlines[pk]
+                    pks.append(pk)
+        return pks
+
+    # Resolves the auctions that are due by the clock. Auctions that turn out not to be due yet are rescheduled at
+    # their deadline in the database. Returns the number of auctions resolved.
+
+    def run_pending(self):
+        now = self.clock()
+        pks = self.pop_due(now)
+        resolved = 0
+        for start in range(0, len(pks), self.chunk_size):
+            chunk = pks[start:start + self.chunk_size]
+            claimed, count = resolve_due_chunk(now, self.chunk_size, chunk)
+            resolved += count
+            if claimed < len(chunk):
+                for pk, deadline in Auction.objects.filter(pk__in = chunk, status = Auction.ACTIVE, deadline__gt = now).values_list('pk', 'deadline'):
+                    self.schedule(pk, deadline)
+        return resolved
+
+    # Resolves auctions as they become due until stop is called. Sleeps until the next deadline, or at most poll
+    # seconds, after which new auctions are looked for.
+
+    def run(self, poll = 10.0, on_resolved = None):
+        self.seed()
+        while not self.stopped:
+            try:
+                resolved = self.run_pending()
+                if resolved > 0 and on_resolved is not None:
+                    on_resolved(resolved)
+                self.seed()
+            except Exception:
+                logger.exception('Resolving due auctions failed')
+            with self.condition:
+                if self.stopped:
+                    return
+                deadline = self.next_deadline()
+                timeout = poll if deadline is None else min(max((deadline - self.clock()).total_seconds(), 0), poll)
+                self.condition.wait(timeout)
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+
+
+# Makes the scheduler the one told about deadline changes in this process.
+
+def register(scheduler):
+    global _running
+    _running = scheduler
+
+
+def unregister(scheduler):
+    global _running
+    if _running is scheduler:
+        _running = None
+
+
+# Tells the scheduler running in this process, if any, that the deadline of the auction has moved.
+
+def deadline_changed(pk, deadline):
+    if _running is not None:
+        _running.schedule(pk, deadline)
+
+
+def auction_saved(sender, instance, created = False, raw = False, **kwargs):
+    if _running is None or raw:
+        return
+    if instance.is_active():
+        _running.schedule(instance.pk, instance.deadline)
+    else:
+        _running.cancel(instance.pk)
@@ -0,0 +1,171 @@
+import operator
+import re
+from functools import reduce
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import Case, IntegerField, Max, Q, Sum, When
+
+from .models import Auction, SearchTerm
+
+
+# Full-text search over auction titles and item descriptions. On SQLite with FTS5 the index is an FTS5 table, elsewhere
+# it is the SearchTerm table. Both support prefix matching of every word of the query, ranking with title matches
+# weighing more, and filtering by status inside the index query. The index is updated when an auction is saved, and
+# by index_auctions and set_status after changes made with update().
+
+FTS_TABLE = 'auction_search'
+TITLE_WEIGHT = 10
+DESCRIPTION_WEIGHT = 1
+
+
+def tokenize(text):
+    return [word[:100] for word in re.findall(r'\w+', text.lower())]
+
+
+# Terms of an auction with their weights.
+
+def auction_terms(title, item_description):
+    weights = {}
+    for word in tokenize(title):
+        weights[word] = weights.get(word, 0) + TITLE_WEIGHT
+    for word in tokenize(item_description):
+        weights[word] = weights.get(word, 0) + DESCRIPTION_WEIGHT
+    return weights
+
+
+# Whether FTS5 can be used on the given connection.
+
+def fts5_available(connection):
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        return cursor.fetchone()[0] == 1
+
+
+# Search index in an FTS5 table, with the auction id as rowid.
+
+class FTSSearchBackend(object):
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def index(self, auctions):
+        auctions = list(auctions)
+        if len(auctions) == 0:
+            return
+        with self.connection.cursor() as cursor:
+            cursor.execute('DELETE FROM auction_search WHERE rowid IN (' + ', '.join(['%s'] * len(auctions)) + ')', [auction.pk for auction in auctions])
+            cursor.executemany('INSERT INTO auction_search(rowid, title, item_description, status) VALUES (%s, %s, %s, %s)', [(auction.pk, auction.title, auction.item_description, auction.status) for auction in auctions])
+
+    def set_status(self, pks, status):
+        pks = list(pks)
+        if len(pks) == 0:
+            return
+        with self.connection.cursor() as cursor:
+            cursor.execute('UPDATE auction_search SET status = %s WHERE rowid IN (' + ', '.join(['%s'] * len(pks)) + ')', [status] + pks)
+
+    def rebuild(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute('DELETE FROM auction_search')
+            cursor.execute('INSERT INTO auction_search(rowid, title, item_description, status) SELECT id, title, item_description, status FROM auction_auction')
+
+    def search(self, words, status, limit):
+        sql = 'SELECT rowid FROM auction_search WHERE auction_search MATCH %s'
+        params = [' '.join('"' + word + '"*' for word in words)]
+        if status is not None:
+            sql += ' AND status = %s'
+            params.append(status)
+        sql += ' ORDER BY bm25(auction_search, %s, %s), rowid LIMIT %s'
+        params.extend([TITLE_WEIGHT, DESCRIPTION_WEIGHT, limit if limit is not None else -1])
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [row[0] for row in cursor.fetchall()]
+
+
+# Search index in the SearchTerm table, for databases without FTS5. Prefix matches use the index on the term.
+
+class TermSearchBackend(object):
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def index(self, auctions):
+        auctions = list(auctions)
+        SearchTerm.objects.using(self.connection.alias).filter(auction_id__in = [auction.pk for auction in auctions]).delete()
+        terms = []
+        for auction in auctions:
+            for term, weight in auction_terms(auction.title, auction.item_description).items():
+                terms.append(SearchTerm(auction_id = auction.pk, term = term, weight = weight, status = auction.status))
+        SearchTerm.objects.using(self.connection.alias).bulk_create(terms, batch_size = 1000)
+
+    def set_status(self, pks, status):
+        SearchTerm.objects.using(self.connection.alias).filter(auction_id__in = pks).update(status = status)
+
+    def rebuild(self):
+        SearchTerm.objects.using(self.connection.alias).all().delete()
+        auctions = Auction.objects.using(self.connection.alias).only('pk', 'title', 'item_description', 'status').order_by('pk')
+        last_pk = 0
+        while True:
+            chunk = list(auctions.filter(pk__gt = last_pk)[:1000])
+            if len(chunk) == 0:
+                break
+            self.index(chunk)
+            last_pk = chunk[-1].pk
+
+    def search(self, words, status, limit):
+        terms = SearchTerm.objects.using(self.connection.alias).filter(reduce(operator.or_, [Q(term__startswith = word) for word in words]))
+        if status is not None:
+            terms = terms.filter(status = status)
+        matches = {}
+        for i, word in enumerate(words):
+            matches['match' + str(i)] = Max(Case(When(term__startswith = word, then = 1), default = 0, output_field = IntegerField()))
+        ranked = terms.values('auction_id').annotate(rank = Sum('weight'), **matches).filter(**{name: 1 for name in matches}).order_by('-rank', 'auction_id')
+        if limit is not None:
+            ranked = ranked[:limit]
+        return [row['auction_id'] for row in ranked]
+
+
+def get_backend(using):
+    connection = connections[using]
+    if not hasattr(connection, 'search_backend'):
+        connection.search_backend = FTSSearchBackend(connection) if FTS_TABLE in connection.introspection.table_names() else TermSearchBackend(connection)
+    return connection.search_backend
+
+
+# Returns the ids of the auctions matching every word of the query, best match first. Words match as prefixes. With a
+# status of None auctions of every status are returned.
+
+def search(query, status = Auction.ACTIVE, limit = None):
+    words = sorted(set(tokenize(query)))
+    if len(words) == 0:
+        return []
+    return get_backend(router.db_for_read(Auction)).search(words, status, limit if limit is not None else settings.SEARCH_RESULT_LIMIT)
+
+
+# Same as search, but returns the auctions.
+
+def search_auctions(query, status = Auction.ACTIVE, limit = None):
+    pks = search(query, status, limit)
+    auctions = Auction.objects.in_bulk(pks)
+    return [auctions[pk] for pk in pks if pk in auctions]
+
+
+# Updates the index after changes made without saving the auction, like description edits and status updates.
+
+def index_auctions(pks):
+    using = router.db_for_write(Auction)
+    get_backend(using).index(Auction.objects.using(using).filter(pk__in = pks).only('pk', 'title', 'item_description', 'status'))
+
+
+def set_status(pks, status):
+    get_backend(router.db_for_write(Auction)).set_status(pks, status)
+
+
+def rebuild():
+    get_backend(router.db_for_write(Auction)).rebuild()
+
+
+def auction_saved(sender, instance, raw = False, using = None, **kwargs):
+    if not raw:
+        get_backend(using).index([instance])
@@ -0,0 +1,96 @@
+import logging
+import threading
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import caching, database, push, scheduler
+from .models import Auction, QueuedBid
+from .views import BidRejected, enqueue_bid_mails, place_bid, rejection_response, track_placed
+
+
+logger = logging.getLogger(__name__)
+
+
+# Sequenced bidding. With settings.BID_QUEUE['ENABLED'] the bid API stores bids as queued bids instead of placing
+# them, and sequencers place them in the order they arrived with the same rules as any other bid. The auctions are
+# split into shards by id, and each shard has one sequencer, so every auction has a single writer and its bids never
+# race for the auction row. Bids are placed in batches, one transaction per batch, so that many bids share one
+# commit; the mails, cache and watchers are told about the batch after it commits, once per auction.
+#
+# A sequencer that finds the bids it would place already taken by another process running the same shard skips them,
+# so a misconfigured deployment places bids more slowly but never twice.
+
+class Sequencer(object):
+
+    def __init__(self, shard = 0, shards = 1, batch_size = 100):
+        self.shard = shard
+        self.shards = shards
+        self.batch_size = batch_size
+        self.condition = threading.Condition()
+        self.stopped = False
+
+    # Waiting bids of the shard, oldest first. Where the database supports it, bids taken by another sequencer are
+    # skipped instead of waited for.
+
+    def pending(self):
+        queued = QueuedBid.objects.filter(status = QueuedBid.PENDING).order_by('id')
+        if self.shards > 1:
+            queued = queued.annotate(shard = F('auction_id') % self.shards).filter(shard = self.shard)
+        if connection.features.has_select_for_update_skip_locked:
+            queued = queued.select_for_update(skip_locked = True)
+        return list(queued[:self.batch_size])
+
+    # Places one batch of waiting bids. Returns the number of bids placed or rejected.
+
+    def run_pending(self):
+        placed = {}
+        with transaction.atomic():
+            database.lock_for_write()
+            queued = self.pending()
+            if len(queued) == 0:
+                return 0
+            auctions = Auction.objects.in_bulk(set(item.auction_id for item in queued))
+            bidders = User.objects.in_bulk(set(item.bidder_id for item in queued))
+            deadlines = dict((pk, auction.deadline) for pk, auction in auctions.items())
+            for item in queued:
+                self.place(item, auctions[item.auction_id], bidders[item.bidder_id], placed)
+            enqueue_bid_mails(placed)
+        for auction, usernames, bids in placed.values():
+            caching.bump_auction_version(auction.pk)
+            push.publish_auction(auction)
+            if auction.deadline != deadlines[auction.pk]:
+                scheduler.deadline_changed(auction.pk, auction.deadline)
+        return len(queued)
+
+    def place(self, item, auction, bidder, placed):
+        try:
+            bid_object, previous_bidder = place_bid(auction, item.amount, bidder, notify = False, publish = False)
+        except BidRejected as error:
+            status, detail = rejection_response(error)
+            QueuedBid.objects.filter(pk = item.pk).update(status = QueuedBid.REJECTED, detail = detail, processed = timezone.now())
+            return
+        track_placed(placed, auction, bid_object, bidder, previous_bidder)
+        QueuedBid.objects.filter(pk = item.pk).update(status = QueuedBid.ACCEPTED, bid = bid_object, processed = timezone.now())
+
+    # Places bids as they arrive until stop is called, looking for new ones every poll seconds when idle.
+
+    def run(self, poll = 0.05, on_placed = None):
+        while not self.stopped:
+            try:
+                count = self.run_pending()
+                if count > 0 and on_placed is not None:
+                    on_placed(count)
+            except Exception:
+                logger.exception('Placing queued bids failed')
+                count = 0
+            if count < self.batch_size:
+                with self.condition:
+                    if not self.stopped:
+                        self.condition.wait(poll)
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
@@ -1,13 +1,39 @@
+import asyncio
+import base64
+import io
+import json
+import os
 import pytz
+import shutil
+import socket
+import threading
+import time
 from datetime import timedelta
 from decimal import Decimal
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.core import mail, serializers
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.mail.backends import locmem
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import OperationalError, connection, connections, reset_queries, router, transaction
+from django.db.models import Q
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
+from django.utils.http import urlencode
+from django.utils.module_loading import import_string
 
-from .models import Auction
-from .views import NewAuctionView
+from . import async_api, benchmark, caching, database, datagen, metrics, push, rates, routers, scheduler, search, sequencer, throttling, tokens
+from .models import APIToken, Auction, Bid, Notification, ProxyBid, QueuedBid
+from .notifications import enqueue_mail, send_batch
+from .export import export_rows
+from .pagination import encode_cursor
+from .resolution import resolve_due
+from .views import NewAuctionView, BidTooLow, bid, place_bid, proxy_bid, track_placed
 
 
 class CreateAuctionTests(TestCase):
@@ -219,4 +245,1728 @@ class ConcurrencyTests(TestCase):
         auction.price = old_price + Decimal('0.01')
         auction.save()
         self.client.post(reverse('auction:bid', kwargs = {'pk': auction.id}), {'item_description': auction.item_description, 'price': old_price + Decimal('0.01')})
-        self.assertEqual(Auction.objects.get(pk = auction.id).last_bidder, '')
\ No newline at end of file
+        self.assertEqual(Auction.objects.get(pk = auction.id).last_bidder, '')
+        
+        
+class ParallelBidTests(TransactionTestCase):
+
+    def test_parallel_bidders(self):
+        """
+        Many parallel bids on one auction lose no updates and none of them waits for long.
+        """
+        User.objects.create_user('user1', 'user1@example.com', 'very_easy_password')
+        auction = Auction(seller = 'user1', title = 'Auction title', item_description = 'Item description.', price = Decimal('0.00'), deadline = timezone.now() + timedelta(days = 30))
+        auction.save()
+        bidders = [User.objects.create_user('bidder' + str(i), 'bidder' + str(i) + '@example.com', 'very_easy_password') for i in range(20)]
+        accepted = []
+        rejected = []
+        latencies = []
+        
+        def place_bid(bidder, amount):
+            start = time.time()
+            try:
+                accepted.append(bid(auction, amount, bidder).amount)
+            except BidTooLow:
+                rejected.append(amount)
+            finally:
+                latencies.append(time.time() - start)
+                connection.close()
+                
+        threads = [threading.Thread(target = place_bid, args = (bidder, Decimal(i + 1))) for i, bidder in enumerate(bidders)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        auction = Auction.objects.get(pk = auction.pk)
+        self.assertEqual(len(accepted) + len(rejected), len(bidders))
+        self.assertEqual(auction.price, Decimal(len(bidders)))
+        self.assertEqual(auction.price, max(accepted))
+        self.assertEqual(auction.bid_set.count(), len(accepted))
+        self.assertEqual(auction.last_bidder, 'bidder' + str(len(bidders) - 1))
+        self.assertLess(max(latencies), 5)
+
+        
+        
+RATES_FIXTURE = os.path.join(settings.BASE_DIR, 'auction', 'fixtures', 'exchange_rates.json')
+
+
+@override_settings(CURRENCY_RATES = {'BACKEND': 'auction.rates.FileBackend', 'OPTIONS': {'path': RATES_FIXTURE}, 'TTL': 3600})
+class CurrencyRateTests(TestCase):
+
+    def setUp(self):
+        # Refreshes started by earlier tests would fill the cache again.
+        for thread in threading.enumerate():
+            if thread.name == rates.REFRESH_THREAD:
+                thread.join()
+        cache.clear()
+        rates._last_table = None
+        User.objects.create_user('user1', 'user1@example.com', 'very_easy_password')
+        self.auction = Auction(seller = 'user1', title = 'Auction title', item_description = 'Item description.', price = Decimal('10.00'), deadline = timezone.now() + timedelta(days = 30))
+        self.auction.save()
+        
+    def wait_for_rates(self):
+        for i in range(50):
+            if cache.get(rates.RATES_KEY) is not None:
+                return cache.get(rates.RATES_KEY)
+            time.sleep(0.1)
+        self.fail('The rates were not refreshed')
+        
+    def test_rates_from_cache(self):
+        """
+        The detail page converts the price with the cached rates.
+        """
+        rates.refresh()
+        response = self.client.get(reverse('detail', kwargs = {'pk': self.auction.pk}))
+        self.assertEqual(response.context['currencies']['SEK'], '100.00')
+        self.assertEqual(response.context['currencies']['USD'], '12.50')
+        
+    def test_missing_rates(self):
+        """
+        Without cached rates the detail page is rendered without conversions, and the rates are fetched in the background.
+        """
+        response = self.client.get(reverse('detail', kwargs = {'pk': self.auction.pk}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['currencies'], {})
+        self.assertEqual(self.wait_for_rates().rates['SEK'], 8.0)
+        
+    def test_upstream_down(self):
+        """
+        If fetching new rates fails, the last known rates are still served.
+        """
+        table = rates.refresh()
+        with self.settings(CURRENCY_RATES = {'BACKEND': 'auction.rates.FileBackend', 'OPTIONS': {'path': RATES_FIXTURE + '.missing'}, 'TTL': 0}), self.assertLogs('auction.rates', 'ERROR'):
+            self.assertIsNone(rates.refresh())
+            self.assertEqual(rates.get_rates(), table)
+            response = self.client.get(reverse('detail', kwargs = {'pk': self.auction.pk}))
+            while cache.get(rates.REFRESH_LOCK_KEY) is not None:
+                time.sleep(0.1)
+        self.assertEqual(response.context['currencies']['SEK'], '100.00')
+        
+    def test_evicted(self):
+        """
+        If the cached rates are evicted while the upstream is down, the last known rates are still served.
+        """
+        table = rates.refresh()
+        cache.delete(rates.RATES_KEY)
+        with self.settings(CURRENCY_RATES = {'BACKEND': 'auction.rates.FileBackend', 'OPTIONS': {'path': RATES_FIXTURE + '.missing'}}), self.assertLogs('auction.rates', 'ERROR'):
+            response = self.client.get(reverse('detail', kwargs = {'pk': self.auction.pk}))
+            while cache.get(rates.REFRESH_LOCK_KEY) is not None:
+                time.sleep(0.1)
+        self.assertEqual(response.context['currencies']['SEK'], '100.00')
+        self.assertEqual(rates.get_rates(), table)
+        
+    def test_refresh_keeps_lock(self):
+        """
+        A refresh not started in the background leaves the lock of a background refresh alone.
+        """
+        cache.add(rates.REFRESH_LOCK_KEY, True, 60)
+        call_command('refreshrates', stdout = io.StringIO())
+        self.assertEqual(cache.get(rates.REFRESH_LOCK_KEY), True)
+        self.assertIsNone(rates.schedule_refresh())
+        
+    def test_conversion_memoized(self):
+        """
+        A price is converted only once per rate table.
+        """
+        table = rates.refresh()
+        self.assertIs(rates.convert(table, Decimal('10.00')), rates.convert(table, Decimal('10.00')))
+
+        
+        
+class BidderTests(TestCase):
+
+    def setUp(self):
+        User.objects.create_user('user1', 'user1@example.com', 'very_easy_password')
+        self.auction = Auction(seller = 'user1', title = 'Auction title', item_description = 'Item description.', price = Decimal('0.00'), deadline = timezone.now() + timedelta(days = 30))
+        self.auction.save()
+        self.bidders = [User.objects.create_user('bidder' + str(i), 'bidder' + str(i) + '@example.com', 'very_easy_password') for i in range(10)]
+        
+    def test_bidders_recorded(self):
+        """
+        Every bidder is recorded once, however many bids they make.
+        """
+        for i, bidder in enumerate(self.bidders + self.bidders):
+            bid(self.auction, Decimal(i + 1), bidder)
+        self.assertEqual(sorted(self.auction.bidders.values_list('username', flat = True)), sorted(bidder.username for bidder in self.bidders))
+        
+    def test_bidder_mails_in_one_query(self):
+        """
+        The mail addresses of all bidders are fetched in one query.
+        """
+        for i, bidder in enumerate(self.bidders):
+            bid(self.auction, Decimal(i + 1), bidder)
+        with self.assertNumQueries(1):
+            mails = self.auction.get_bidder_mails()
+        self.assertEqual(sorted(mails), sorted(bidder.email for bidder in self.bidders))
+        
+    def test_ban_notifies_participants(self):
+        """
+        Banning an auction notifies the seller and every bidder.
+        """
+        for i, bidder in enumerate(self.bidders):
+            bid(self.auction, Decimal(i + 1), bidder)
+        User.objects.create_user('staff', 'staff@example.com', 'very_easy_password', is_staff = True)
+        self.client.login(username = 'staff', password = 'very_easy_password')
+        send_batch()
+        mail.outbox = []
+        self.client.get(reverse('auction:ban', kwargs = {'pk': self.auction.pk}))
+        send_batch()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(sorted(mail.outbox[0].to), sorted(['user1@example.com'] + [bidder.email for bidder in self.bidders]))
+
+        
+        
+# Mail backends for the outbox tests.
+
+class CountingEmailBackend(locmem.EmailBackend):
+
+    opened = 0
+    
+    def open(self):
+        CountingEmailBackend.opened += 1
+        return super(CountingEmailBackend, self).open()
+        
+        
+class FailingEmailBackend(locmem.EmailBackend):
+
+    def send_messages(self, messages):
+        raise ConnectionRefusedError
+        
+        
+class NotificationTests(TestCase):
+
+    def setUp(self):
+        User.objects.create_user('user1', 'user1@example.com', 'very_easy_password')
+        self.auction = Auction(seller = 'user1', title = 'Auction title', item_description = 'Item description.', price = Decimal('0.00'), deadline = timezone.now() + timedelta(days = 30))
+        self.auction.save()
+        self.bidder = User.objects.create_user('user2', 'user2@example.com', 'very_easy_password')
+        
+    def test_bid_enqueues_mail(self):
+        """
+        A bid is answered without sending mail. The mail is sent from the outbox afterwards.
+        """
+        bid(self.auction, Decimal('1.00'), self.bidder)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(Notification.objects.filter(sent__isnull = True).count(), 1)
+        self.assertEqual(send_batch(), (1, 0))
+        self.assertEqual(sorted(mail.outbox[0].to), ['user1@example.com', 'user2@example.com'])
+        self.assertEqual(send_batch(), (0, 0))
+        
+    def test_dedup_key(self):
+        """
+        A mail with a dedup key already in the outbox is not added again.
+        """
+        enqueue_mail('Subject', 'Message.', 'pengstro@abo.fi', ['user1@example.com'], dedup_key = 'key')
+        enqueue_mail('Subject', 'Message.', 'pengstro@abo.fi', ['user1@example.com'], dedup_key = 'key')
+        self.assertEqual(Notification.objects.count(), 1)
+        
+    @override_settings(EMAIL_BACKEND = 'auction.tests.CountingEmailBackend')
+    def test_batch_over_one_connection(self):
+        """
+        A batch of mails is sent over one connection.
+        """
+        CountingEmailBackend.opened = 0
+        for i in range(10):
+            enqueue_mail('Subject', 'Message.', 'pengstro@abo.fi', ['user1@example.com'])
+        self.assertEqual(send_batch(), (10, 0))
+        self.assertEqual(CountingEmailBackend.opened, 1)
+        self.assertEqual(len(mail.outbox), 10)
+        
+    def test_retry_with_backoff(self):
+        """
+        A mail that could not be sent is retried later, with a growing delay.
+        """
+        notification = enqueue_mail('Subject', 'Message.', 'pengstro@abo.fi', ['user1@example.com'])
+        with self.settings(EMAIL_BACKEND = 'auction.tests.FailingEmailBackend'):
+            self.assertEqual(send_batch(), (0, 1))
+        notification = Notification.objects.get(pk = notification.pk)
+        self.assertEqual(notification.attempts, 1)
+        self.assertGreater(notification.next_attempt, timezone.now() + timedelta(seconds = settings.NOTIFICATION_RETRY_DELAY - 5))
+        self.assertEqual(send_batch(), (0, 0))
+        Notification.objects.filter(pk = notification.pk).update(next_attempt = timezone.now())
+        self.assertEqual(send_batch(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+
+        
+        
+class ResolveTests(TestCase):
+
+    def setUp(self):
+        User.objects.create_user('user1', 'user1@example.com', 'very_easy_password')
+        self.bidder = User.objects.create_user('user2', 'user2@example.com', 'very_easy_password')
+        
+    def create_auctions(self, count, deadline, status = Auction.ACTIVE):
+        auctions = []
+        for i in range(count):
+            auction = Auction(seller = 'user1', status = status, title = 'Auction title', item_description = 'Item description.', price = Decimal('0.00'), deadline = deadline)
+            auction.save()
+            auctions.append(auction)
+        return auctions
+        
+    def test_resolves_due_auctions(self):
+        """
+        Only active auctions past their deadline are resolved, and their participants are notified once.
+        """
+        due = self.create_auctions(2, timezone.now() + timedelta(hours = 1))
+        bid(due[0], Decimal('1.00'), self.bidder)
+        Auction.objects.filter(pk__in = [auction.pk for auction in due]).update(deadline = timezone.now() - timedelta(minutes = 1))
+        future = self.create_auctions(1, timezone.now() + timedelta(days = 1))
+        banned = self.create_auctions(1, timezone.now() - timedelta(days = 1), status = Auction.BANNED)
+        Notification.objects.all().delete()
+        call_command('resolve', verbosity = 0)
+        call_command('resolve', verbosity = 0)
+        self.assertEqual(set(Auction.objects.filter(status = Auction.ADJUDICATED).values_list('pk', flat = True)), set(auction.pk for auction in due))
+        self.assertEqual(Auction.objects.get(pk = future[0].pk).status, Auction.ACTIVE)
+        self.assertEqual(Auction.objects.get(pk = banned[0].pk).status, Auction.BANNED)
+        self.assertEqual(Notification.objects.count(), 2)
+        self.assertEqual(Notification.objects.get(dedup_key = 'resolve:' + str(due[0].pk)).get_recipients(), ['user2@example.com'])
+        self.assertEqual(Notification.objects.get(dedup_key = 'resolve:' + str(due[1].pk)).get_recipients(), ['user1@example.com'])
+        
+    def test_constant_queries(self):
+        """
+        The number of queries per chunk does not grow with the number of auctions.
+        """
+        query_counts = []
+        for count in [5, 50]:
+            self.create_auctions(count, timezone.now() - timedelta(minutes = 1))
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(resolve_due(chunk_size = 100), count)
+            query_counts.append(len(queries))
+        self.assertEqual(query_counts[0], query_counts[1])
+        
+    def test_chunks(self):
+        """
+        Auctions are resolved in chunks of the given size.
+        """
+        self.create_auctions(25, timezone.now() - timedelta(minutes = 1))
+        self.assertEqual(resolve_due(chunk_size = 10), 25)
+        self.assertEqual(Auction.objects.filter(status = Auction.ACTIVE).count(), 0)
+
+        
+        
+class SearchTests(TestCase):
+
+    def setUp(self):
+        User.objects.create_user('user1', 'user1@example.com', 'very_easy_password')
+        self.bicycle = self.create_auction('Red bicycle', 'A bicycle with three gears.')
+        self.helmet = self.create_auction('Helmet', 'Fits any bicycle rider.')
+        self.banned = self.create_auction('Blue bicycle', 'Stolen.', status = Auction.BANNED)
+        
+    def create_auction(self, title, item_description, status = Auction.ACTIVE):
+        auction = Auction(seller = 'user1', status = status, title = title, item_description = item_description, price = Decimal('0.00'), deadline = timezone.now() + timedelta(days = 30))
+        auction.save()
+        return auction
+        
+    def test_ranking_and_prefix(self):
+        """
+        Titles and descriptions are searched by word prefix, and title matches come first.
+        """
+        self.assertEqual(search.search('bicyc'), [self.bicycle.pk, self.helmet.pk])
+        self.assertEqual(search.search('bicycle gears'), [self.bicycle.pk])
+        self.assertEqual(search.search('unicycle'), [])
+        
+    def test_status_filter(self):
+        """
+        Only active auctions are found, except by staff.
+        """
+        response = self.client.get(reverse('auction:search'), {'search': 'bicycle'})
+        self.assertEqual([auction.pk for auction in response.context['auction_list']], [self.bicycle.pk, self.helmet.pk])
+        self.assertEqual(sorted(search.search('bicycle', status = None)), sorted([self.bicycle.pk, self.helmet.pk, self.banned.pk]))
+        
+    def test_index_follows_changes(self):
+        """
+        Description edits and bans are reflected in the index.
+        """
+        self.client.login(username = 'user1', password = 'very_easy_password')
+        self.client.post(reverse('auction:edit_description', kwargs = {'pk': self.helmet.pk}), {'item_description': 'Fits any skateboarder.'})
+        self.assertEqual(search.search('skateboard'), [self.helmet.pk])
+        self.assertEqual(search.search('bicycle'), [self.bicycle.pk])
+        User.objects.create_user('staff', 'staff@example.com', 'very_easy_password', is_staff = True)
+        self.client.login(username = 'staff', password = 'very_easy_password')
+        self.client.get(reverse('auction:ban', kwargs = {'pk': self.bicycle.pk}))
+        self.assertEqual(search.search('bicycle'), [])
+        
+    def test_term_backend(self):
+        """
+        The search term table gives the same results as the full-text index.
+        """
+        backend = search.TermSearchBackend(connection)
+        backend.rebuild()
+        self.assertEqual(backend.search(['bicyc'], Auction.ACTIVE, 10), [self.bicycle.pk, self.helmet.pk])
+        self.assertEqual(backend.search(['bicycle', 'gears'], Auction.ACTIVE, 10), [self.bicycle.pk])
+        self.assertEqual(sorted(backend.search(['bicycle'], None, 10)), sorted([self.bicycle.pk, self.helmet.pk, self.banned.pk]))
+        
+    def test_search_api(self):
+        """
+        The browse API searches with the index.
+        """
+        response = self.client.get(reverse('auction:auction_list_api'), {'title': 'helm'})
+        self.assertEqual([auction['id'] for auction in response.json()['data']], [str(self.helmet.pk)])
+        
+    def test_search_api_without_words(self):
+        """
+        A title without any words browses the active auctions instead of matching none.
+        """
+        for title in ['', ' !? ']:
+            response = self.client.get(reverse('auction:auction_list_api'), {'title': title})
+            self.assertEqual(sorted(auction['id'] for auction in response.json()['data']), sorted([str(self.bicycle.pk), str(self.helmet.pk)]))
+
+        
+        
+class BrowseAPITests(TestCase):
+
+    def setUp(self):
+        User.objects.create_user('user1', 'user1@example.com', 'very_easy_password')
+        now = timezone.now()
+        for i in range(25):
+            Auction(seller = 'user1', title = 'Auction ' + str(i), item_description = 'Item description.', price = Decimal(i % 5), deadline = now + timedelta(days = 3, hours = i)).save()
+        Auction(seller = 'user1', status = Auction.BANNED, title = 'Banned', item_description = 'Item description.', price = Decimal('0.00'), deadline = now + timedelta(days = 3)).save()
+        
+    def browse(self, **params):
+        pages = []
+        url = reverse('auction:auction_list_api') + '?' + urlencode(params)
+        while url is not None:
+            with self.assertNumQueries(1):
+                response = self.client.get(url)
+            pages.append([auction['id'] for auction in response.json()['data']])
+            url = response.json()['next']
+        return pages
+        
+    def test_pages(self):
+        """
+        Browsing returns the active auctions by deadline, a page at a time.
+        """
+        pages = self.browse(limit = 10)
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        expected = Auction.objects.filter(status = Auction.ACTIVE).order_by('deadline').values_list('id', flat = True)
+        self.assertEqual(sum(pages, []), [str(pk) for pk in expected])
+        
+    def test_sort_by_price(self):
+        """
+        Auctions with the same price are not skipped or repeated between pages.
+        """
+        pages = self.browse(limit = 4, sort = '-price')
+        expected = Auction.objects.filter(status = Auction.ACTIVE).order_by('-price', '-id').values_list('id', flat = True)
+        self.assertEqual(sum(pages, []), [str(pk) for pk in expected])
+        
+    def test_bad_parameters(self):
+        """
+        Invalid cursors, sort keys and limits are rejected.
+        """
+        url = reverse('auction:auction_list_api')
+        self.assertEqual(self.client.get(url, {'cursor': 'nonsense'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'cursor': encode_cursor('yesterday', 1)}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'sort': 'title'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'limit': 'all'}).status_code, 400)
+
+        
+        
+class ExportTests(TestCase):
+
+    def setUp(self):
+        User.objects.create_user('user1', 'user1@example.com', 'very_easy_password')
+        User.objects.create_user('staff', 'staff@example.com', 'very_easy_password', is_staff = True)
+        for i in range(25):
+            Auction(seller = 'user1', title = 'Auction ' + str(i), item_description = 'Item description.', price = Decimal(i), deadline = timezone.now() + timedelta(days = 3)).save()
+        self.pks = list(Auction.objects.order_by('pk').values_list('pk', flat = True))
+        
+    def test_staff_only(self):
+        """
+        Only staff can export data.
+        """
+        self.client.login(username = 'user1', password = 'very_easy_password')
+        self.assertEqual(self.client.get(reverse('auction:export')).status_code, 403)
+        
+    def export(self, **params):
+        response = self.client.get(reverse('auction:export'), params)
+        self.assertTrue(response.streaming)
+        return [json.loads(line) for line in b''.join(response.streaming_content).decode('utf-8').splitlines()]
+        
+    def test_ndjson(self):
+        """
+        Auctions are streamed one JSON object per line, and since skips the rows already seen.
+        """
+        self.client.login(username = 'staff', password = 'very_easy_password')
+        rows = self.export(type = 'auctions')
+        self.assertEqual([row['id'] for row in rows], self.pks)
+        self.assertEqual(rows[10]['price'], '10.00')
+        rows = self.export(type = 'auctions', since = rows[9]['modified'], after = rows[9]['id'])
+        self.assertEqual([row['id'] for row in rows], self.pks[10:])
+        
+    def test_changed_auctions(self):
+        """
+        Auctions changed since the last pull are exported again.
+        """
+        self.client.login(username = 'staff', password = 'very_easy_password')
+        last = self.export(type = 'auctions')[-1]
+        bid(Auction.objects.get(pk = self.pks[3]), Decimal('5.00'), User.objects.get(username = 'staff'))
+        resolve_due(timezone.now() + timedelta(days = 4))
+        rows = self.export(type = 'auctions', since = last['modified'], after = last['id'])
+        self.assertEqual(sorted(row['id'] for row in rows), self.pks)
+        self.assertEqual([row['price'] for row in rows if row['id'] == self.pks[3]], ['5.00'])
+        self.assertEqual(set(row['status'] for row in rows), {Auction.ADJUDICATED})
+        self.assertEqual(self.export(type = 'auctions', since = rows[-1]['modified'], after = rows[-1]['id']), [])
+        self.assertEqual(self.client.get(reverse('auction:export'), {'type': 'auctions', 'since': '12'}).status_code, 400)
+        
+    def test_csv(self):
+        """
+        Bids can be streamed as CSV with a header row.
+        """
+        bid(Auction.objects.get(pk = self.pks[0]), Decimal('1.00'), User.objects.get(username = 'staff'))
+        self.client.login(username = 'staff', password = 'very_easy_password')
+        response = self.client.get(reverse('auction:export'), {'type': 'bids', 'format': 'csv'})
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(lines, ['id,auction_id,bidder,amount', str(Bid.objects.get().pk) + ',' + str(self.pks[0]) + ',staff,1.00'])
+        
+    def test_chunks(self):
+        """
+        Rows are read in chunks.
+        """
+        with self.assertNumQueries(4):
+            self.assertEqual([row[0] for row in export_rows('auctions', chunk_size = 10)], self.pks)
+
+        
+        
+@override_settings(AUCTION_LIST_PAGE_SIZE = 10)
+class AuctionListTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        User.objects.create_user('user1', 'user1@example.com', 'very_easy_password')
+        for i in range(15):
+            Auction(seller = 'user1', title = 'Auction ' + str(i), item_description = 'Item description.', price = Decimal('0.00'), deadline = timezone.now() + timedelta(days = 3, hours = i)).save()
+        self.banned = Auction(seller = 'user1', status = Auction.BANNED, title = 'Banned auction', item_description = 'Item description.', price = Decimal('0.00'), deadline = timezone.now() + timedelta(days = 3))
+        self.banned.save()
+        
+    def test_pages(self):
+        """
+        The home page lists the active auctions a page at a time.
+        """
+        response = self.client.get(reverse('index'))
+        self.assertEqual(len(response.context['page'].rows), 10)
+        self.assertNotContains(response, 'Banned auction')
+        response = self.client.get(reverse('index'), {'order': 'deadline', 'cursor': response.context['page'].next_cursor})
+        self.assertEqual([auction['title'] for auction in response.context['page'].rows], ['Auction ' + str(i) for i in range(10, 15)])
+        self.assertIsNone(response.context['page'].next_cursor)
+        
+    def test_staff_sees_banned(self):
+        """
+        Staff also see banned auctions.
+        """
+        User.objects.create_user('staff', 'staff@example.com', 'very_easy_password', is_staff = True)
+        self.client.login(username = 'staff', password = 'very_easy_password')
+        self.assertContains(self.client.get(reverse('index')), 'Banned auction')
+        
+    def test_cached_page(self):
+        """
+        A cached page costs no queries, and is rendered again once an auction is created or banned.
+        """
+        self.client.get(reverse('index'), {'order': '-price'})
+        with self.assertNumQueries(0):
+            self.client.get(reverse('index'), {'order': '-price'})
+        Auction(seller = 'user1', title = 'New auction', item_description = 'Item description.', price = Decimal('100.00'), deadline = timezone.now() + timedelta(days = 3)).save()
+        self.assertContains(self.client.get(reverse('index'), {'order': '-price'}), 'New auction')
+        User.objects.create_user('staff', 'staff@example.com', 'very_easy_password', is_staff = True)
+        self.client.login(username = 'staff', password = 'very_easy_password')
+        self.client.get(reverse('auction:ban', kwargs = {'pk': Auction.objects.get(title = 'New auction').pk}))
+        self.client.logout()
+        self.assertNotContains(self.client.get(reverse('index'), {'order': '-price'}), 'New auction')
+
+        
+        
+@override_settings(CURRENCY_RATES = {'BACKEND': 'auction.rates.FileBackend', 'OPTIONS': {'path': RATES_FIXTURE}, 'TTL': 3600})
+class DetailCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        rates.refresh()
+        User.objects.create_user('user1', 'user1@example.com', 'very_easy_password')
+        self.bidder = User.objects.create_user('user2', 'user2@example.com', 'very_easy_password')
+        self.auction = Auction(seller = 'user1', title = 'Auction title', item_description = 'Item description.', price = Decimal('10.00'), deadline = timezone.now() + timedelta(days = 30))
+        self.auction.save()
+        self.url = reverse('detail', kwargs = {'pk': self.auction.pk})
+        
+    def test_cached_page(self):
+        """
+        A detail page served from the cache costs no queries.
+        """
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertContains(response, '10.00 €')
+        
+    def test_changes_shown(self):
+        """
+        Bids, description edits and bans replace the cached page.
+        """
+        self.client.get(self.url)
+        bid(self.auction, Decimal('12.00'), self.bidder)
+        self.assertContains(self.client.get(self.url), '12.00 €')
+        self.client.login(username = 'user1', password = 'very_easy_password')
+        self.client.post(reverse('auction:edit_description', kwargs = {'pk': self.auction.pk}), {'item_description': 'Edited item description.'})
+        self.assertContains(self.client.get(self.url), 'Edited item description.')
+        self.client.logout()
+        User.objects.create_user('staff', 'staff@example.com', 'very_easy_password', is_staff = True)
+        self.client.login(username = 'staff', password = 'very_easy_password')
+        self.client.get(reverse('auction:ban', kwargs = {'pk': self.auction.pk}))
+        self.client.logout()
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        
+    def test_user_links(self):
+        """
+        The seller and other users get their own links on the same cached page.
+        """
+        self.client.get(self.url)
+        self.client.login(username = 'user1', password = 'very_easy_password')
+        self.assertContains(self.client.get(self.url), 'Edit item description')
+        self.client.login(username = 'user2', password = 'very_easy_password')
+        response = self.client.get(self.url)
+        self.assertNotContains(response, 'Edit item description')
+        self.assertContains(response, reverse('auction:bid', kwargs = {'pk': self.auction.pk}))
+        
+    @override_settings(LOCAL_CACHE_TIMEOUT = 1)
+    def test_local_cache(self):
+        """
+        With a cache other processes cannot reach, changes they make show within a short time.
+        """
+        self.client.get(self.url)
+        Auction.objects.filter(pk = self.auction.pk).update(price = Decimal('12.00'))
+        self.assertContains(self.client.get(self.url), '10.00 €')
+        time.sleep(1.1)
+        self.assertContains(self.client.get(self.url), '12.00 €')
+        self.assertEqual(caching.page_timeout(3600), 1)
+        with self.settings(CACHES = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}):
+            self.assertTrue(caching.cache_is_shared())
+            self.assertEqual(caching.page_timeout(3600), 3600)
+        
+        
+class TokenTests(TestCase):
+
+    def setUp(self):
+        self.seller = User.objects.create_user('user1', 'user1@example.com', 'very_easy_password')
+        self.bidder = User.objects.create_user('user2', 'user2@example.com', 'very_easy_password')
+        self.auction = Auction(seller = 'user1', title = 'Title', item_description = 'Item description.', price = Decimal('10.00'), deadline = timezone.now() + timedelta(days = 3))
+        self.auction.save()
+        tokens.clear_cache()
+        
+    def post_bid(self, authorization, amount):
+        return self.client.post(reverse('bid_api'), json.dumps({'auction_id': self.auction.pk, 'bid': amount}), content_type = 'application/json', HTTP_AUTHORIZATION = authorization)
+        
+    def test_issue_and_bid(self):
+        """
+        A token issued with the password can be used for bidding instead of it.
+        """
+        basic = 'Basic ' + base64.b64encode(b'user2:very_easy_password').decode('ascii')
+        response = self.client.post(reverse('token_api'), json.dumps({'name': 'bot'}), content_type = 'application/json', HTTP_AUTHORIZATION = basic)
+        self.assertEqual(response.status_code, 201)
+        key = response.json()['data']['token']
+        self.assertEqual(self.post_bid('Token ' + key, '11.00').status_code, 201)
+        self.assertEqual(Bid.objects.get().bidder, self.bidder)
+        self.assertEqual(self.post_bid(basic, '12.00').status_code, 201)
+        
+    def test_cached(self):
+        """
+        A verified token is not looked up again for every request.
+        """
+        token, key = tokens.issue_token(self.bidder)
+        self.assertEqual(tokens.verify_token(key), self.bidder)
+        with self.assertNumQueries(0):
+            self.assertEqual(tokens.verify_token(key), self.bidder)
+            
+    def test_revoked(self):
+        """
+        Revoked, unknown and malformed credentials are rejected.
+        """
+        token, key = tokens.issue_token(self.bidder)
+        self.assertEqual(self.post_bid('Bearer ' + key, '11.00').status_code, 201)
+        response = self.client.delete(reverse('token_detail_api', kwargs = {'pk': token.pk}), HTTP_AUTHORIZATION = 'Token ' + key)
+        self.assertEqual((response.status_code, response.content), (204, b''))
+        self.assertEqual(self.post_bid('Token ' + key, '12.00').status_code, 401)
+        self.assertEqual(self.post_bid('Token unknown', '12.00').status_code, 401)
+        self.assertEqual(self.post_bid('Basic not-base64!', '12.00').status_code, 401)
+        self.assertEqual(self.post_bid('Basic', '12.00').status_code, 401)
+        self.assertEqual(Bid.objects.count(), 1)
+        
+        
+class BidBatchTests(TestCase):
+
+    def setUp(self):
+        User.objects.create_user('user1', 'user1@example.com', 'very_easy_password')
+        User.objects.create_user('user2', 'user2@example.com', 'very_easy_password')
+        deadline = timezone.now() + timedelta(days = 3)
+        self.auctions = []
+        for seller, status in [('user1', Auction.ACTIVE), ('user1', Auction.ACTIVE), ('user2', Auction.ACTIVE), ('user1', Auction.BANNED)]:
+            auction = Auction(seller = seller, status = status, title = 'Title', item_description = 'Item description.', price = Decimal('10.00'), deadline = deadline)
+            auction.save()
+            self.auctions.append(auction)
+        self.authorization = 'Basic ' + base64.b64encode(b'user2:very_easy_password').decode('ascii')
+            
+    def post(self, bids):
+        return self.client.post(reverse('bid_batch_api'), json.dumps({'bids': bids}), content_type = 'application/json', HTTP_AUTHORIZATION = self.authorization)
+        
+    def test_statuses(self):
+        """
+        Each bid of a batch gets the status it would get on its own.
+        """
+        first, second, own, banned = [auction.pk for auction in self.auctions]
+        response = self.post([
+            {'auction_id': first, 'bid': '11.00'},
+            {'auction_id': first, 'bid': '10.50'},
+            {'auction_id': second, 'bid': 'a lot'},
+            {'auction_id': second, 'bid': '0.001'},
+            {'auction_id': own, 'bid': '11.00'},
+            {'auction_id': banned, 'bid': '11.00'},
+            {'auction_id': 0, 'bid': '11.00'},
+            {'bid': '11.00'},
+            {'auction_id': first, 'bid': 12},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['status'] for result in response.json()['data']], [201, 400, 400, 400, 403, 403, 404, 400, 201])
+        self.assertEqual(Auction.objects.get(pk = first).price, Decimal('12.00'))
+        self.assertEqual(list(Bid.objects.values_list('amount', flat = True)), [Decimal('11.00'), Decimal('12.00')])
+        
+    def test_mails_coalesced(self):
+        """
+        A batch adds one mail per auction bid on, in one insert.
+        """
+        bids = [{'auction_id': self.auctions[0].pk, 'bid': '11.00'}, {'auction_id': self.auctions[0].pk, 'bid': '12.00'}, {'auction_id': self.auctions[1].pk, 'bid': '11.00'}]
+        with CaptureQueriesContext(connection) as queries:
+            self.post(bids)
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('INSERT INTO "auction_notification"')]), 1)
+        self.assertEqual(Notification.objects.count(), 2)
+        self.assertEqual(sorted(Notification.objects.get(dedup_key = 'bid:' + str(Bid.objects.get(amount = Decimal('12.00')).pk)).get_recipients()), ['user1@example.com', 'user2@example.com'])
+        
+    def test_bad_requests(self):
+        """
+        Malformed and oversized batches are rejected as a whole.
+        """
+        self.assertEqual(self.post({'auction_id': self.auctions[0].pk, 'bid': '11.00'}).status_code, 400)
+        with self.settings(BID_BATCH_MAX_SIZE = 2):
+            self.assertEqual(self.post([{'auction_id': self.auctions[0].pk, 'bid': str(11 + i)} for i in range(3)]).status_code, 400)
+        response = self.client.post(reverse('bid_api'), json.dumps({'auction_id': self.auctions[0].pk, 'bid': 'NaN'}), content_type = 'application/json', HTTP_AUTHORIZATION = self.authorization)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Bid.objects.count(), 0)
+        
+    def test_wrongly_formatted_auction_id(self):
+        """
+        An auction ID that is not a number is rejected by every bid endpoint.
+        """
+        for auction_id in ['first', [self.auctions[0].pk], True, '-1']:
+            for url, field in [('bid_api', 'bid'), ('proxy_bid_api', 'maximum')]:
+                response = self.client.post(reverse(url), json.dumps({'auction_id': auction_id, field: '11.00'}), content_type = 'application/json', HTTP_AUTHORIZATION = self.authorization)
+                self.assertEqual((response.status_code, response.json()['detail']), (400, 'Auction ID wrongly formatted'))
+            self.assertEqual(self.post([{'auction_id': auction_id, 'bid': '11.00'}]).json()['data'][0]['status'], 400)
+        response = self.client.post(reverse('bid_api'), '5', content_type = 'application/json', HTTP_AUTHORIZATION = self.authorization)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Bid.objects.count(), 0)
+        
+        
+class PushTests(TransactionTestCase):
+
+    def setUp(self):
+        User.objects.create_user('user1', 'user1@example.com', 'very_easy_password')
+        self.bidder = User.objects.create_user('user2', 'user2@example.com', 'very_easy_password')
+        self.auction = Auction(seller = 'user1', title = 'Title', item_description = 'Item description.', price = Decimal('10.00'), deadline = timezone.now() + timedelta(days = 3))
+        self.auction.save()
+        # The default broker on a free port, so that the tests do not depend on the configured one being free.
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as probe:
+            probe.bind(('127.0.0.1', 0))
+            address = probe.getsockname()
+        self.push_settings = override_settings(PUSH = dict(settings.PUSH, OPTIONS = {'peers': [address], 'bind': address}))
+        self.push_settings.enable()
+        push.close_broker()
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        
+    def tearDown(self):
+        push.close_broker()
+        self.push_settings.disable()
+        self.loop.close()
+        asyncio.set_event_loop(None)
+        
+    def watch(self, publish):
+        async def watch():
+            requests = asyncio.Queue()
+            responses = asyncio.Queue()
+            scope = {'type': 'http', 'path': '/events/', 'query_string': ('auction=' + str(self.auction.pk)).encode('ascii')}
+            task = asyncio.ensure_future(push.application(scope, requests.get, responses.put))
+            start = await asyncio.wait_for(responses.get(), 5)
+            self.assertEqual(start['status'], 200)
+            first = self.events((await asyncio.wait_for(responses.get(), 5))['body'])
+            await asyncio.get_event_loop().run_in_executor(None, publish)
+            second = self.events((await asyncio.wait_for(responses.get(), 5))['body'])
+            await requests.put({'type': 'http.disconnect'})
+            await asyncio.wait_for(task, 5)
+            return first, second
+        return self.loop.run_until_complete(watch())
+        
+    def events(self, body):
+        return [json.loads(line[len('data: '):]) for line in body.decode('utf-8').split('\n') if line.startswith('data: ')]
+        
+    def test_bid_pushed(self):
+        """
+        Watchers get the current state of the auction and then every bid.
+        """
+        first, second = self.watch(lambda: bid(self.auction, Decimal('11.00'), self.bidder))
+        self.assertEqual([(event['price'], event['last_bidder']) for event in first], [('10.00', '')])
+        self.assertEqual([(event['price'], event['last_bidder']) for event in second], [('11.00', 'user2')])
+        self.assertEqual(push.get_broker().subscriptions, {})
+        
+    def test_published_by_another_process(self):
+        """
+        With the default broker, updates published by another process, such as a WSGI worker, reach the watchers.
+        """
+        def publish():
+            other = import_string(settings.PUSH['BROKER'])(**settings.PUSH['OPTIONS'])
+            try:
+                Auction.objects.filter(pk = self.auction.pk).update(price = Decimal('15.00'), last_bidder = 'user2')
+                other.publish(push.auction_event(Auction.objects.get(pk = self.auction.pk)))
+            finally:
+                other.close()
+        first, second = self.watch(publish)
+        self.assertEqual([(event['price'], event['last_bidder']) for event in second], [('15.00', 'user2')])
+        
+    def test_process_local_broker_refused(self):
+        """
+        The ASGI application refuses a broker that cannot reach it from other processes.
+        """
+        push.check_broker()
+        push.close_broker()
+        with self.settings(PUSH = dict(settings.PUSH, BROKER = 'auction.push.InMemoryBroker', OPTIONS = {})):
+            with self.assertRaises(ImproperlyConfigured):
+                push.check_broker()
+            push.close_broker()
+        
+    def test_bad_request(self):
+        """
+        Watching requires valid auction IDs.
+        """
+        async def request(query):
+            responses = asyncio.Queue()
+            await push.application({'type': 'http', 'path': '/events/', 'query_string': query}, asyncio.Queue().get, responses.put)
+            return (await responses.get())['status']
+        self.assertEqual(self.loop.run_until_complete(request(b'')), 400)
+        self.assertEqual(self.loop.run_until_complete(request(b'auction=x')), 400)
+        
+    def test_udp_broker(self):
+        """
+        Updates published on one node reach the watchers on another.
+        """
+        async def receive():
+            node = push.UDPBroker(peers = [], bind = ('127.0.0.1', 0))
+            subscription = push.Subscription([str(self.auction.pk)])
+            node.subscribe(subscription)
+            sender = push.UDPBroker(peers = [node.receiver.getsockname()])
+            sender.publish(push.auction_event(self.auction))
+            try:
+                return await asyncio.wait_for(subscription.get(), 5)
+            finally:
+                sender.close()
+                node.close()
+        self.assertEqual([event['id'] for event in self.loop.run_until_complete(receive())], [str(self.auction.pk)])
+        
+        
+class ProxyBidTests(TestCase):
+
+    def setUp(self):
+        User.objects.create_user('user1', 'user1@example.com', 'very_easy_password')
+        self.users = [User.objects.create_user('user' + str(i), 'user' + str(i) + '@example.com', 'very_easy_password') for i in range(2, 5)]
+        self.auction = Auction(seller = 'user1', title = 'Title', item_description = 'Item description.', price = Decimal('10.00'), deadline = timezone.now() + timedelta(days = 3))
+        self.auction.save()
+        
+    def state(self):
+        auction = Auction.objects.get(pk = self.auction.pk)
+        return auction.last_bidder, auction.price
+        
+    def history(self):
+        return [(bid.bidder.username, str(bid.amount)) for bid in Bid.objects.select_related('bidder').order_by('pk')]
+        
+    def test_against_bids(self):
+        """
+        A proxy bid outbids others up to its maximum.
+        """
+        proxy_bid(self.auction, Decimal('20.00'), self.users[0])
+        self.assertEqual(self.state(), ('user2', Decimal('10.01')))
+        bid(self.auction, Decimal('15.00'), self.users[1])
+        self.assertEqual(self.state(), ('user2', Decimal('15.01')))
+        bid(self.auction, Decimal('25.00'), self.users[1])
+        self.assertEqual(self.state(), ('user3', Decimal('25.00')))
+        self.assertEqual(self.history(), [('user2', '10.01'), ('user3', '15.00'), ('user2', '15.01'), ('user2', '20.00'), ('user3', '25.00')])
+        
+    def test_against_proxy_bids(self):
+        """
+        The higher maximum wins at one cent over the lower one, and of equal maxima the earlier one.
+        """
+        proxy_bid(self.auction, Decimal('20.00'), self.users[0])
+        proxy_bid(self.auction, Decimal('30.00'), self.users[1])
+        self.assertEqual(self.state(), ('user3', Decimal('20.01')))
+        proxy_bid(self.auction, Decimal('30.00'), self.users[2])
+        self.assertEqual(self.state(), ('user3', Decimal('30.00')))
+        proxy_bid(self.auction, Decimal('40.00'), self.users[1])
+        self.assertEqual(self.state(), ('user3', Decimal('30.00')))
+        self.assertEqual(ProxyBid.objects.get(bidder = self.users[1]).maximum, Decimal('40.00'))
+        proxy_bid(self.auction, Decimal('35.00'), self.users[2])
+        self.assertEqual(self.state(), ('user3', Decimal('35.01')))
+        with self.assertRaises(BidTooLow):
+            proxy_bid(self.auction, Decimal('35.00'), self.users[0])
+            
+    def test_constant_queries(self):
+        """
+        Answering a bid costs the same number of queries however many proxy bids there are.
+        """
+        proxy_bid(self.auction, Decimal('100.00'), self.users[0])
+        bid(self.auction, Decimal('11.00'), self.users[1])
+        with CaptureQueriesContext(connection) as few:
+            bid(self.auction, Decimal('12.00'), self.users[1])
+        others = [User.objects.create_user('proxy' + str(i)) for i in range(50)]
+        ProxyBid.objects.bulk_create([ProxyBid(auction = self.auction, bidder = user, maximum = Decimal('50.00')) for user in others])
+        with CaptureQueriesContext(connection) as many:
+            bid(self.auction, Decimal('13.00'), self.users[1])
+        self.assertEqual(len(many), len(few))
+        self.assertEqual(self.state(), ('user2', Decimal('13.01')))
+        
+    def test_api(self):
+        """
+        Proxy bids can be registered and viewed via API.
+        """
+        authorization = 'Basic ' + base64.b64encode(b'user2:very_easy_password').decode('ascii')
+        response = self.client.post(reverse('proxy_bid_api'), json.dumps({'auction_id': self.auction.pk, 'maximum': '20.00'}), content_type = 'application/json', HTTP_AUTHORIZATION = authorization)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['data']['price'], '10.01')
+        response = self.client.get(response['Location'], HTTP_AUTHORIZATION = authorization)
+        self.assertEqual(response.json()['data']['leader'], 'user2')
+        response = self.client.post(reverse('proxy_bid_api'), json.dumps({'auction_id': self.auction.pk, 'maximum': '5.00'}), content_type = 'application/json', HTTP_AUTHORIZATION = authorization)
+        self.assertEqual(response.status_code, 400)
+        
+        
+class BidHistoryTests(TestCase):
+
+    def setUp(self):
+        User.objects.create_user('user1', 'user1@example.com', 'very_easy_password')
+        self.bidders = [User.objects.create_user('user' + str(i), 'user' + str(i) + '@example.com', 'very_easy_password') for i in range(2, 4)]
+        deadline = timezone.now() + timedelta(days = 3)
+        self.auctions = [Auction(seller = 'user1', title = 'Title ' + str(i), item_description = 'Item description.', price = Decimal('10.00'), deadline = deadline) for i in range(2)]
+        for auction in self.auctions:
+            auction.save()
+        for i in range(7):
+            for auction in self.auctions:
+                bid(auction, Decimal(11 + i), self.bidders[i % 2])
+        
+    def pages(self, url, **headers):
+        pages = []
+        while url is not None:
+            response = self.client.get(url, **headers)
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.json()['data'])
+            url = response.json()['next']
+        return pages
+        
+    def test_auction_history(self):
+        """
+        The bid history of an auction is paged highest bid first.
+        """
+        with self.assertNumQueries(2):
+            self.client.get(reverse('auction:auction_bids_api', kwargs = {'pk': self.auctions[0].pk}) + '?limit=3')
+        pages = self.pages(reverse('auction:auction_bids_api', kwargs = {'pk': self.auctions[0].pk}) + '?limit=3')
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual([bid['amount'] for bid in sum(pages, [])], [str(Decimal(17 - i)) + '.00' for i in range(7)])
+        self.assertEqual(sum(pages, [])[0]['bidder'], 'user2')
+        
+    def test_my_bids(self):
+        """
+        A user's bids are paged latest first, with the state of their auctions.
+        """
+        token, key = tokens.issue_token(self.bidders[1])
+        pages = self.pages(reverse('bid_api') + '?limit=2', HTTP_AUTHORIZATION = 'Token ' + key)
+        bids = sum(pages, [])
+        self.assertEqual([bid['id'] for bid in bids], [str(pk) for pk in Bid.objects.filter(bidder = self.bidders[1]).order_by('-created', '-id').values_list('pk', flat = True)])
+        self.assertEqual(len(bids), 6)
+        self.assertTrue(all(bid['leading'] is False and bid['price'] == '17.00' for bid in bids))
+        
+    def test_highest_bid(self):
+        """
+        The auction API reports the highest bid from the bids.
+        """
+        response = self.client.get(reverse('auction:auction_detail_api', kwargs = {'pk': self.auctions[1].pk}))
+        self.assertEqual(response.json()['data']['highest_bid'], '17.00')
+        self.assertEqual(self.auctions[1].get_highest_bid().bidder, self.bidders[0])
+        
+        
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = timezone.now()
+        
+    def __call__(self):
+        return self.now
+        
+    def advance(self, **kwargs):
+        self.now += timedelta(**kwargs)
+        
+        
+class SchedulerTests(TestCase):
+
+    def setUp(self):
+        User.objects.create_user('user1', 'user1@example.com', 'very_easy_password')
+        self.bidder = User.objects.create_user('user2', 'user2@example.com', 'very_easy_password')
+        self.clock = FakeClock()
+        self.scheduler = scheduler.DeadlineScheduler(clock = self.clock)
+        
+    def tearDown(self):
+        scheduler.unregister(self.scheduler)
+        
+    def create(self, deadline):
+        auction = Auction(seller = 'user1', title = 'Title', item_description = 'Item description.', price = Decimal('10.00'), deadline = deadline)
+        auction.save()
+        return auction
+        
+    def status(self, auction):
+        return Auction.objects.get(pk = auction.pk).status
+        
+    def test_due_at_deadline(self):
+        """
+        An auction is due as soon as the clock reaches its deadline, so the scheduler does not wait on it again.
+        """
+        auction = self.create(self.clock.now + timedelta(minutes = 2))
+        self.scheduler.seed()
+        self.clock.advance(minutes = 2)
+        self.assertEqual(self.scheduler.run_pending(), 1)
+        self.assertEqual(self.status(auction), Auction.ADJUDICATED)
+        self.assertIsNone(self.scheduler.next_deadline())
+        
+    def test_resolved_at_deadline(self):
+        """
+        Auctions are resolved once their deadline has passed, also when a bid has moved it.
+        """
+        first = self.create(self.clock.now + timedelta(minutes = 2))
+        second = self.create(self.clock.now + timedelta(minutes = 20))
+        self.scheduler.seed()
+        scheduler.register(self.scheduler)
+        bid(first, Decimal('11.00'), self.bidder)
+        self.clock.advance(minutes = 3)
+        self.assertEqual(self.scheduler.run_pending(), 0)
+        self.assertEqual(self.status(first), Auction.ACTIVE)
+        self.clock.advance(minutes = 3)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.scheduler.run_pending(), 0)
+        self.assertEqual(self.scheduler.next_deadline(), Auction.objects.get(pk = first.pk).deadline)
+        self.clock.advance(minutes = 2)
+        self.assertEqual(self.scheduler.run_pending(), 1)
+        self.assertEqual([self.status(first), self.status(second)], [Auction.ADJUDICATED, Auction.ACTIVE])
+        self.assertEqual(len(self.scheduler), 1)
+        
+    def test_restart(self):
+        """
+        A new scheduler resolves auctions that became due while none was running, and reschedules deadlines moved
+        elsewhere.
+        """
+        overdue = self.create(self.clock.now - timedelta(minutes = 1))
+        moved = self.create(self.clock.now + timedelta(minutes = 1))
+        self.scheduler.seed()
+        Auction.objects.filter(pk = moved.pk).update(deadline = self.clock.now + timedelta(minutes = 10))
+        self.clock.advance(minutes = 2)
+        self.assertEqual(self.scheduler.run_pending(), 1)
+        self.assertEqual([self.status(overdue), self.status(moved)], [Auction.ADJUDICATED, Auction.ACTIVE])
+        self.clock.advance(minutes = 10)
+        self.assertEqual(self.scheduler.run_pending(), 1)
+        self.assertEqual(self.status(moved), Auction.ADJUDICATED)
+        
+    def test_new_auctions(self):
+        """
+        Auctions created after seeding are picked up, in this process at once and otherwise by seeding again.
+        """
+        self.scheduler.seed()
+        scheduler.register(self.scheduler)
+        self.create(self.clock.now + timedelta(minutes = 1))
+        scheduler.unregister(self.scheduler)
+        self.create(self.clock.now + timedelta(minutes = 1))
+        self.assertEqual(len(self.scheduler), 1)
+        self.scheduler.seed()
+        self.clock.advance(minutes = 2)
+        self.assertEqual(self.scheduler.run_pending(), 2)
+        
+        
+class SchedulerServiceTests(TransactionTestCase):
+
+    def test_punctual(self):
+        """
+        The running scheduler resolves an auction within a second of its deadline.
+        """
+        User.objects.create_user('user1', 'user1@example.com', 'very_easy_password')
+        auction = Auction(seller = 'user1', title = 'Title', item_description = 'Item description.', price = Decimal('10.00'), deadline = timezone.now() + timedelta(seconds = 0.5))
+        auction.save()
+        service = scheduler.DeadlineScheduler()
+        resolved = []
+        thread = threading.Thread(target = service.run, args = (60.0, resolved.append))
+        thread.start()
+        try:
+            start = time.time()
+            while len(resolved) == 0 and time.time() - start < 5:
+                time.sleep(0.05)
+        finally:
+            service.stop()
+            thread.join()
+        self.assertEqual(resolved, [1])
+        self.assertLess(timezone.now() - Auction.objects.get(pk = auction.pk).deadline, timedelta(seconds = 1.5))
+        
+        
+@override_settings(CURRENCY_RATES = {'BACKEND': 'auction.rates.FileBackend', 'OPTIONS': {'path': RATES_FIXTURE}, 'TTL': 3600})
+class BenchmarkTests(TestCase):
+
+    def setUp(self):
+        datagen.generate(200, users = 20, bids_per_auction = 3, overdue = 0.05, seed = 1)
+        
+    def test_generated_data(self):
+        """
+        Generated auctions have bid histories consistent with their price, last bidder and bidders.
+        """
+        self.assertEqual(Auction.objects.count(), 200)
+        self.assertGreater(Bid.objects.count(), 0)
+        for auction in Auction.objects.prefetch_related('bidders'):
+            highest_bid = auction.get_highest_bid()
+            if highest_bid is None:
+                self.assertEqual(auction.last_bidder, '')
+                continue
+            self.assertEqual((auction.price, auction.last_bidder), (highest_bid.amount, highest_bid.bidder.username))
+            self.assertNotEqual(auction.seller, auction.last_bidder)
+            self.assertEqual(set(auction.bidders.all()), set(User.objects.filter(bids__auction = auction)))
+        self.assertEqual(len(search.search('vintage', status = None, limit = 1000)), Auction.objects.filter(Q(title__icontains = 'vintage') | Q(item_description__icontains = 'vintage')).count())
+        
+    def test_run(self):
+        """
+        A workload run reports latency and queries per operation, and is compared with a baseline.
+        """
+        samples, elapsed = benchmark.run(60, {'browse': 1, 'search': 1, 'detail': 1, 'bid': 1, 'resolve': 1})
+        summary = benchmark.summarize(samples, elapsed)
+        self.assertEqual(summary['total']['count'], 60)
+        self.assertEqual(sum(summary[name]['errors'] for name in summary if name != 'total'), 0)
+        self.assertTrue(all(summary[name]['p50'] <= summary[name]['p95'] <= summary[name]['p99'] for name in summary if name != 'total'))
+        self.assertEqual(benchmark.compare(summary, summary), [])
+        slower = {name: dict(result, p95 = result['p95'] / 2 - 1, queries = result['queries'] - 1) for name, result in summary.items() if name != 'total'}
+        self.assertEqual(len(benchmark.compare(summary, slower)), 2 * len(slower))
+        
+        
+class FixtureTests(TestCase):
+
+    # The fixture is saved object by object as loaddata does, leaving out the constraint check loaddata runs at the
+    # end, which Django 1.11 cannot run on SQLite 3.26 and later after the auth migrations.
+    
+    def test_db_data(self):
+        """
+        The shipped sample data loads with the current schema.
+        """
+        with open(os.path.join(settings.BASE_DIR, 'auction', 'fixtures', 'db_data.json')) as fixture:
+            for deserialized in serializers.deserialize('json', fixture):
+                deserialized.save()
+        self.assertEqual(Auction.objects.count(), 50)
+        self.assertEqual(Auction.objects.filter(modified__isnull = True).count(), 0)
+        auction = Auction.objects.get(pk = 1)
+        self.assertEqual(list(auction.bidders.values_list('username', flat = True)), [auction.last_bidder])
+        
+        
+class PopulateDatabaseTests(TestCase):
+
+    def populate(self, **options):
+        with CaptureQueriesContext(connection) as queries:
+            call_command('populatedatabase', verbosity = 0, batch_size = 100, **options)
+        return len(queries)
+        
+    def test_bulk(self):
+        """
+        Populating inserts rows in batches, with the requested sizes and status mix.
+        """
+        queries = self.populate(users = 150, auctions = 300, bids_per_auction = 2, status_mix = 'active=1,banned=1')
+        self.assertEqual(User.objects.filter(auctionuser__isnull = False).count(), 150)
+        self.assertEqual(Auction.objects.count(), 300)
+        self.assertEqual(Auction.objects.filter(status = Auction.ADJUDICATED).count(), 0)
+        self.assertGreater(Auction.objects.filter(status = Auction.BANNED).count(), 100)
+        self.assertTrue(User.objects.get(username = 'user150').check_password('very_easy_password'))
+        self.assertLess(queries, 100)
+        
+    def test_reproducible(self):
+        """
+        The same seed gives the same data.
+        """
+        self.populate(users = 10, auctions = 20, seed = 3)
+        first = list(Auction.objects.order_by('pk').values_list('seller', 'title', 'price', 'last_bidder'))
+        Auction.objects.all().delete()
+        User.objects.all().delete()
+        self.populate(users = 10, auctions = 20, seed = 3)
+        self.assertEqual(list(Auction.objects.order_by('pk').values_list('seller', 'title', 'price', 'last_bidder')), first)
+        
+    def test_existing_users(self):
+        """
+        New users are numbered on from the highest existing number, whatever other users there are.
+        """
+        for username in ['user1', 'user5', 'username']:
+            User.objects.create_user(username, username + '@example.com', 'very_easy_password')
+        users = datagen.DataGenerator().users(2)
+        self.assertEqual([user.username for user in users], ['user6', 'user7'])
+        self.assertEqual([user.username for user in datagen.DataGenerator().users(1)], ['user8'])
+        
+        
+class MetricsTests(TestCase):
+
+    def setUp(self):
+        metrics.collector.reset()
+        User.objects.create_user('user1', 'user1@example.com', 'very_easy_password')
+        self.auction = Auction.objects.create(seller = 'user1', title = 'Bicycle', item_description = 'Red.', price = Decimal('10.00'), deadline = timezone.now() + timedelta(days = 30))
+        
+    def test_request_recorded(self):
+        """
+        Requests are recorded per URL name with their query count, and served in the Prometheus text format.
+        """
+        self.client.get(reverse('auction:auction_detail_api', kwargs = {'pk': self.auction.pk}))
+        self.client.get(reverse('auction:auction_detail_api', kwargs = {'pk': self.auction.pk + 1}))
+        histogram = metrics.collector.histograms[('auction_request_queries', 'auction:auction_detail_api')]
+        self.assertEqual(histogram.count, 2)
+        self.assertEqual(histogram.sum, 3)
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        text = response.content.decode('utf-8')
+        self.assertIn('# TYPE auction_request_seconds histogram', text)
+        self.assertIn('auction_requests_total{view="auction:auction_detail_api",status="200"} 1', text)
+        self.assertIn('auction_requests_total{view="auction:auction_detail_api",status="404"} 1', text)
+        self.assertIn('auction_request_queries_bucket{view="auction:auction_detail_api",le="+Inf"} 2', text)
+        self.assertIn('auction_request_queries_count{view="auction:auction_detail_api"} 2', text)
+        
+    def test_timed_operations(self):
+        """
+        Time spent in timed operations is added to the request being handled.
+        """
+        record = metrics._local.record = metrics.RequestRecord()
+        try:
+            with metrics.timed('http'):
+                time.sleep(0.01)
+        finally:
+            metrics._local.record = None
+        self.assertGreaterEqual(record.times['http'], 0.01)
+        self.assertEqual(record.times['mail'], 0)
+        
+    @override_settings(METRICS = {'ALLOWED_IPS': [], 'QUERY_BUDGET': 0, 'LATENCY_BUDGET': None})
+    def test_budget_and_access(self):
+        """
+        Requests over the query budget are logged, and metrics are only served to allowed addresses and staff.
+        """
+        with self.assertLogs('auction.metrics', 'WARNING') as logs:
+            self.client.get(reverse('auction:auction_detail_api', kwargs = {'pk': self.auction.pk}))
+        self.assertIn('(auction:auction_detail_api) took', logs.output[0])
+        self.assertIn('with 2 queries', logs.output[0])
+        User.objects.create_superuser('admin', 'admin@example.com', 'very_easy_password')
+        with self.assertLogs('auction.metrics', 'WARNING'):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+            self.client.login(username = 'admin', password = 'very_easy_password')
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+        
+        
+class AuctionObjectTests(TestCase):
+
+    def setUp(self):
+        User.objects.create_user('user1', 'user1@example.com', 'very_easy_password')
+        User.objects.create_user('user2', 'user2@example.com', 'very_easy_password')
+        self.auction = Auction.objects.create(seller = 'user1', title = 'Bicycle', item_description = 'Red.', price = Decimal('10.00'), deadline = timezone.now() + timedelta(days = 30))
+        
+    # Queries of a request reading the auction row.
+        
+    def auction_reads(self, request):
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            response = request()
+        return response, [query['sql'] for query in queries if query['sql'].startswith('SELECT') and 'FROM "auction_auction"' in query['sql']]
+        
+    def test_bid(self):
+        """
+        Showing and submitting the bid form read the auction once each.
+        """
+        self.client.login(username = 'user2', password = 'very_easy_password')
+        response, reads = self.auction_reads(lambda: self.client.get(reverse('auction:bid', kwargs = {'pk': self.auction.pk})))
+        self.assertContains(response, 'Item description: Red.')
+        self.assertEqual(len(reads), 1)
+        response, reads = self.auction_reads(lambda: self.client.post(reverse('auction:bid', kwargs = {'pk': self.auction.pk}), {'price': '11.00', 'item_description': 'Red.'}))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(reads), 1)
+        self.assertEqual((Auction.objects.get().price, Auction.objects.get().last_bidder), (Decimal('11.00'), 'user2'))
+        
+    def test_edit_description(self):
+        """
+        Editing the description reads the auction once, without the columns the edit does not need. The search index
+        reads the row as stored after the edit.
+        """
+        self.client.login(username = 'user1', password = 'very_easy_password')
+        response, reads = self.auction_reads(lambda: self.client.post(reverse('auction:edit_description', kwargs = {'pk': self.auction.pk}), {'item_description': 'Blue.'}))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len([read for read in reads if '"seller"' in read]), 1)
+        self.assertEqual(len(reads), 2)
+        self.assertNotIn('"price"', reads[0])
+        self.assertEqual(Auction.objects.get().item_description, 'Blue.')
+        self.client.login(username = 'user2', password = 'very_easy_password')
+        self.assertEqual(self.client.get(reverse('auction:edit_description', kwargs = {'pk': self.auction.pk})).status_code, 403)
+        
+    def test_ban(self):
+        """
+        Banning reads the auction once, and only staff get that far.
+        """
+        self.client.login(username = 'user2', password = 'very_easy_password')
+        response, reads = self.auction_reads(lambda: self.client.get(reverse('auction:ban', kwargs = {'pk': self.auction.pk})))
+        self.assertEqual((response.status_code, reads), (403, []))
+        User.objects.create_superuser('admin', 'admin@example.com', 'very_easy_password')
+        self.client.login(username = 'admin', password = 'very_easy_password')
+        response, reads = self.auction_reads(lambda: self.client.get(reverse('auction:ban', kwargs = {'pk': self.auction.pk})))
+        self.assertEqual(len(reads), 1)
+        self.assertEqual(Auction.objects.get().status, Auction.BANNED)
+        self.assertEqual(self.client.get(reverse('auction:ban', kwargs = {'pk': self.auction.pk + 1})).status_code, 404)
+        
+        
+# The replica is a copy of the test database taken at the end of setUp, and does not see later writes.
+
+@override_settings(DATABASE_REPLICAS = ['replica'])
+class ReplicaTests(TransactionTestCase):
+
+    def setUp(self):
+        User.objects.create_user('user1', 'user1@example.com', 'very_easy_password')
+        User.objects.create_user('user2', 'user2@example.com', 'very_easy_password')
+        self.auction = Auction.objects.create(seller = 'user1', title = 'Bicycle', item_description = 'Red.', price = Decimal('10.00'), deadline = timezone.now() + timedelta(days = 30))
+        self.path = connection.settings_dict['NAME'] + '.replica'
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        shutil.copyfile(connection.settings_dict['NAME'], self.path)
+        connections.databases['replica'] = dict(connections.databases['default'], NAME = self.path)
+        
+    def tearDown(self):
+        connections['replica'].close()
+        del connections['replica']
+        del connections.databases['replica']
+        os.remove(self.path)
+        
+    def price(self, client):
+        return client.get(reverse('auction:auction_detail_api', kwargs = {'pk': self.auction.pk})).json()['data']['highest_bid']
+        
+    def test_reads_from_replica(self):
+        """
+        Replica-backed pages read auction data from the replica, and other pages from the primary.
+        """
+        Auction.objects.filter(pk = self.auction.pk).update(price = Decimal('20.00'), title = 'Tricycle')
+        self.assertEqual(self.price(self.client), '10.00')
+        self.assertEqual([auction['title'] for auction in self.client.get(reverse('auction:auction_list_api')).json()['data']], ['Bicycle'])
+        self.client.login(username = 'user1', password = 'very_easy_password')
+        self.assertContains(self.client.get(reverse('auction:edit_description', kwargs = {'pk': self.auction.pk})), 'Red.')
+        
+    def test_sticky_after_write(self):
+        """
+        A user who has bid reads from the primary for a while, and other users keep reading from the replica.
+        """
+        self.client.login(username = 'user2', password = 'very_easy_password')
+        response = self.client.post(reverse('auction:bid', kwargs = {'pk': self.auction.pk}), {'price': '11.00', 'item_description': 'Red.'})
+        self.assertEqual(response.cookies[routers.PIN_COOKIE]['max-age'], settings.REPLICA_PIN_SECONDS)
+        self.assertEqual(self.price(self.client), '11.00')
+        self.assertEqual(self.price(Client()), '10.00')
+        del self.client.cookies[routers.PIN_COOKIE]
+        self.assertEqual(self.price(self.client), '10.00')
+        
+    @override_settings(THROTTLE = {'ENABLED': True, 'RATES': {'read': {'USER': (10, 50), 'IP': (10, 50)}, 'write': {'USER': (10, 50), 'IP': (10, 50)}}, 'SHED_LATENCY': None})
+    def test_new_token(self):
+        """
+        A token issued after the replica was copied is accepted in replica-backed views and afterwards.
+        """
+        cache.clear()
+        tokens.clear_cache()
+        key = tokens.issue_token(User.objects.get(username = 'user2'))[1]
+        self.assertEqual(self.client.get(reverse('auction:auction_detail_api', kwargs = {'pk': self.auction.pk}), HTTP_AUTHORIZATION = 'Token ' + key).status_code, 200)
+        response = self.client.post(reverse('bid_api'), json.dumps({'auction_id': self.auction.pk, 'bid': '11.00'}), content_type = 'application/json', HTTP_AUTHORIZATION = 'Token ' + key)
+        self.assertEqual(response.status_code, 201)
+        routers._local.replica = 'replica'
+        try:
+            self.assertEqual(router.db_for_read(APIToken), 'default')
+            self.assertEqual(router.db_for_read(Auction), 'replica')
+        finally:
+            routers._local.replica = None
+        
+    @override_settings(DATABASE_REPLICAS = [])
+    def test_without_replicas(self):
+        """
+        Without replicas everything is read from the primary, and writes set no cookie.
+        """
+        self.client.login(username = 'user2', password = 'very_easy_password')
+        response = self.client.post(reverse('auction:bid', kwargs = {'pk': self.auction.pk}), {'price': '11.00', 'item_description': 'Red.'})
+        self.assertNotIn(routers.PIN_COOKIE, response.cookies)
+        self.assertEqual(self.price(Client()), '11.00')
+        
+        
+class DatabaseSetupTests(TransactionTestCase):
+
+    @override_settings(SQLITE_PRAGMAS = {'busy_timeout': 1234, 'cache_size': -1000})
+    def test_pragmas(self):
+        """
+        New SQLite connections get the configured pragmas.
+        """
+        other = connection.copy()
+        try:
+            with other.cursor() as cursor:
+                cursor.execute('PRAGMA busy_timeout')
+                self.assertEqual(cursor.fetchone()[0], 1234)
+                cursor.execute('PRAGMA cache_size')
+                self.assertEqual(cursor.fetchone()[0], -1000)
+        finally:
+            other.close()
+            
+    def test_health_check(self):
+        """
+        With health checks an unusable connection is closed when a request starts, and a new one is used.
+        """
+        connection.ensure_connection()
+        connection.is_usable = lambda: False
+        try:
+            with self.settings(DATABASE_HEALTH_CHECKS = False):
+                database.check_connections()
+            self.assertIsNotNone(connection.connection)
+            with self.settings(DATABASE_HEALTH_CHECKS = True), self.assertLogs('auction.database', 'WARNING'):
+                database.check_connections()
+            self.assertIsNone(connection.connection)
+        finally:
+            del connection.is_usable
+        self.assertEqual(self.client.get(reverse('auction:auction_list_api')).status_code, 200)
+        
+    def test_lock_for_write(self):
+        """
+        Locking for writing keeps other connections from writing until the transaction ends.
+        """
+        other = connection.copy()
+        other.settings_dict['OPTIONS'] = {'timeout': 0.1}
+        try:
+            with transaction.atomic():
+                database.lock_for_write()
+                with self.assertRaises(OperationalError):
+                    with other.cursor() as cursor:
+                        cursor.execute('UPDATE auction_auction SET price = 1')
+            with other.cursor() as cursor:
+                cursor.execute('UPDATE auction_auction SET price = 1')
+        finally:
+            other.close()
+        
+        
+@override_settings(BID_QUEUE = {'ENABLED': True, 'SHARDS': 1, 'BATCH_SIZE': 100, 'POLL': 0.05})
+class SequencerTests(TestCase):
+
+    def setUp(self):
+        User.objects.create_user('user1', 'user1@example.com', 'very_easy_password')
+        User.objects.create_user('user2', 'user2@example.com', 'very_easy_password')
+        User.objects.create_user('user3', 'user3@example.com', 'very_easy_password')
+        self.auctions = [Auction.objects.create(seller = 'user1', title = 'Title', item_description = 'Item description.', price = Decimal('10.00'), deadline = timezone.now() + timedelta(days = 3)) for i in range(2)]
+        
+    def post(self, username, auction, amount):
+        authorization = 'Basic ' + base64.b64encode((username + ':very_easy_password').encode('ascii')).decode('ascii')
+        return self.client.post(reverse('bid_api'), json.dumps({'auction_id': auction.pk, 'bid': amount}), content_type = 'application/json', HTTP_AUTHORIZATION = authorization)
+        
+    def test_queued_bids(self):
+        """
+        Bids are queued and answered at once, and the sequencer places them in order with the usual rules.
+        """
+        response = self.post('user2', self.auctions[0], '12.00')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['data']['status'], 'pending')
+        self.post('user3', self.auctions[0], '11.00')
+        self.post('user1', self.auctions[0], '13.00')
+        self.assertEqual(Auction.objects.get(pk = self.auctions[0].pk).price, Decimal('10.00'))
+        self.assertEqual(sequencer.Sequencer().run_pending(), 3)
+        self.assertEqual(sequencer.Sequencer().run_pending(), 0)
+        auction = Auction.objects.get(pk = self.auctions[0].pk)
+        self.assertEqual((auction.price, auction.last_bidder), (Decimal('12.00'), 'user2'))
+        self.assertEqual([(queued.status, queued.detail) for queued in QueuedBid.objects.order_by('id')], [
+            (QueuedBid.ACCEPTED, ''),
+            (QueuedBid.REJECTED, 'Bid must be greater than previous bid'),
+            (QueuedBid.REJECTED, 'You cannot bid on your own auction'),
+        ])
+        authorization = 'Basic ' + base64.b64encode(b'user2:very_easy_password').decode('ascii')
+        data = self.client.get(response['Location'], HTTP_AUTHORIZATION = authorization).json()['data']
+        self.assertEqual((data['status'], data['bid']['amount']), ('accepted', '12.00'))
+        self.assertEqual(self.client.get(response['Location'], HTTP_AUTHORIZATION = 'Basic ' + base64.b64encode(b'user3:very_easy_password').decode('ascii')).status_code, 404)
+        
+    def test_group_commit(self):
+        """
+        A batch of bids shares one transaction, and gets one mail per auction.
+        """
+        for i, username in enumerate(['user2', 'user3', 'user2']):
+            self.post(username, self.auctions[0], str(11 + i))
+        self.post('user3', self.auctions[1], '11.00')
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            sequencer.Sequencer().run_pending()
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('INSERT INTO "auction_notification"')]), 1)
+        self.assertEqual(Notification.objects.count(), 2)
+        self.assertEqual(Auction.objects.get(pk = self.auctions[0].pk).price, Decimal('13.00'))
+        self.assertEqual(Bid.objects.count(), 4)
+        
+    def test_shards(self):
+        """
+        A sequencer only places the bids of its own shard.
+        """
+        for auction in self.auctions:
+            self.post('user2', auction, '11.00')
+        shard = self.auctions[0].pk % 2
+        self.assertEqual(sequencer.Sequencer(shard, 2).run_pending(), 1)
+        self.assertEqual(QueuedBid.objects.get(status = QueuedBid.ACCEPTED).auction_id, self.auctions[0].pk)
+        self.assertEqual(sequencer.Sequencer(1 - shard, 2).run_pending(), 1)
+        with self.assertRaises(CommandError):
+            call_command('runsequencer', shard = 2, shards = 2)
+        
+    def test_stale_auction(self):
+        """
+        A bid on an auction read before another bid is placed on the current state, and leaves the caller's auction
+        current.
+        """
+        auction = Auction.objects.get(pk = self.auctions[0].pk)
+        self.post('user3', self.auctions[0], '11.00')
+        sequencer.Sequencer().run_pending()
+        placed = {}
+        bid_object, previous_bidder = place_bid(auction, Decimal('12.00'), User.objects.get(username = 'user2'), notify = False, publish = False)
+        track_placed(placed, auction, bid_object, User.objects.get(username = 'user2'), previous_bidder)
+        self.assertEqual((auction.price, auction.last_bidder, previous_bidder), (Decimal('12.00'), 'user2', 'user3'))
+        self.assertEqual(placed[auction.pk][1], set(['user1', 'user2', 'user3']))
+        
+        
+@override_settings(BID_QUEUE = {'ENABLED': False, 'SHARDS': 1, 'BATCH_SIZE': 100, 'POLL': 0.05})
+class SequencerBenchmarkTests(TransactionTestCase):
+
+    def setUp(self):
+        User.objects.create_user('user1', 'user1@example.com', 'very_easy_password')
+        for i in range(2, 6):
+            User.objects.create_user('user' + str(i), 'user' + str(i) + '@example.com', 'very_easy_password')
+        self.auction = Auction.objects.create(seller = 'user1', title = 'Title', item_description = 'Item description.', price = Decimal('10.00'), deadline = timezone.now() + timedelta(days = 3))
+        
+    def test_compare_bid_paths(self):
+        """
+        Bids posted at once are answered on both paths, and every queued bid is settled by the sequencer.
+        """
+        results = benchmark.compare_bid_paths(20, bidders = 4)
+        self.assertEqual(sum(results['direct']['statuses'].values()), 20)
+        self.assertEqual(set(results['direct']['statuses']) - set([201, 400]), set())
+        self.assertEqual(results['queued']['statuses'], {202: 20})
+        self.assertEqual(QueuedBid.objects.filter(status = QueuedBid.PENDING).count(), 0)
+        self.assertEqual(Auction.objects.get(pk = self.auction.pk).price, Decimal('50.00'))
+        for result in results.values():
+            self.assertTrue(result['p50'] <= result['p95'] <= result['p99'])
+        
+        
+THROTTLE_SETTINGS = {
+    'ENABLED': True,
+    'RATES': {
+        'read': {'USER': (0.1, 3), 'IP': (0.1, 5)},
+        'write': {'USER': (0.1, 2), 'IP': (0.1, 5)},
+        'login': {'USER': (0.1, 2), 'IP': (0.1, 3)},
+    },
+    'SHED_LATENCY': 1.0,
+    'SHED_RETRY_AFTER': 5,
+    'CLIENT_IP_HEADER': None,
+    'TRUSTED_PROXIES': 1,
+}
+
+
+@override_settings(THROTTLE = THROTTLE_SETTINGS)
+class ThrottleTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        metrics.collector.reset()
+        throttling.latency.reset()
+        self.seller = User.objects.create_user('user1', 'user1@example.com', 'very_easy_password')
+        self.bidder = User.objects.create_user('user2', 'user2@example.com', 'very_easy_password')
+        self.auction = Auction.objects.create(seller = 'user1', title = 'Bicycle', item_description = 'Red.', price = Decimal('10.00'), deadline = timezone.now() + timedelta(days = 30))
+        
+    def tearDown(self):
+        throttling.latency.reset()
+        
+    def browse(self, **extra):
+        return self.client.get(reverse('auction:auction_detail_api', kwargs = {'pk': self.auction.pk}), **extra)
+        
+    def post_bid(self, authorization, amount):
+        return self.client.post(reverse('bid_api'), json.dumps({'auction_id': self.auction.pk, 'bid': amount}), content_type = 'application/json', HTTP_AUTHORIZATION = authorization)
+        
+    def test_burst_exhausted(self):
+        """
+        Once a client has used up its burst, it is told to come back later, and other addresses are not affected.
+        """
+        for i in range(5):
+            self.assertEqual(self.browse().status_code, 200)
+        with self.assertLogs('auction.throttling', 'WARNING') as logs:
+            response = self.browse()
+            self.assertEqual(self.browse().status_code, 429)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '10')
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('ip:127.0.0.1', logs.output[0])
+        self.assertEqual(self.browse(REMOTE_ADDR = '10.0.0.2').status_code, 200)
+        self.assertEqual(self.client.get(reverse('auction:search'), {'search': 'bicycle'}).status_code, 200)
+        
+    def test_users_and_classes(self):
+        """
+        Users and reads and writes have budgets of their own.
+        """
+        key = tokens.issue_token(self.bidder)[1]
+        for i in range(2):
+            self.assertEqual(self.post_bid('Token ' + key, str(11 + i)).status_code, 201)
+        with self.assertLogs('auction.throttling', 'WARNING'):
+            self.assertEqual(self.post_bid('Token ' + key, '13.00').status_code, 429)
+        self.assertEqual(self.browse(HTTP_AUTHORIZATION = 'Token ' + key).status_code, 200)
+        User.objects.create_user('user3', 'user3@example.com', 'very_easy_password')
+        other = tokens.issue_token(User.objects.get(username = 'user3'))[1]
+        self.assertEqual(self.post_bid('Token ' + other, '13.00').status_code, 201)
+        self.assertEqual(metrics.collector.throttled, {('write', 'user'): 1})
+        
+    def test_token_endpoint(self):
+        """
+        Password guesses at the token endpoint are limited per address and per username tried.
+        """
+        def issue(username, password, **extra):
+            authorization = 'Basic ' + base64.b64encode((username + ':' + password).encode('ascii')).decode('ascii')
+            return self.client.post(reverse('token_api'), content_type = 'application/json', HTTP_AUTHORIZATION = authorization, **extra)
+        for i in range(2):
+            self.assertEqual(issue('user2', 'guess' + str(i)).status_code, 401)
+        with self.assertLogs('auction.throttling', 'WARNING'):
+            self.assertEqual(issue('user2', 'very_easy_password', REMOTE_ADDR = '10.0.0.2').status_code, 429)
+        self.assertEqual(issue('user1', 'very_easy_password').status_code, 201)
+        with self.assertLogs('auction.throttling', 'WARNING'):
+            self.assertEqual(issue('user1', 'very_easy_password').status_code, 429)
+        self.assertEqual(metrics.collector.throttled, {('login', 'user'): 1, ('login', 'ip'): 1})
+        
+    @override_settings(THROTTLE = dict(THROTTLE_SETTINGS, CLIENT_IP_HEADER = 'HTTP_X_FORWARDED_FOR'))
+    def test_forwarded_address(self):
+        """
+        Behind a proxy clients are told apart by the address it forwards, whatever they put in the header themselves.
+        """
+        for i in range(5):
+            self.assertEqual(self.browse(HTTP_X_FORWARDED_FOR = '10.0.0.' + str(i) + ', 192.0.2.1').status_code, 200)
+        with self.assertLogs('auction.throttling', 'WARNING') as logs:
+            self.assertEqual(self.browse(HTTP_X_FORWARDED_FOR = '192.0.2.1').status_code, 429)
+        self.assertIn('ip:192.0.2.1', logs.output[0])
+        self.assertEqual(self.browse(HTTP_X_FORWARDED_FOR = '192.0.2.1, 192.0.2.2').status_code, 200)
+        self.assertEqual(self.browse().status_code, 200)
+        with override_settings(THROTTLE = dict(THROTTLE_SETTINGS, CLIENT_IP_HEADER = 'HTTP_X_FORWARDED_FOR', TRUSTED_PROXIES = 2)):
+            request = RequestFactory().get('/', HTTP_X_FORWARDED_FOR = '10.0.0.1, 192.0.2.1, 198.51.100.1')
+            self.assertEqual(throttling.client_ip(request), '192.0.2.1')
+            self.assertEqual(throttling.client_ip(RequestFactory().get('/', HTTP_X_FORWARDED_FOR = '10.0.0.1')), '127.0.0.1')
+        
+    def test_take(self):
+        """
+        A bucket refills at its rate and holds at most its burst.
+        """
+        stored, wait = throttling.take(None, 100.0, 1, 2)
+        stored, wait = throttling.take(stored, 100.0, 1, 2)
+        self.assertEqual((stored, wait), (102.0, 0))
+        self.assertEqual(throttling.take(stored, 100.0, 1, 2), (None, 1.0))
+        self.assertEqual(throttling.take(stored, 101.5, 1, 2), (103.0, 0))
+        self.assertEqual(throttling.take(stored, 1000.0, 1, 2), (1001.0, 0))
+        
+    def test_load_shedding(self):
+        """
+        When the API is slow, reads are turned away before writes, and the estimate recovers once idle.
+        """
+        now = time.time()
+        throttling.latency.value = 1.5
+        throttling.latency.updated = now
+        with self.assertLogs('auction.throttling', 'WARNING'):
+            response = self.browse()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '5')
+        authorization = 'Basic ' + base64.b64encode(b'user2:very_easy_password').decode('ascii')
+        self.assertEqual(self.post_bid(authorization, '11.00').status_code, 201)
+        self.assertLess(throttling.latency.get(now + 10), 0.5)
+        text = self.client.get(reverse('metrics')).content.decode('utf-8')
+        self.assertIn('auction_throttled_total{class="read",reason="load"} 1', text)
+        
+        
+class AsyncAPITests(TransactionTestCase):
+
+    def setUp(self):
+        User.objects.create_user('user1', 'user1@example.com', 'very_easy_password')
+        self.bidder = User.objects.create_user('user2', 'user2@example.com', 'very_easy_password')
+        self.auctions = [Auction.objects.create(seller = 'user1', title = 'Bicycle ' + str(i), item_description = 'Red.', price = Decimal(10 + i), deadline = timezone.now() + timedelta(days = 3)) for i in range(3)]
+        bid(self.auctions[0], Decimal('12.00'), self.bidder)
+        metrics.collector.reset()
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        
+    def tearDown(self):
+        self.loop.close()
+        asyncio.set_event_loop(None)
+        
+    def get(self, path, query = b'', method = 'GET'):
+        async def request():
+            responses = asyncio.Queue()
+            scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query, 'headers': [(b'host', b'testserver')], 'client': ('127.0.0.1', 50000)}
+            await async_api.application(scope, asyncio.Queue().get, responses.put)
+            start = await responses.get()
+            return start['status'], dict(start['headers']), (await responses.get())['body']
+        return self.loop.run_until_complete(request())
+        
+    def test_same_responses(self):
+        """
+        The asynchronous endpoints answer like the synchronous ones.
+        """
+        for path, query in [
+            (reverse('auction:auction_list_api'), b'sort=-price&limit=2'),
+            (reverse('auction:auction_list_api'), b'sort=size'),
+            (reverse('auction:auction_detail_api', kwargs = {'pk': self.auctions[0].pk}), b''),
+            (reverse('auction:auction_detail_api', kwargs = {'pk': self.auctions[2].pk + 1}), b''),
+        ]:
+            status, headers, body = self.get(path, query)
+            response = self.client.get(path + '?' + query.decode('ascii'))
+            self.assertEqual((status, headers[b'content-type']), (response.status_code, b'application/json'))
+            self.assertEqual(json.loads(body.decode('utf-8')), response.json())
+        self.assertEqual(json.loads(self.get(reverse('auction:auction_detail_api', kwargs = {'pk': self.auctions[0].pk}))[2].decode('utf-8'))['data']['highest_bid'], '12.00')
+        
+    def test_concurrent_clients(self):
+        """
+        Many clients are served at once with no more database threads than configured.
+        """
+        threads = set()
+        original = async_api.run_blocking
+        def run_blocking(*args):
+            threads.add(threading.get_ident())
+            return original(*args)
+        async def browse():
+            responses = asyncio.Queue()
+            scope = {'type': 'http', 'method': 'GET', 'path': reverse('auction:auction_list_api'), 'query_string': b'', 'headers': [(b'host', b'testserver')]}
+            await async_api.application(scope, asyncio.Queue().get, responses.put)
+            return (await responses.get())['status']
+        async_api.run_blocking = run_blocking
+        try:
+            statuses = self.loop.run_until_complete(asyncio.gather(*[browse() for i in range(50)]))
+        finally:
+            async_api.run_blocking = original
+        self.assertEqual(statuses, [200] * 50)
+        self.assertLessEqual(len(threads), settings.ASYNC_API['DB_THREADS'])
+        self.assertEqual(metrics.collector.requests[('auction:auction_list_api', 200)], 50)
+        
+    def test_other_requests(self):
+        """
+        Only reads of the read endpoints are served, everything else is left to the event stream.
+        """
+        self.assertEqual(self.get(reverse('auction:auction_list_api'), method = 'POST')[0], 405)
+        status, headers, body = self.get(reverse('auction:auction_list_api'), method = 'HEAD')
+        self.assertEqual((status, body), (200, b''))
+        self.assertEqual(self.get(reverse('auction:auction_bids_api', kwargs = {'pk': self.auctions[0].pk}))[0], 404)
+        self.assertEqual(self.get('/events/')[0], 400)
+        
+    def test_compare_servers(self):
+        """
+        Slow clients are served at once on the ASGI path, and a thread at a time each on the WSGI path.
+        """
+        results = benchmark.compare_servers(16, slow = 0.05, workers = 2)
+        self.assertEqual((results['wsgi']['errors'], results['asgi']['errors']), (0, 0))
+        self.assertEqual(results['wsgi']['peak_connections'], 2)
+        self.assertEqual(results['asgi']['peak_connections'], 16)
+        self.assertGreaterEqual(results['wsgi']['seconds'], 0.4)
+        self.assertLess(results['asgi']['seconds'], results['wsgi']['seconds'])
+        
+    @override_settings(THROTTLE = THROTTLE_SETTINGS)
+    def test_throttled(self):
+        """
+        Reads of the asynchronous endpoints take from the same buckets as the synchronous ones.
+        """
+        cache.clear()
+        for i in range(5):
+            self.assertEqual(self.client.get(reverse('auction:auction_list_api')).status_code, 200)
+        with self.assertLogs('auction.throttling', 'WARNING'):
+            status, headers, body = self.get(reverse('auction:auction_list_api'))
+        self.assertEqual((status, headers[b'retry-after']), (429, b'10'))
+        cache.clear()
@@ -0,0 +1,200 @@
+import base64
+import binascii
+import hashlib
+import logging
+import math
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+
+from . import metrics, tokens
+
+
+logger = logging.getLogger(__name__)
+
+# Endpoint classes by priority. When the server is slow the lowest priorities are turned away first.
+
+PRIORITIES = {'read': 1, 'write': 2, 'login': 2}
+
+LOG_INTERVAL = 60
+
+
+# Admission control for the API. Every client has a token bucket for reads and one for writes, per user and per IP
+# address, kept in the cache so that all processes sharing the cache share the buckets. Views checking passwords have
+# a class of their own, login, with buckets per IP address and per username tried, so that guessing passwords is slow
+# however many addresses it comes from. A request takes a token from each of its buckets and is answered with 429 and
+# Retry-After if one of them is empty. The buckets are updated with a read and a write of the cache rather than
+# atomically, so concurrent requests of one client can exceed the burst by a few; the limits protect the server rather
+# than account for use.
+#
+# On top of that, each process keeps an estimate of the latency of the throttled endpoints. When it passes
+# settings.THROTTLE['SHED_LATENCY'] times the priority of a request's class, the request is answered with 503 at once,
+# so that browsing gives way to bidding before bidding gives way too.
+
+
+# Bucket stored as the theoretical arrival time of the next request: a bucket of rate tokens per second holding up to
+# burst tokens is empty when that time is more than burst intervals ahead of now. Returns the new time to store, or
+# None and the seconds to wait if the bucket is empty.
+
+def take(stored, now, rate, burst):
+    interval = 1.0 / rate
+    arrival = max(stored if stored is not None else now, now) + interval
+    wait = arrival - now - burst * interval
+    if wait > 0:
+        return None, wait
+    return arrival, 0
+
+
+# Estimate of the latency of recent requests, decaying towards zero when no requests are measured, so that shedding
+# every request does not keep the estimate up for ever.
+
+class LatencyEstimate(object):
+
+    def __init__(self, weight = 0.1, half_life = 5.0):
+        self.weight = weight
+        self.half_life = half_life
+        self.value = 0.0
+        self.updated = time.time()
+        self.lock = threading.Lock()
+
+    def get(self, now = None):
+        now = now if now is not None else time.time()
+        return self.value * 0.5 ** ((now - self.updated) / self.half_life)
+
+    def observe(self, seconds, now = None):
+        now = now if now is not None else time.time()
+        with self.lock:
+            self.value = self.get(now) * (1 - self.weight) + seconds * self.weight
+            self.updated = now
+
+    def reset(self):
+        with self.lock:
+            self.value = 0.0
+            self.updated = time.time()
+
+
+latency = LatencyEstimate()
+
+
+# User making the request, as far as it can be told without checking a password: the session user, or the owner of an
+# API token. Clients using a username and password are limited by address only.
+
+def request_user_id(request):
+    if request.user.is_authenticated:
+        return request.user.pk
+    scheme, _, credentials = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+    if scheme.lower() in ('token', 'bearer'):
+        user = tokens.verify_token(credentials.strip())
+        if user is not None:
+            return user.pk
+    return None
+
+
+# Username of HTTP Basic credentials, or None. The password is not checked.
+
+def claimed_username(request):
+    scheme, _, credentials = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+    if scheme.lower() != 'basic':
+        return None
+    try:
+        return base64.b64decode(credentials).decode('utf-8').split(':', 1)[0]
+    except (ValueError, binascii.Error):
+        return None
+
+
+# Address of the client. Behind reverse proxies REMOTE_ADDR is the address of the nearest proxy, so with
+# settings.THROTTLE['CLIENT_IP_HEADER'] set the address is read from that header instead, as the outermost of the
+# TRUSTED_PROXIES proxies saw it. Each proxy appends the address it was connected from, and values before those come
+# from the client and may be forged. A header with fewer values did not pass the proxies, and REMOTE_ADDR is used.
+
+def client_ip(request):
+    config = settings.THROTTLE
+    header = config.get('CLIENT_IP_HEADER')
+    if header is not None:
+        values = [value.strip() for value in request.META.get(header, '').split(',') if value.strip() != '']
+        proxies = config.get('TRUSTED_PROXIES', 1)
+        if len(values) >= proxies:
+            return values[-proxies]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def client_keys(request, endpoint_class):
+    keys = [('ip', 'ip:' + client_ip(request))]
+    if endpoint_class == 'login':
+        username = claimed_username(request)
+        if username is not None:
+            keys.append(('user', 'name:' + hashlib.sha256(username.encode('utf-8')).hexdigest()))
+        return keys
+    user_id = request_user_id(request)
+    if user_id is not None:
+        keys.append(('user', 'user:' + str(user_id)))
+    return keys
+
+
+def too_many_requests(detail, wait):
+    response = JsonResponse({'detail': detail}, status = 429)
+    response['Retry-After'] = str(int(math.ceil(wait)))
+    return response
+
+
+def turned_away(endpoint_class, reason, client):
+    metrics.collector.count_throttled(endpoint_class, reason)
+    if cache.add('auction:throttle:logged:' + client, True, LOG_INTERVAL):
+        logger.warning('Throttling %s requests of %s (%s)', endpoint_class, client, reason)
+
+
+# Admits the request or returns the response turning it away.
+
+def admit(request, endpoint_class):
+    config = settings.THROTTLE
+    shed_latency = config.get('SHED_LATENCY')
+    if shed_latency is not None and latency.get() > shed_latency * PRIORITIES[endpoint_class]:
+        turned_away(endpoint_class, 'load', 'ip:' + client_ip(request))
+        response = JsonResponse({'detail': 'The server is busy, please try again later'}, status = 503)
+        response['Retry-After'] = str(config.get('SHED_RETRY_AFTER', 5))
+        return response
+    keys = client_keys(request, endpoint_class)
+    cache_keys = ['auction:throttle:' + endpoint_class + ':' + key for scope, key in keys]
+    stored = cache.get_many(cache_keys)
+    now = time.time()
+    updated = {}
+    for (scope, key), cache_key in zip(keys, cache_keys):
+        rate, burst = config['RATES'][endpoint_class][scope.upper()]
+        arrival, wait = take(stored.get(cache_key), now, rate, burst)
+        if arrival is None:
+            turned_away(endpoint_class, scope, key)
+            return too_many_requests('Too many requests, please slow down', wait)
+        updated[cache_key] = (arrival, int(math.ceil(burst / rate)) + 1)
+    for cache_key, (arrival, timeout) in updated.items():
+        cache.set(cache_key, arrival, timeout)
+    return None
+
+
+# Middleware applying admission control to views marked with throttled, in the class given by the view's
+# throttle_class or else by request method, and measuring how long the views it admits take. Should come after the
+# authentication middleware.
+
+class ThrottleMiddleware(object):
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+        if getattr(request, 'throttle_admitted', False):
+            latency.observe(time.perf_counter() - start)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'view_class', None)
+        if not settings.THROTTLE['ENABLED'] or not getattr(view_class, 'throttled', False):
+            return None
+        endpoint_class = getattr(view_class, 'throttle_class', None)
+        if endpoint_class is None:
+            endpoint_class = 'read' if request.method in ('GET', 'HEAD', 'OPTIONS') else 'write'
+        response = admit(request, endpoint_class)
+        request.throttle_admitted = response is None
+        return response
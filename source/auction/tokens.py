@@ -0,0 +1,61 @@
+import hashlib
+import secrets
+import threading
+import time
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, router
+from django.utils import timezone
+
+from .models import APIToken
+
+
+# API tokens. A token is a long random string, so a fast hash is enough to store it safely, unlike passwords. Verified
+# tokens are remembered in the process for a short time, so a client sending many requests costs one lookup per TTL.
+# Revoking a token takes effect at once in the revoking process and within the TTL elsewhere.
+
+_verified = {}
+_lock = threading.Lock()
+
+
+def hash_key(key):
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+    
+    
+# Creates a token for the user. Returns the token and its key. Only the hash of the key is stored, so the key cannot
+# be shown again later.
+
+def issue_token(user, name = ''):
+    key = secrets.token_urlsafe(32)
+    token = APIToken.objects.create(user = user, key_hash = hash_key(key), name = name)
+    return token, key
+    
+    
+def revoke_token(token):
+    APIToken.objects.filter(pk = token.pk, revoked__isnull = True).update(revoked = timezone.now())
+    with _lock:
+        _verified.pop(token.key_hash, None)
+        
+        
+# Returns the active user the key belongs to, or None if the key is unknown or revoked. A key not found on a replica
+# may be one issued moments ago, so it is only remembered as unknown when the primary says so.
+
+def verify_token(key):
+    key_hash = hash_key(key)
+    now = time.time()
+    cached = _verified.get(key_hash)
+    if cached is not None and cached[1] > now:
+        return cached[0]
+    token = APIToken.objects.select_related('user').filter(key_hash = key_hash, revoked__isnull = True, user__is_active = True).first()
+    user = token.user if token is not None else None
+    if user is None and router.db_for_read(APIToken) != DEFAULT_DB_ALIAS:
+        return None
+    with _lock:
+        if len(_verified) >= settings.API_TOKEN_CACHE_SIZE:
+            _verified.clear()
+        _verified[key_hash] = (user, now + settings.API_TOKEN_CACHE_TTL)
+    return user
+    
+    
+def clear_cache():
+    with _lock:
+        _verified.clear()
@@ -27,5 +27,7 @@ urlpatterns = [
     url(r'^ban/(?P<pk>[0-9]+)/$', views.BanView.as_view(), name = 'ban'),
     url(r'^$', views.AuctionListAPIView.as_view(), name = 'auction_list_api'),
     url(r'^(?P<pk>[0-9]+)/$', views.AuctionDetailAPIView.as_view(), name = 'auction_detail_api'),
+    url(r'^(?P<pk>[0-9]+)/bids/$', views.AuctionBidsAPIView.as_view(), name = 'auction_bids_api'),
+    url(r'^export/$', views.ExportView.as_view(), name = 'export'),
     url(r'^change_language/$', views.ChangeLanguageView.as_view(), name = 'change_language'),
 ]
\ No newline at end of file
@@ -1,33 +1,64 @@
 import base64
+import binascii
+import copy
 import json
-import time
-import urllib.request
 from datetime import timedelta
-from decimal import Decimal
+from decimal import Decimal, InvalidOperation
+from django.conf import settings
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.contrib.auth import views as auth_views
-from django.core.mail import send_mail
 from django.core.exceptions import PermissionDenied
-from django.http import HttpResponseRedirect, JsonResponse
+from django.db import transaction
+from django.http import Http404, HttpResponse, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
+from django.core.cache import cache
 from django.shortcuts import render
+from django.template.loader import render_to_string
 from django.urls import reverse, reverse_lazy
 from django.utils import timezone, translation
 from django.utils.decorators import method_decorator
+from django.utils.http import urlencode
+from django.utils.safestring import mark_safe
 from django.views import generic, View
 from django.views.decorators.csrf import csrf_exempt
+from django.views.generic.detail import SingleObjectMixin
 from django.views.generic.edit import FormView, CreateView, UpdateView
 
-from .models import Auction, Bid
+from . import caching, metrics, push, rates, scheduler, search, tokens
+from .export import EXPORTS, FORMATS, export_lines, parse_watermark
+from .models import APIToken, Auction, Bid, ProxyBid, QueuedBid
+from .notifications import enqueue_mail, enqueue_mails
+from .pagination import InvalidCursor, KeysetPage, keyset_page
 from .forms import UserForm, AuctionConfirmForm, BidForm, ChangeLanguageForm
 
 
-# Home page. Contains a list of all auctions.
+# Home page. Contains a list of all auctions, a page at a time. The rendered list is cached per page until an auction
+# is created, banned or resolved.
 
 class AuctionListView(generic.ListView):
 
     model = Auction
+    ORDERINGS = ['deadline', '-deadline', 'price', '-price']
+    replica_reads = True
+    
+    def get_queryset(self):
+        auctions = Auction.objects.values('id', 'title', 'deadline', 'price')
+        if not self.request.user.is_staff:
+            auctions = auctions.filter(status = Auction.ACTIVE)
+        return auctions
+        
+    def get_context_data(self, **kwargs):
+        context = super(AuctionListView, self).get_context_data(**kwargs)
+        context['order'] = self.request.GET.get('order') if self.request.GET.get('order') in self.ORDERINGS else 'deadline'
+        context['cursor'] = self.request.GET.get('cursor')
+        try:
+            context['page'] = KeysetPage(context['object_list'], context['order'], context['cursor'], settings.AUCTION_LIST_PAGE_SIZE)
+        except InvalidCursor:
+            raise Http404
+        context['list_version'] = caching.list_version()
+        context['cache_timeout'] = caching.page_timeout(settings.AUCTION_LIST_CACHE_TIMEOUT)
+        return context
         
 
 # Results of a search for auctions.
@@ -36,35 +67,44 @@ class SearchView(generic.ListView):
     
     model = Auction
     template_name = 'auction/search.html'
+    context_object_name = 'auction_list'
+    replica_reads = True
     
     def get_queryset(self):
-        return Auction.objects.filter(title__icontains = self.request.GET['search'])
+        return search.search_auctions(self.request.GET['search'], status = None if self.request.user.is_staff else Auction.ACTIVE)
         
 
-# Details of specified auction.
+# Details of specified auction. The part of the page about the auction is cached per auction version, rate table and
+# language, so a page served from the cache costs no queries. The links depending on the user are added on each request.
         
 class AuctionDetailView(generic.DetailView):
 
     model = Auction
     
-    def dispatch(self, *args, **kwargs):
-        if not self.request.user.is_staff and not self.get_object().is_active():
+    def get(self, request, *args, **kwargs):
+        table = rates.get_rates()
+        key = caching.detail_key(kwargs['pk'], table.fetched if table is not None else None, translation.get_language())
+        cached = cache.get(key)
+        if cached is None:
+            self.object = self.get_object()
+            cached = {
+                'seller': self.object.seller,
+                'status': self.object.status,
+                'html': render_to_string('auction/auction_info.html', {
+                    'auction': self.object,
+                    'currencies': rates.convert(table, self.object.price) if table is not None else {},
+                }),
+            }
+            cache.set(key, cached, caching.page_timeout(settings.AUCTION_DETAIL_CACHE_TIMEOUT))
+        is_active = cached['status'] == Auction.ACTIVE
+        if not request.user.is_staff and not is_active:
             raise PermissionDenied
-        return super(AuctionDetailView, self).dispatch(*args, **kwargs)
-    
-    def get_context_data(self, **kwargs):
-        context = super(AuctionDetailView, self).get_context_data(**kwargs)
-        context['is_seller'] = context['auction'].seller == self.request.user.username
-        response = urllib.request.urlopen('https://openexchangerates.org/api/latest.json?app_id=52a1bd80785b4cc7896a137d206b5ce0')
-        content = response.read()
-        data = json.loads(content)
-        rate = 1 / float(data['rates']['EUR'])
-        usd = float(context['auction'].price) * rate
-        context['currencies'] = {}
-        for key in data['rates'].keys():
-            context['currencies'][key] = format(usd * float(data['rates'][key]), '.2f')
-        context['is_active'] = context['auction'].is_active()
-        return context
+        return render(request, 'auction/auction_detail.html', {
+            'auction_id': kwargs['pk'],
+            'auction_info': mark_safe(cached['html']),
+            'is_seller': cached['seller'] == request.user.username,
+            'is_active': is_active,
+        })
     
     
 # Links to editing user information.
@@ -132,46 +172,62 @@ class NewAuctionConfirmView(View):
                 price = form.cleaned_data['price'],
                 deadline = form.cleaned_data['deadline'] if form.cleaned_data['deadline'] >= timezone.now() + timedelta(days = 3) else timezone.now() + timedelta(days = 3)
             )
-            auction.save()
-            send_mail('Auction created', 'Your auction was successfully created. Link to auction details: https://pengstro.pythonanywhere.com/auction/' + str(auction.pk), 'pengstro@abo.fi', [request.user.email])
+            with transaction.atomic():
+                auction.save()
+                enqueue_mail('Auction created', 'Your auction was successfully created. Link to auction details: https://pengstro.pythonanywhere.com/auction/' + str(auction.pk), 'pengstro@abo.fi', [request.user.email], dedup_key = 'auction-created:' + str(auction.pk))
             return HttpResponseRedirect(reverse('index'))
             
 
+# Loads the auction of the request once, with only the columns the view needs, and keeps it for the rest of the
+# request, so that permission checks in dispatch, the form and the view itself all share one query.
+
+class AuctionObjectMixin(SingleObjectMixin):
+
+    model = Auction
+    auction_fields = None
+    
+    def get_queryset(self):
+        queryset = super(AuctionObjectMixin, self).get_queryset()
+        return queryset.only(*self.auction_fields) if self.auction_fields is not None else queryset
+        
+    def get_object(self, queryset = None):
+        if getattr(self, 'auction', None) is None:
+            self.auction = super(AuctionObjectMixin, self).get_object(queryset)
+        return self.auction
+        
+        
 # Form for editing the item description of a given auction.
             
 @method_decorator(login_required, name = 'dispatch')
-class EditDescriptionView(UpdateView):
+class EditDescriptionView(AuctionObjectMixin, UpdateView):
     
-    model = Auction
     fields = ['item_description']
     template_name = 'auction/edit_description.html'
+    auction_fields = ['seller', 'status', 'item_description']
     
     def dispatch(self, *args, **kwargs):
-        if self.get_object().seller != self.request.user.username or not self.get_object().is_active():
+        auction = self.get_object()
+        if auction.seller != self.request.user.username or not auction.is_active():
             raise PermissionDenied
         return super(EditDescriptionView, self).dispatch(*args, **kwargs)
         
     def form_valid(self, form):
-        auction = form.instance
-        if not auction.is_active():
+        updated = Auction.objects.filter(pk = self.object.pk, seller = self.request.user.username, status = Auction.ACTIVE).update(item_description = form.cleaned_data['item_description'], modified = timezone.now())
+        if updated == 0:
             raise PermissionDenied
-        while auction.locked_by != '' and auction.locked_by != self.request.user.username:
-            time.sleep(1)
-        auction.locked_by = self.request.user.username
-        auction.save()
-        redirect = super(EditDescriptionView, self).form_valid(form)
-        auction.locked_by = ''
-        auction.save()
-        return redirect
+        search.index_auctions([self.object.pk])
+        caching.bump_auction_version(self.object.pk)
+        return HttpResponseRedirect(self.get_success_url())
         
-# Form for bidding on auction.
+# Form for bidding on auction. The form gets a copy of the auction, since binding the form writes the bid into its
+# instance, and the auction as read is what the bid is checked against.
 
 @method_decorator(login_required, name = 'dispatch')
-class BidView(UpdateView):
+class BidView(AuctionObjectMixin, UpdateView):
 
-    model = Auction
     form_class = BidForm
     template_name = 'auction/bid.html'
+    auction_fields = ['status', 'seller', 'title', 'item_description', 'price', 'last_bidder', 'deadline']
     
     def dispatch(self, *args, **kwargs):
         auction = self.get_object()
@@ -181,47 +237,43 @@ class BidView(UpdateView):
         
     def get_form_kwargs(self):
         kwargs = super(BidView, self).get_form_kwargs()
-        kwargs['price'] = self.get_object().price
+        kwargs['instance'] = copy.copy(self.object)
+        kwargs['price'] = self.object.price
         return kwargs
         
     def form_valid(self, form):
-        auction = Auction.objects.get(pk = form.instance.id)
-        if not auction.is_active():
-            raise PermissionDenied
-        while auction.locked_by != '' and auction.locked_by != self.request.user.username:
-            time.sleep(1)
-        auction.locked_by = self.request.user.username
-        auction.save()
-        if auction.item_description != form.cleaned_data['item_description']:
-            auction.locked_by = ''
-            auction.save()
+        try:
+            bid(self.object, form.cleaned_data['price'], self.request.user, item_description = form.cleaned_data['item_description'])
+        except DescriptionChanged:
             return render(self.request, 'auction/description_changed.html')
-        if auction.price >= form.cleaned_data['price']:
-            auction.locked_by = ''
-            auction.save()
+        except BidTooLow:
             return render(self.request, 'auction/outbid.html')
-        bid(auction, form.cleaned_data['price'], self.request.user)
-        auction.locked_by = ''
-        auction.save()
-        return HttpResponseRedirect(reverse('detail', kwargs = {'pk': form.instance.id}))
+        except BidRejected:
+            raise PermissionDenied
+        return HttpResponseRedirect(reverse('detail', kwargs = {'pk': self.object.pk}))
             
             
 # View for auction ban.
         
 @method_decorator(login_required, name = 'dispatch')
-class BanView(generic.TemplateView):
+class BanView(AuctionObjectMixin, generic.TemplateView):
 
     template_name = 'auction/ban.html'
+    auction_fields = ['status', 'seller', 'title', 'price', 'last_bidder', 'deadline']
     
     def dispatch(self, *args, **kwargs):
-        auction = Auction.objects.get(pk = kwargs['pk'])
-        if not self.request.user.is_staff or not auction.is_active():
+        if not self.request.user.is_staff:
             raise PermissionDenied
+        auction = self.object = self.get_object()
+        with transaction.atomic():
+            if Auction.objects.filter(pk = auction.pk, status = Auction.ACTIVE).update(status = Auction.BANNED, modified = timezone.now()) == 0:
+                raise PermissionDenied
+            search.set_status([auction.pk], Auction.BANNED)
+            enqueue_mail('Auction banned', 'Auction ' + auction.title + ' has been banned.', 'pengstro@abo.fi', auction.get_participant_mails(), dedup_key = 'ban:' + str(auction.pk))
+        caching.bump_list_version()
+        caching.bump_auction_version(auction.pk)
         auction.status = Auction.BANNED
-        auction.save()
-        recipients = [User.objects.get(username = auction.seller).email]
-        recipients.extend(auction.get_bidder_mails())
-        send_mail('Auction banned', 'Auction ' + auction.title + ' has been banned.', 'pengstro@abo.fi', recipients)
+        push.publish_auction(auction)
         return super(BanView, self).dispatch(*args, **kwargs)
         
     
@@ -240,124 +292,487 @@ class RegisterDoneView(generic.TemplateView):
     template_name = 'registration/register_done.html'
     
     
-# Browse/search via API.
+# Browse/search via API. Browsing returns active auctions a page at a time, sorted by deadline or price, with the URL
+# of the next page. A search by title returns the best matches; a title without any words browses instead, as it
+# matched every auction before the search index.
 
 class AuctionListAPIView(View):
+
+    replica_reads = True
+    throttled = True
+    FIELDS = ['id', 'title', 'seller', 'item_description', 'price', 'deadline']
+    SORT_FIELDS = ['deadline', '-deadline', 'price', '-price']
     
     def get(self, request):
+        status, payload = auction_list_data(request)
+        return JsonResponse(payload, status = status)
+        
+        
+# Data of the browse/search API as a status and the response content. Shared by the view and its asynchronous
+# version in async_api.py.
+
+def auction_list_data(request):
+    limit = page_limit(request)
+    if limit is None:
+        return 400, {'detail': 'Limit must be a number'}
+    next_url = None
+    if len(search.tokenize(request.GET.get('title', ''))) != 0:
+        pks = search.search(request.GET['title'], limit = limit)
+        auctions = {auction['id']: auction for auction in Auction.objects.filter(pk__in = pks).values(*AuctionListAPIView.FIELDS)}
+        rows = [auctions[pk] for pk in pks if pk in auctions]
+    else:
+        sort = request.GET.get('sort', 'deadline')
+        if sort not in AuctionListAPIView.SORT_FIELDS:
+            return 400, {'detail': 'Sort must be one of ' + ', '.join(AuctionListAPIView.SORT_FIELDS)}
         try:
-            auctions = Auction.objects.filter(title__icontains = request.GET['title'])
-        except KeyError:
-            auctions = Auction.objects.all()
-        data = []
-        for auction in auctions:
-            if auction.is_active():
-                data.append({})
-                index = len(data) - 1
-                data[index]['id'] = str(auction.id)
-                data[index]['title'] = auction.title
-                data[index]['seller'] = auction.seller
-                data[index]['item_description'] = auction.item_description
-                data[index]['highest_bid'] = auction.price
-                data[index]['deadline'] = auction.deadline
-        return JsonResponse({'data': data})
+            rows, cursor = keyset_page(Auction.objects.filter(status = Auction.ACTIVE).values(*AuctionListAPIView.FIELDS), sort, request.GET.get('cursor'), limit)
+        except InvalidCursor:
+            return 400, {'detail': 'Invalid cursor'}
+        if cursor is not None:
+            next_url = request.build_absolute_uri(reverse('auction:auction_list_api') + '?' + urlencode({'sort': sort, 'limit': limit, 'cursor': cursor}))
+    data = []
+    for row in rows:
+        data.append({
+            'id': str(row['id']),
+            'title': row['title'],
+            'seller': row['seller'],
+            'item_description': row['item_description'],
+            'highest_bid': row['price'],
+            'deadline': row['deadline'],
+        })
+    return 200, {'data': data, 'next': next_url}
+        
+        
+# Page size asked for in an API request, or None if it is not a positive number.
+
+def page_limit(request):
+    try:
+        limit = min(int(request.GET.get('limit', settings.API_PAGE_SIZE)), settings.API_MAX_PAGE_SIZE)
+    except ValueError:
+        return None
+    return limit if limit >= 1 else None
+    
+    
+# Bulk export of auctions or bids for staff, streamed as NDJSON or CSV.
+
+@method_decorator(login_required, name = 'dispatch')
+class ExportView(View):
+
+    def get(self, request):
+        if not request.user.is_staff:
+            raise PermissionDenied
+        kind = request.GET.get('type', 'auctions')
+        export_format = request.GET.get('format', 'ndjson')
+        if kind not in EXPORTS or export_format not in FORMATS:
+            return JsonResponse({'detail': 'Unknown export type or format'}, status = 400)
+        try:
+            since = parse_watermark(kind, request.GET['since']) if 'since' in request.GET else None
+            after = int(request.GET.get('after', 0))
+        except ValueError:
+            return JsonResponse({'detail': 'Since must be an id for bids and a time for auctions, and after an id'}, status = 400)
+        return StreamingHttpResponse(export_lines(kind, export_format, since, after), content_type = FORMATS[export_format])
         
         
 # View auction details via API.
 
 class AuctionDetailAPIView(View):
 
+    replica_reads = True
+    throttled = True
+    
     def get(self, request, pk):
+        status, payload = auction_detail_data(pk)
+        return JsonResponse(payload, status = status)
+        
+        
+# Data of the auction detail API as a status and the response content.
+
+def auction_detail_data(pk):
+    try:
+        auction = Auction.objects.get(pk = pk)
+    except Auction.DoesNotExist:
+        return 404, {'detail': 'No auction with the given ID exists'}
+    if not auction.is_active():
+        return 403, {'detail': 'This auction is no longer active'}
+    data = {}
+    data['id'] = str(auction.id)
+    data['title'] = auction.title
+    data['seller'] = auction.seller
+    data['item_description'] = auction.item_description
+    highest_bid = auction.get_highest_bid()
+    data['highest_bid'] = highest_bid.amount if highest_bid is not None else auction.price
+    data['deadline'] = auction.deadline
+    return 200, {'data': data}
+        
+        
+# Bid history of an auction via API, highest bid first, a page at a time.
+
+class AuctionBidsAPIView(View):
+
+    throttled = True
+
+    def get(self, request, pk):
+        limit = page_limit(request)
+        if limit is None:
+            return JsonResponse({'detail': 'Limit must be a number'}, status = 400)
         try:
-            auction = Auction.objects.get(pk = pk)
+            auction = Auction.objects.only('status').get(pk = pk)
         except Auction.DoesNotExist:
             return JsonResponse({'detail': 'No auction with the given ID exists'}, status = 404)
         if not auction.is_active():
             return JsonResponse({'detail': 'This auction is no longer active'}, status = 403)
-        data = {}
-        data['id'] = str(auction.id)
-        data['title'] = auction.title
-        data['seller'] = auction.seller
-        data['item_description'] = auction.item_description
-        data['highest_bid'] = auction.price
-        data['deadline'] = auction.deadline
-        return JsonResponse({'data': data})
+        try:
+            bids, cursor = keyset_page(Bid.objects.filter(auction_id = auction.pk).select_related('bidder'), '-amount', request.GET.get('cursor'), limit)
+        except InvalidCursor:
+            return JsonResponse({'detail': 'Invalid cursor'}, status = 400)
+        next_url = None
+        if cursor is not None:
+            next_url = request.build_absolute_uri(reverse('auction:auction_bids_api', kwargs = {'pk': auction.pk}) + '?' + urlencode({'limit': limit, 'cursor': cursor}))
+        return JsonResponse({'data': [bid_data(bid) for bid in bids], 'next': next_url})
         
         
-# Bid via API.
+# Authenticates an API request by an API token (Authorization: Token <key>) or by HTTP Basic credentials. Returns the
+# user and None, or None and the error response.
+
+def authenticate_api_request(request):
+    try:
+        auth_header = request.META['HTTP_AUTHORIZATION']
+    except KeyError:
+        return None, JsonResponse({'detail': 'No credentials given'}, status = 401)
+    scheme, _, credentials = auth_header.partition(' ')
+    if scheme.lower() in ('token', 'bearer'):
+        user = tokens.verify_token(credentials.strip())
+        if user is None:
+            return None, JsonResponse({'detail': 'Invalid or revoked token'}, status = 401)
+        return user, None
+    try:
+        username, password = base64.b64decode(credentials).decode('utf-8').split(':', 1)
+    except (ValueError, binascii.Error):
+        return None, JsonResponse({'detail': 'Credentials wrongly formatted'}, status = 401)
+    user = authenticate(username = username, password = password)
+    if user is None:
+        return None, JsonResponse({'detail': 'Incorrect username or password'}, status = 401)
+    return user, None
+    
+    
+# Issuing API tokens. Requires the username and password, so it is throttled as a login.
 
 @method_decorator(csrf_exempt, name = 'dispatch')
-class BidAPIView(View):
+class TokenAPIView(View):
+
+    throttled = True
+    throttle_class = 'login'
     
     def post(self, request):
+        user, error = authenticate_api_request(request)
+        if error is not None:
+            return error
+        if request.META['HTTP_AUTHORIZATION'].partition(' ')[0].lower() != 'basic':
+            return JsonResponse({'detail': 'Tokens can only be issued with a username and password'}, status = 403)
         try:
-            auth_header = request.META['HTTP_AUTHORIZATION']
-        except KeyError:
-            return JsonResponse({'detail': 'No credentials given'}, status = 401)
-        encoded_credentials = auth_header.split(' ')[1]
-        decoded_credentials = base64.b64decode(encoded_credentials).decode("utf-8").split(':')
-        username = decoded_credentials[0]
-        password = decoded_credentials[1]
-        user = authenticate(username = username, password = password)
-        if user is None:
-            return JsonResponse({'detail': 'Incorrect username or password'}, status = 401)
-        body_unicode = request.body.decode('utf-8')
+            name = json.loads(request.body.decode('utf-8')).get('name', '') if len(request.body) != 0 else ''
+        except (ValueError, AttributeError):
+            return JsonResponse({'detail': 'JSON wrongly formatted'}, status = 400)
+        token, key = tokens.issue_token(user, str(name)[:100])
+        response = JsonResponse({'data': {'id': str(token.id), 'name': token.name, 'token': key, 'created': token.created}}, status = 201)
+        response['Location'] = request.build_absolute_uri(token.get_absolute_url())
+        return response
+        
+        
+# Revoking API tokens.
+
+@method_decorator(csrf_exempt, name = 'dispatch')
+class TokenDetailAPIView(View):
+
+    def delete(self, request, pk):
+        user, error = authenticate_api_request(request)
+        if error is not None:
+            return error
+        try:
+            token = APIToken.objects.get(pk = pk, user = user)
+        except APIToken.DoesNotExist:
+            return JsonResponse({'detail': 'No token with the given ID exists'}, status = 404)
+        tokens.revoke_token(token)
+        return HttpResponse(status = 204)
+        
+        
+# Bid via API. With settings.BID_QUEUE['ENABLED'] the bid is queued for the sequencer of the auction instead of being
+# placed at once, and the answer points to the queued bid, see sequencer.py.
+
+@method_decorator(csrf_exempt, name = 'dispatch')
+class BidAPIView(View):
+
+    throttled = True
+    
+    # Bids of the user, latest first, a page at a time.
+    
+    def get(self, request):
+        user, error = authenticate_api_request(request)
+        if error is not None:
+            return error
+        limit = page_limit(request)
+        if limit is None:
+            return JsonResponse({'detail': 'Limit must be a number'}, status = 400)
+        try:
+            bids, cursor = keyset_page(Bid.objects.filter(bidder = user).select_related('auction'), '-created', request.GET.get('cursor'), limit)
+        except InvalidCursor:
+            return JsonResponse({'detail': 'Invalid cursor'}, status = 400)
+        next_url = None
+        if cursor is not None:
+            next_url = request.build_absolute_uri(reverse('bid_api') + '?' + urlencode({'limit': limit, 'cursor': cursor}))
+        data = []
+        for bid_object in bids:
+            bid_object.bidder = user
+            row = bid_data(bid_object)
+            row['auction_title'] = bid_object.auction.title
+            row['price'] = str(bid_object.auction.price)
+            row['leading'] = bid_object.auction.last_bidder == user.username
+            data.append(row)
+        return JsonResponse({'data': data, 'next': next_url})
+        
+    def post(self, request):
+        user, error = authenticate_api_request(request)
+        if error is not None:
+            return error
         try:
-            data = json.loads(body_unicode)
-        except json.JSONDecodeError:
+            data = json.loads(request.body.decode('utf-8'))
+        except (ValueError, UnicodeError):
             return JsonResponse({'detail': 'JSON wrongly formatted'}, status = 400)
-        if 'auction_id' not in data:
+        if not isinstance(data, dict) or 'auction_id' not in data:
             return JsonResponse({'detail': 'Auction ID not given'}, status = 400)
         if 'bid' not in data:
             return JsonResponse({'detail': 'Bid amount not given'}, status = 400)
+        auction_id = parse_auction_id(data['auction_id'])
+        if auction_id is None:
+            return JsonResponse({'detail': 'Auction ID wrongly formatted'}, status = 400)
         try:
-            auction = Auction.objects.get(pk = data['auction_id'])
+            auction = Auction.objects.get(pk = auction_id)
         except Auction.DoesNotExist:
             return JsonResponse({'detail': 'No auction with the given ID exists'}, status = 404)
-        if not auction.is_active():
-            return JsonResponse({'detail': 'This auction is no longer active'}, status = 403)
-        if auction.seller == user.username:
-            return JsonResponse({'detail': 'You cannot bid on your own auction'}, status = 403)
-        amount = Decimal(data['bid'])
-        while auction.locked_by != '' and auction.locked_by != username:
-            time.sleep(1)
-        auction.locked_by = username
-        auction.save()
-        if amount < auction.price + Decimal('0.01'):
-            return JsonResponse({'detail': 'Bid must be greater than previous bid'}, status = 400)
-        bid_object = bid(auction, amount, user)
-        auction.locked_by = ''
-        auction.save()
-        response = JsonResponse({'data': {'id': str(bid_object.id), 'auction_id': str(bid_object.auction.id), 'bidder': bid_object.bidder, 'amount': str(bid_object.amount)}}, status = 201)
+        amount = parse_amount(data['bid'])
+        if amount is None:
+            return JsonResponse({'detail': 'Bid amount wrongly formatted'}, status = 400)
+        if settings.BID_QUEUE['ENABLED']:
+            queued = QueuedBid.objects.create(auction = auction, bidder = user, amount = amount)
+            response = JsonResponse({'data': queued_bid_data(queued)}, status = 202)
+            response['Location'] = request.build_absolute_uri(queued.get_absolute_url())
+            return response
+        try:
+            bid_object = bid(auction, amount, user)
+        except BidRejected as error:
+            status, detail = rejection_response(error)
+            return JsonResponse({'detail': detail}, status = status)
+        response = JsonResponse({'data': bid_data(bid_object)}, status = 201)
         response['Location'] = request.build_absolute_uri(bid_object.get_absolute_url())
         return response
         
         
+# Several bids via API in one request. Each bid is placed on its own, in the order given, and gets its own status in
+# the response with the same meaning as for a single bid. The auctions are read in one query, and the mails about the
+# bids are added to the outbox in one insert, one mail per auction.
+
+@method_decorator(csrf_exempt, name = 'dispatch')
+class BidBatchAPIView(View):
+
+    throttled = True
+
+    def post(self, request):
+        user, error = authenticate_api_request(request)
+        if error is not None:
+            return error
+        try:
+            data = json.loads(request.body.decode('utf-8'))
+        except (ValueError, UnicodeError):
+            return JsonResponse({'detail': 'JSON wrongly formatted'}, status = 400)
+        items = data.get('bids') if isinstance(data, dict) else None
+        if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+            return JsonResponse({'detail': 'Bids not given'}, status = 400)
+        if len(items) > settings.BID_BATCH_MAX_SIZE:
+            return JsonResponse({'detail': 'At most ' + str(settings.BID_BATCH_MAX_SIZE) + ' bids can be given at once'}, status = 400)
+        auctions = Auction.objects.in_bulk([parse_auction_id(item.get('auction_id')) for item in items if parse_auction_id(item.get('auction_id')) is not None])
+        placed = {}
+        results = [self.place(item, auctions, user, placed) for item in items]
+        enqueue_bid_mails(placed)
+        return JsonResponse({'data': results})
+        
+    def place(self, item, auctions, user, placed):
+        if 'auction_id' not in item:
+            return {'status': 400, 'detail': 'Auction ID not given'}
+        if 'bid' not in item:
+            return {'status': 400, 'detail': 'Bid amount not given'}
+        auction_id = parse_auction_id(item['auction_id'])
+        if auction_id is None:
+            return {'status': 400, 'detail': 'Auction ID wrongly formatted'}
+        auction = auctions.get(auction_id)
+        if auction is None:
+            return {'status': 404, 'detail': 'No auction with the given ID exists'}
+        amount = parse_amount(item['bid'])
+        if amount is None:
+            return {'status': 400, 'detail': 'Bid amount wrongly formatted'}
+        try:
+            bid_object, previous_bidder = place_bid(auction, amount, user, notify = False)
+        except BidRejected as error:
+            status, detail = rejection_response(error)
+            return {'status': status, 'detail': detail}
+        track_placed(placed, auction, bid_object, user, previous_bidder)
+        return {'status': 201, 'data': bid_data(bid_object)}
+        
+        
+# Bookkeeping of bids placed with notify set to False, by auction: the auction, the users to tell and the bids.
+
+def track_placed(placed, auction, bid_object, bidder, previous_bidder):
+    if auction.pk not in placed:
+        placed[auction.pk] = (auction, set([auction.seller, previous_bidder]), [])
+    placed[auction.pk][1].update([bidder.username, auction.last_bidder])
+    placed[auction.pk][2].append(bid_object)
+    
+    
+# Adds the mails about the placed bids to the outbox in one insert, one mail per auction.
+
+def enqueue_bid_mails(placed):
+    if len(placed) == 0:
+        return
+    usernames = set().union(*[usernames for auction, usernames, bids in placed.values()])
+    emails = dict(User.objects.filter(username__in = usernames).values_list('username', 'email'))
+    mails = []
+    for auction, usernames, bids in placed.values():
+        message = 'A new bid has been registered for auction ' + auction.title + '.' if len(bids) == 1 else str(len(bids)) + ' new bids have been registered for auction ' + auction.title + '.'
+        mails.append(('Bid registered', message, 'pengstro@abo.fi', [emails.get(username, '') for username in sorted(usernames)], 'bid:' + str(bids[-1].pk)))
+    enqueue_mails(mails)
+        
+        
+
 # View bid details via API.
 
 class BidDetailAPIView(View):
 
     def get(self, request, pk):
+        user, error = authenticate_api_request(request)
+        if error is not None:
+            return error
         try:
-            auth_header = request.META['HTTP_AUTHORIZATION']
-        except KeyError:
-            return JsonResponse({'detail': 'No credentials given'}, status = 401)
-        encoded_credentials = auth_header.split(' ')[1]
-        decoded_credentials = base64.b64decode(encoded_credentials).decode("utf-8").split(':')
-        username = decoded_credentials[0]
-        password = decoded_credentials[1]
-        user = authenticate(username = username, password = password)
-        if user is None:
-            return JsonResponse({'detail': 'Incorrect username or password'}, status = 401)
-        bid = Bid.objects.get(pk = pk)
-        if user.username != bid.bidder:
+            bid = Bid.objects.get(pk = pk)
+        except Bid.DoesNotExist:
+            return JsonResponse({'detail': 'No bid with the given ID exists'}, status = 404)
+        if bid.bidder_id != user.pk:
             return JsonResponse({'detail': 'You cannot view another user\'s bid'}, status = 403)
-        data = {}
-        data['id'] = str(pk)
-        data['auction_id'] = str(bid.auction.id)
-        data['bidder'] = bid.bidder
-        data['amount'] = str(bid.amount)
-        return JsonResponse({'data': data})
+        bid.bidder = user
+        return JsonResponse({'data': bid_data(bid)})
+        
+        
+def bid_data(bid):
+    return {
+        'id': str(bid.id),
+        'auction_id': str(bid.auction_id),
+        'bidder': bid.bidder.username,
+        'amount': str(bid.amount),
+        'created': bid.created,
+    }
+        
+        
+# View a queued bid via API, to see whether it has been placed.
+
+class QueuedBidDetailAPIView(View):
+
+    def get(self, request, pk):
+        user, error = authenticate_api_request(request)
+        if error is not None:
+            return error
+        try:
+            queued = QueuedBid.objects.select_related('bid').get(pk = pk, bidder = user)
+        except QueuedBid.DoesNotExist:
+            return JsonResponse({'detail': 'No queued bid with the given ID exists'}, status = 404)
+        queued.bidder = user
+        return JsonResponse({'data': queued_bid_data(queued)})
+        
+        
+def queued_bid_data(queued):
+    if queued.bid is not None:
+        queued.bid.bidder = queued.bidder
+    return {
+        'id': str(queued.id),
+        'auction_id': str(queued.auction_id),
+        'bidder': queued.bidder.username,
+        'amount': str(queued.amount),
+        'status': queued.get_status_display().lower(),
+        'detail': queued.detail,
+        'bid': bid_data(queued.bid) if queued.bid is not None else None,
+        'created': queued.created,
+    }
+    
+    
+# Proxy bid via API.
+
+@method_decorator(csrf_exempt, name = 'dispatch')
+class ProxyBidAPIView(View):
+
+    throttled = True
+
+    def post(self, request):
+        user, error = authenticate_api_request(request)
+        if error is not None:
+            return error
+        try:
+            data = json.loads(request.body.decode('utf-8'))
+        except (ValueError, UnicodeError):
+            return JsonResponse({'detail': 'JSON wrongly formatted'}, status = 400)
+        if not isinstance(data, dict) or 'auction_id' not in data:
+            return JsonResponse({'detail': 'Auction ID not given'}, status = 400)
+        if 'maximum' not in data:
+            return JsonResponse({'detail': 'Maximum not given'}, status = 400)
+        maximum = parse_amount(data['maximum'])
+        if maximum is None:
+            return JsonResponse({'detail': 'Maximum wrongly formatted'}, status = 400)
+        auction_id = parse_auction_id(data['auction_id'])
+        if auction_id is None:
+            return JsonResponse({'detail': 'Auction ID wrongly formatted'}, status = 400)
+        try:
+            auction = Auction.objects.get(pk = auction_id)
+        except Auction.DoesNotExist:
+            return JsonResponse({'detail': 'No auction with the given ID exists'}, status = 404)
+        try:
+            proxy = proxy_bid(auction, maximum, user)
+        except BidRejected as error:
+            status, detail = rejection_response(error)
+            return JsonResponse({'detail': detail}, status = status)
+        response = JsonResponse({'data': proxy_bid_data(proxy)}, status = 201)
+        response['Location'] = request.build_absolute_uri(proxy.get_absolute_url())
+        return response
+        
+        
+# View proxy bid details via API. The auction's current price and leader show whether the maximum has been reached.
+
+class ProxyBidDetailAPIView(View):
+
+    def get(self, request, pk):
+        user, error = authenticate_api_request(request)
+        if error is not None:
+            return error
+        try:
+            proxy = ProxyBid.objects.select_related('auction').get(pk = pk, bidder = user)
+        except ProxyBid.DoesNotExist:
+            return JsonResponse({'detail': 'No proxy bid with the given ID exists'}, status = 404)
+        return JsonResponse({'data': proxy_bid_data(proxy)})
+        
+        
+def proxy_bid_data(proxy):
+    return {
+        'id': str(proxy.id),
+        'auction_id': str(proxy.auction_id),
+        'maximum': str(proxy.maximum),
+        'price': str(proxy.auction.price),
+        'leader': proxy.auction.last_bidder,
+    }
+    
+    
+# Request metrics in the Prometheus text format, for the addresses allowed to scrape them and for staff.
+
+class MetricsView(View):
+
+    def get(self, request):
+        if request.META.get('REMOTE_ADDR') not in settings.METRICS.get('ALLOWED_IPS', []) and not request.user.is_staff:
+            raise PermissionDenied
+        return HttpResponse(metrics.collector.render(), content_type = 'text/plain; version=0.0.4; charset=utf-8')
         
         
 # Form for changing language.
@@ -388,18 +803,160 @@ class LoginView(auth_views.LoginView):
         return super(LoginView, self).form_valid(form)
         
         
-# Bidding.
-
-def bid(auction, amount, bidder):
-    seller = User.objects.get(username = auction.seller)
-    recipients = [seller.email, bidder.email] if auction.last_bidder == '' or auction.last_bidder == bidder.username else [seller.email, bidder.email, User.objects.get(username = auction.last_bidder).email]
-    send_mail('Bid registered', 'A new bid has been registered for auction ' + auction.title + '.', 'pengstro@abo.fi', recipients)
-    auction.price = amount
-    auction.add_bidder(bidder.pk)
-    auction.last_bidder = bidder.username
-    if auction.deadline - timezone.now() < timedelta(minutes = 5):
-        auction.deadline += timedelta(minutes = 5)
-    auction.save()
-    bid = Bid(auction = auction, bidder = bidder.username, amount = amount)
-    bid.save()
-    return bid
\ No newline at end of file
+# Reasons for bid() to reject a bid.
+
+class BidRejected(Exception):
+    pass
+    
+    
+class AuctionInactive(BidRejected):
+    pass
+    
+    
+class OwnAuction(BidRejected):
+    pass
+    
+    
+class DescriptionChanged(BidRejected):
+    pass
+    
+    
+class BidTooLow(BidRejected):
+    pass
+    
+    
+# Status code and message of the bid API for a rejected bid.
+
+def rejection_response(error):
+    if isinstance(error, AuctionInactive):
+        return 403, 'This auction is no longer active'
+    if isinstance(error, OwnAuction):
+        return 403, 'You cannot bid on your own auction'
+    if isinstance(error, BidTooLow):
+        return 400, 'Bid must be greater than previous bid'
+    return 400, 'Bid rejected'
+    
+    
+# Parses an auction ID given via API, as a number or a string of digits. Returns None if it is not one.
+
+def parse_auction_id(value):
+    if isinstance(value, bool) or not isinstance(value, (int, str)) or not str(value).isdigit():
+        return None
+    return int(value)
+    
+    
+# Parses a bid amount given via API. Returns None if it is not a valid amount.
+
+def parse_amount(value):
+    if isinstance(value, float) or isinstance(value, bool):
+        value = str(value)
+    try:
+        amount = Decimal(value)
+    except (InvalidOperation, TypeError, ValueError):
+        return None
+    if not amount.is_finite() or amount <= 0 or amount != amount.quantize(Decimal('0.01')) or amount >= Decimal('1e13'):
+        return None
+    return amount
+    
+    
+# Bidding. The auction row is updated with a compare-and-set on its price, so concurrent bids on the same auction
+# never overwrite each other and no lock is held outside the database. If another bid gets in between reading and
+# writing the row, the bid is validated again against the new state.
+
+def bid(auction, amount, bidder, item_description = None):
+    bid, previous_bidder = place_bid(auction, amount, bidder, item_description)
+    return bid
+    
+    
+# Registers a proxy bid: bids are placed on the bidder's behalf up to the maximum whenever others bid. Unless the
+# bidder already leads, the lowest possible bid is placed at once. Returns the proxy bid.
+
+def proxy_bid(auction, maximum, bidder):
+    place_bid(auction, None, bidder, maximum = maximum)
+    return ProxyBid.objects.get(auction = auction, bidder = bidder)
+    
+    
+# Answers a bid with the highest standing proxy bid of another user, found in one lookup on the proxy bid index. The
+# higher maximum leads at one cent over the lower one, and of equal maxima the earlier one. Returns the bids to record
+# as pairs of user and amount, the leader, the price and the user of the proxy bid, if any.
+
+def answer_proxies(auction, previous_price, bidder, amount, limit):
+    rival = ProxyBid.objects.select_related('bidder').filter(auction = auction, maximum__gt = previous_price).exclude(bidder = bidder).order_by('-maximum', 'created').first()
+    if rival is None:
+        return [(bidder, amount)], bidder, amount, None
+    if rival.maximum >= limit:
+        price = min(rival.maximum, limit + Decimal('0.01'))
+        return [(bidder, limit), (rival.bidder, price)], rival.bidder, price, rival.bidder
+    price = max(amount, min(limit, rival.maximum + Decimal('0.01')))
+    return [(rival.bidder, rival.maximum), (bidder, price)], bidder, price, rival.bidder
+    
+    
+# Places a bid on the auction as last read in current, which is updated to the state after the bid. Standing proxy
+# bids are answered after the auction row has been updated, so that they cannot change before the bid commits. With a
+# maximum the bid is a proxy bid, and the amount is worked out from the price; a bidder already leading only raises
+# the maximum and gets no bid. With notify set to False no mail is enqueued, and the caller is responsible for it.
+# With publish set to False the cache, watchers and scheduler are not told about the bid either, for callers
+# committing it later. Returns the bid and the previous bidder.
+
+def place_bid(current, amount, bidder, item_description = None, notify = True, maximum = None, publish = True):
+    while True:
+        if not current.is_active():
+            raise AuctionInactive
+        if current.seller == bidder.username:
+            raise OwnAuction
+        if item_description is not None and current.item_description != item_description:
+            raise DescriptionChanged
+        previous_bidder = current.last_bidder
+        previous_price = current.price
+        if maximum is not None and previous_bidder == bidder.username:
+            if maximum < previous_price:
+                raise BidTooLow
+            with transaction.atomic():
+                updated = Auction.objects.filter(pk = current.pk, status = Auction.ACTIVE, price = previous_price, last_bidder = bidder.username).update(last_bidder = bidder.username)
+                if updated != 0:
+                    ProxyBid.objects.update_or_create(auction = current, bidder = bidder, defaults = {'maximum': maximum, 'created': timezone.now()})
+            if updated == 0:
+                current.refresh_from_db()
+                continue
+            return None, previous_bidder
+        if maximum is not None:
+            amount = previous_price + Decimal('0.01')
+        if amount < previous_price + Decimal('0.01') or (maximum is not None and maximum < amount):
+            raise BidTooLow
+        extended = current.deadline - timezone.now() < timedelta(minutes = 5)
+        deadline = current.deadline + timedelta(minutes = 5) if extended else current.deadline
+        with transaction.atomic():
+            updated = Auction.objects.filter(pk = current.pk, status = Auction.ACTIVE, price = previous_price, item_description = current.item_description).update(
+                price = amount,
+                last_bidder = bidder.username,
+                deadline = deadline,
+                modified = timezone.now(),
+            )
+            if updated != 0:
+                bids, leader, price, rival = answer_proxies(current, previous_price, bidder, amount, maximum if maximum is not None else amount)
+                if leader != bidder or price != amount:
+                    Auction.objects.filter(pk = current.pk).update(price = price, last_bidder = leader.username, modified = timezone.now())
+                if maximum is not None:
+                    ProxyBid.objects.update_or_create(auction = current, bidder = bidder, defaults = {'maximum': maximum, 'created': timezone.now()})
+                current.price = price
+                current.last_bidder = leader.username
+                current.deadline = deadline
+                current.add_bidder(bidder)
+                for user, bid_amount in bids:
+                    bid_object = Bid(auction = current, bidder = user, amount = bid_amount)
+                    bid_object.save()
+                    if user == bidder:
+                        bid = bid_object
+                if notify:
+                    usernames = [current.seller, bidder.username, previous_bidder] + ([rival.username] if rival is not None else [])
+                    recipients = User.objects.filter(username__in = usernames).values_list('email', flat = True)
+                    enqueue_mail('Bid registered', 'A new bid has been registered for auction ' + current.title + '.', 'pengstro@abo.fi', recipients, dedup_key = 'bid:' + str(bid.pk))
+        if updated == 0:
+            current.refresh_from_db()
+            continue
+        if publish:
+            caching.bump_auction_version(current.pk)
+            push.publish_auction(current)
+            if extended:
+                scheduler.deadline_changed(current.pk, deadline)
+        return bid, previous_bidder
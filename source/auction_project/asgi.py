@@ -0,0 +1,21 @@
+"""
+ASGI config for auction_project project.
+
+It exposes the application streaming auction updates to watching clients and serving the browse and auction detail
+APIs as a module-level variable named ``application``. Serve it with an ASGI server next to the WSGI application and
+route /events/, /auctions/ and /auctions/<id>/ to it, e.g.
+
+    uvicorn auction_project.asgi:application
+"""
+
+import os
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "auction_project.settings")
+django.setup()
+
+from auction import push
+from auction.async_api import application
+
+push.check_broker()
@@ -31,6 +31,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'auction.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',
@@ -38,6 +39,8 @@ MIDDLEWARE = [
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.auth.middleware.RemoteUserMiddleware',
+    'auction.routers.ReplicaMiddleware',
+    'auction.throttling.ThrottleMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -71,10 +74,28 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'TEST': {
+            # A file rather than shared-cache memory, so that concurrent test connections wait for locks
+            'NAME': os.path.join(BASE_DIR, 'test_db.sqlite3'),
+        },
     }
 }
 
 
+# Read replicas of the default database, as aliases of DATABASES. Replica-backed pages read from them, and users who
+# have written something read from the default database for REPLICA_PIN_SECONDS afterwards. See auction/routers.py.
+
+DATABASE_ROUTERS = ['auction.routers.ReplicaRouter']
+DATABASE_REPLICAS = []
+REPLICA_PIN_SECONDS = 15
+
+# Pragmas run on every new SQLite connection, and whether persistent connections are checked before each request.
+# See auction/database.py and settings_production.py.
+
+SQLITE_PRAGMAS = {}
+DATABASE_HEALTH_CHECKS = False
+
+
 # Password validation
 # https://docs.djangoproject.com/en/1.11/ref/settings/#auth-password-validators
 
@@ -123,6 +144,13 @@ ABSOLUTE_URL_OVERRIDES = {
 
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
+# Outbox of the sendnotifications command. Failed mails are retried with exponential backoff, delays are in seconds.
+
+NOTIFICATION_MAX_ATTEMPTS = 8
+NOTIFICATION_RETRY_DELAY = 30
+NOTIFICATION_MAX_RETRY_DELAY = 60 * 60
+NOTIFICATION_LEASE = 5 * 60
+
 LOCALE_PATHS = [
     'locale',
 ]
@@ -130,4 +158,121 @@ LOCALE_PATHS = [
 LANGUAGES = (
     ('en', _('English')),
     ('sv', _('Swedish')),
-)
\ No newline at end of file
+)
+
+# Currency rates shown on the auction detail page. They are kept in the default cache, which has to be shared between
+# processes for the refreshrates command to reach the web servers, and each process also keeps the last table it saw
+# in case the cache evicts it. The TTL is in seconds.
+
+CURRENCY_RATES = {
+    'BACKEND': 'auction.rates.OpenExchangeRatesBackend',
+    'OPTIONS': {
+        'url': 'https://openexchangerates.org/api/latest.json?app_id=52a1bd80785b4cc7896a137d206b5ce0',
+    },
+    'TTL': 60 * 60,
+}
+
+
+# Largest number of results returned by a search.
+
+SEARCH_RESULT_LIMIT = 100
+
+
+# Default and largest number of auctions per page of the browse API.
+
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 500
+
+
+# Number of auctions per page of the home page, and seconds a rendered page is cached. Bids can change the order by
+# price or deadline, which shows once the cached page expires.
+
+AUCTION_LIST_PAGE_SIZE = 50
+AUCTION_LIST_CACHE_TIMEOUT = 60
+
+
+# Seconds the auction part of a detail page is cached. Changes to the auction replace it before that.
+
+AUCTION_DETAIL_CACHE_TIMEOUT = 60 * 60
+
+# Longest time pages are cached for when the default cache is the local memory cache, which other processes cannot
+# invalidate. See auction/caching.py.
+
+LOCAL_CACHE_TIMEOUT = 5
+
+
+# Seconds a verified API token is remembered by a process, and the most tokens remembered at once.
+
+API_TOKEN_CACHE_TTL = 30
+API_TOKEN_CACHE_SIZE = 10000
+
+
+# Most bids accepted in one batch request.
+
+BID_BATCH_MAX_SIZE = 100
+
+
+# Queued bidding through the bid API, see auction/sequencer.py. When enabled, bids are answered with 202 and placed
+# by the runsequencer command, one process per shard. BATCH_SIZE bids are placed per transaction, and an idle
+# sequencer looks for new bids every POLL seconds.
+
+BID_QUEUE = {
+    'ENABLED': False,
+    'SHARDS': 1,
+    'BATCH_SIZE': 100,
+    'POLL': 0.05,
+}
+
+
+# Asynchronous read API served by the ASGI application, see auction/async_api.py. DB_THREADS threads per process run
+# its database work, and bound the connections it opens.
+
+ASYNC_API = {
+    'DB_THREADS': 8,
+}
+
+
+# Rate limits and load shedding of the API, see auction/throttling.py. RATES gives the (rate per second, burst) of
+# each client's bucket, by endpoint class and by user or IP address; for logins the user is the username tried. Reads
+# are turned away with 503 once the estimated latency of the API passes SHED_LATENCY seconds, writes once it passes
+# twice that. Behind reverse proxies, CLIENT_IP_HEADER names the request.META key of the header they put the client
+# address in, such as HTTP_X_FORWARDED_FOR, and TRUSTED_PROXIES how many of them append to it.
+
+THROTTLE = {
+    'ENABLED': False,
+    'RATES': {
+        'read': {'USER': (10, 50), 'IP': (20, 100)},
+        'write': {'USER': (2, 10), 'IP': (5, 20)},
+        'login': {'USER': (0.1, 5), 'IP': (0.5, 10)},
+    },
+    'SHED_LATENCY': 1.0,
+    'SHED_RETRY_AFTER': 5,
+    'CLIENT_IP_HEADER': None,
+    'TRUSTED_PROXIES': 1,
+}
+
+
+# Push of auction updates to watching clients. Bids are placed by the WSGI workers and commands, and the clients are
+# served by the ASGI application, so the broker has to carry updates between processes. The UDP broker sends them to
+# every address in peers, and the process serving the clients listens on bind; with several ASGI processes, give
+# each its own bind address and list them all as peers. KEEPALIVE is in seconds.
+
+PUSH = {
+    'BROKER': 'auction.push.UDPBroker',
+    'OPTIONS': {
+        'peers': [('127.0.0.1', 8765)],
+        'bind': ('127.0.0.1', 8765),
+    },
+    'KEEPALIVE': 15,
+    'MAX_AUCTIONS': 100,
+}
+
+
+# Request metrics served at /metrics/ to the addresses in ALLOWED_IPS and to staff. Requests making more queries than
+# QUERY_BUDGET or taking longer than LATENCY_BUDGET seconds are logged as warnings; None turns the check off.
+
+METRICS = {
+    'ALLOWED_IPS': ['127.0.0.1'],
+    'QUERY_BUDGET': None,
+    'LATENCY_BUDGET': None,
+}
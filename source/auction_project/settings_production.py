@@ -0,0 +1,95 @@
+import os
+
+from .settings import *
+
+
+# Production settings, used with DJANGO_SETTINGS_MODULE=auction_project.settings_production. Secrets and the database
+# come from the environment:
+#
+#   AUCTION_SECRET_KEY       secret key, required
+#   AUCTION_ALLOWED_HOSTS    comma separated host names
+#   AUCTION_DB_ENGINE        sqlite (default) or postgresql
+#   AUCTION_DB_NAME          database name, or the path of the SQLite file
+#   AUCTION_DB_USER, AUCTION_DB_PASSWORD, AUCTION_DB_HOST, AUCTION_DB_PORT
+#                            PostgreSQL connection, see https://www.postgresql.org/docs/current/libpq-envars.html for
+#                            the defaults of the ones left out
+#   AUCTION_CACHE_LOCATION   comma separated memcached servers, 127.0.0.1:11211 by default
+#   AUCTION_CLIENT_IP_HEADER request.META key of the client address set by the reverse proxy, HTTP_X_FORWARDED_FOR by
+#                            default, or empty when clients connect directly
+#
+# The test suite runs against the PostgreSQL configuration with the same variables and
+#   python manage.py test --settings auction_project.settings_production
+
+DEBUG = False
+
+SECRET_KEY = os.environ['AUCTION_SECRET_KEY']
+
+ALLOWED_HOSTS = os.environ.get('AUCTION_ALLOWED_HOSTS', 'pengstro.pythonanywhere.com').split(',')
+
+
+# Connections are kept open between requests for CONN_MAX_AGE seconds instead of being opened for every request, and
+# checked before each request, see auction/database.py. Each thread of the server holds its own connection, so a
+# PostgreSQL server needs max_connections above the total number of server threads, or a pooler such as PgBouncer in
+# transaction mode in between.
+
+if os.environ.get('AUCTION_DB_ENGINE', 'sqlite') == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('AUCTION_DB_NAME', 'auction'),
+            'USER': os.environ.get('AUCTION_DB_USER', ''),
+            'PASSWORD': os.environ.get('AUCTION_DB_PASSWORD', ''),
+            'HOST': os.environ.get('AUCTION_DB_HOST', ''),
+            'PORT': os.environ.get('AUCTION_DB_PORT', ''),
+            'CONN_MAX_AGE': 600,
+            'OPTIONS': {
+                'connect_timeout': 5,
+            },
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('AUCTION_DB_NAME', os.path.join(BASE_DIR, 'db.sqlite3')),
+            'CONN_MAX_AGE': 600,
+            'TEST': {
+                'NAME': os.path.join(BASE_DIR, 'test_db.sqlite3'),
+            },
+        }
+    }
+
+DATABASE_HEALTH_CHECKS = True
+
+
+# Cache shared by every process of the site: the web servers, the ASGI application and the commands. Page cache
+# versions, the currency rates, rate limit buckets and the lock of the rate refresh only work across processes
+# through it. Needs python-memcached.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': os.environ.get('AUCTION_CACHE_LOCATION', '127.0.0.1:11211').split(','),
+        'KEY_PREFIX': 'auction',
+    }
+}
+
+
+# WAL lets reads go on while a bid is being written, and with synchronous = NORMAL a commit only waits for the log,
+# which loses no committed data on a crash of the server process. Writers wait up to busy_timeout milliseconds for
+# each other. The cache and memory map sizes are in kibibytes and bytes.
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 20000,
+    'cache_size': -64000,
+    'temp_store': 'MEMORY',
+    'mmap_size': 256 * 1024 * 1024,
+}
+
+
+# Rate limits of the API, kept in the shared cache so that they hold across the server processes. The site runs behind
+# a reverse proxy, so clients are told apart by the address it forwards.
+
+THROTTLE = dict(THROTTLE, ENABLED = True, CLIENT_IP_HEADER = os.environ.get('AUCTION_CLIENT_IP_HEADER', 'HTTP_X_FORWARDED_FOR') or None)
@@ -8,6 +8,13 @@ urlpatterns = [
     url(r'^(?P<pk>[0-9]+)/$', views.AuctionDetailView.as_view(), name='detail'),
     url(r'^auctions/', include('auction.urls')),
     url(r'^bids/$', views.BidAPIView.as_view(), name = 'bid_api'),
+    url(r'^bids/batch/$', views.BidBatchAPIView.as_view(), name = 'bid_batch_api'),
     url(r'^bids/(?P<pk>[0-9]+)/$', views.BidDetailAPIView.as_view(), name = 'bid_detail_api'),
+    url(r'^bids/queued/(?P<pk>[0-9]+)/$', views.QueuedBidDetailAPIView.as_view(), name = 'queued_bid_detail_api'),
+    url(r'^proxybids/$', views.ProxyBidAPIView.as_view(), name = 'proxy_bid_api'),
+    url(r'^proxybids/(?P<pk>[0-9]+)/$', views.ProxyBidDetailAPIView.as_view(), name = 'proxy_bid_detail_api'),
+    url(r'^tokens/$', views.TokenAPIView.as_view(), name = 'token_api'),
+    url(r'^tokens/(?P<pk>[0-9]+)/$', views.TokenDetailAPIView.as_view(), name = 'token_detail_api'),
+    url(r'^metrics/$', views.MetricsView.as_view(), name = 'metrics'),
     url(r'^admin/', admin.site.urls),
 ]
\ No newline at end of file